@@ -0,0 +1,209 @@
+"""
+Склейка мутирующих вызовов Direct API в пакеты (micro-batching)
+
+Direct API принимает до 1000 объектов за вызов, а баллы списываются
+за вызов + за объект. Одновременные add/update/moderate одного сервиса
+собираются в течение нескольких миллисекунд (или до лимита объектов)
+и уходят одним запросом; каждый вызывающий получает свою часть
+AddResults/UpdateResults/ModerateResults, включая ошибки по объектам.
+
+Лимит объектов в пакете - свой у метода (campaigns.add/update - 10).
+Если Директ отклонил пакет целиком (ошибка запроса, а не объектов - значит,
+ничего не выполнено), объекты каждого вызывающего переотправляются
+отдельно: чужой некорректный объект не роняет остальные вызовы.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from app import deadline as request_deadline
+from app.retry_policy import FATAL, classify
+
+logger = logging.getLogger(__name__)
+
+# Включение по умолчанию для DirectAPIClient (opt-in)
+BATCHING_ENABLED = os.getenv("DIRECT_BATCHING", "false").lower() in ("1", "true", "yes")
+BATCH_WINDOW_MS = float(os.getenv("DIRECT_BATCH_WINDOW_MS", "20"))
+# Лимит объектов в пакете для методов, которых нет в METHOD_MAX_OBJECTS
+BATCH_MAX_OBJECTS = int(os.getenv("DIRECT_BATCH_MAX_OBJECTS", "1000"))
+# Коалесер аккаунта без вызовов дольше этого выселяется (сек)
+BATCH_IDLE_TTL = float(os.getenv("DIRECT_BATCH_IDLE_TTL", "3600"))
+# Как часто просматривать коалесеры на простаивающие (сек)
+BATCH_SWEEP_INTERVAL = 60.0
+
+# Лимиты Direct API на объекты в одном вызове
+METHOD_MAX_OBJECTS: Dict[Tuple[str, str], int] = {
+    ("campaigns", "add"): 10,
+    ("campaigns", "update"): 10,
+    ("ads", "moderate"): 10000,
+}
+
+CallFn = Callable[[str, str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+BuildParamsFn = Callable[[List[Any]], Dict[str, Any]]
+
+
+class _PendingBatch:
+    """
+    Накапливаемый пакет одного service.method. Уходит через call первого
+    вызывающего: все клиенты коалесера - один аккаунт
+    """
+    __slots__ = ("call", "results_key", "build_params", "items", "waiters", "timer")
+
+    def __init__(self, call: CallFn, results_key: str, build_params: BuildParamsFn):
+        self.call = call
+        self.results_key = results_key
+        self.build_params = build_params
+        self.items: List[Any] = []
+        # (future, смещение в items, количество объектов)
+        self.waiters: List[Tuple[asyncio.Future, int, int]] = []
+        self.timer = None
+
+
+class BatchCoalescer:
+    """
+    Коалесер одного аккаунта. Вызов Direct API (call) передаётся с каждым
+    submit: коалесер не держит ссылку на клиента дольше пакета
+    """
+
+    def __init__(
+        self,
+        window_ms: float = BATCH_WINDOW_MS,
+        max_objects: int = BATCH_MAX_OBJECTS
+    ):
+        self.window = window_ms / 1000
+        self.max_objects = max_objects
+        self._pending: Dict[Tuple[str, str], _PendingBatch] = {}
+        self._sending: set = set()
+        self.last_used = time.monotonic()
+
+    @property
+    def idle(self) -> bool:
+        return not self._pending and not self._sending
+
+    async def submit(
+        self,
+        call: CallFn,
+        service: str,
+        method: str,
+        items: List[Any],
+        results_key: str,
+        build_params: BuildParamsFn
+    ) -> List[Dict]:
+        """
+        Добавить объекты в пакет и дождаться своих результатов
+        (по одному результату на объект, в том же порядке)
+        """
+        self.last_used = time.monotonic()
+        key = (service, method)
+        limit = self.limit(key)
+        if len(items) >= limit:
+            result = await call(service, method, build_params(items))
+            return result.get(results_key, [])
+
+        loop = asyncio.get_running_loop()
+
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.items) + len(items) > limit:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = _PendingBatch(call, results_key, build_params)
+            batch.timer = loop.call_later(self.window, self._flush, key)
+            self._pending[key] = batch
+
+        future = loop.create_future()
+        batch.waiters.append((future, len(batch.items), len(items)))
+        batch.items.extend(items)
+
+        if len(batch.items) >= limit:
+            self._flush(key)
+
+        return await future
+
+    def limit(self, key: Tuple[str, str]) -> int:
+        """Сколько объектов метода помещается в один вызов"""
+        return METHOD_MAX_OBJECTS.get(key, self.max_objects)
+
+    def _flush(self, key: Tuple[str, str]):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        # Пакет общий для нескольких запросов - срок ни одного из них не действует
+        task = request_deadline.detached(self._send(key, batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, key: Tuple[str, str], batch: _PendingBatch):
+        service, method = key
+        logger.debug(f"batch {service}.{method}: {len(batch.items)} objects, {len(batch.waiters)} callers")
+
+        try:
+            result = await batch.call(service, method, batch.build_params(batch.items))
+        except Exception as e:
+            if len(batch.waiters) > 1 and self._rejected(e):
+                logger.info(f"batch {service}.{method} rejected ({e}), sending callers separately")
+                await asyncio.gather(*(
+                    self._send_one(key, batch, future, start, count)
+                    for future, start, count in batch.waiters
+                ))
+                return
+            for future, _, _ in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        results = result.get(batch.results_key, [])
+        for future, start, count in batch.waiters:
+            if not future.done():
+                future.set_result(results[start:start + count])
+
+    @staticmethod
+    def _rejected(error: BaseException) -> bool:
+        """Директ ответил ошибкой на весь запрос - ни один объект не выполнен"""
+        return classify(error) == FATAL and bool(getattr(error, "code", 0))
+
+    async def _send_one(
+        self,
+        key: Tuple[str, str],
+        batch: _PendingBatch,
+        future: asyncio.Future,
+        start: int,
+        count: int
+    ):
+        service, method = key
+        try:
+            result = await batch.call(service, method, batch.build_params(batch.items[start:start + count]))
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result.get(batch.results_key, []))
+
+
+_coalescers: Dict[str, BatchCoalescer] = {}
+_last_sweep = time.monotonic()
+
+
+def get_coalescer(key: str) -> BatchCoalescer:
+    """Получить коалесер аккаунта (один на процесс)"""
+    now = time.monotonic()
+    if now - _last_sweep > BATCH_SWEEP_INTERVAL:
+        _sweep(now)
+    coalescer = _coalescers.get(key)
+    if coalescer is None:
+        coalescer = BatchCoalescer()
+        _coalescers[key] = coalescer
+    return coalescer
+
+
+def _sweep(now: float):
+    """Выселить коалесеры без вызовов дольше BATCH_IDLE_TTL"""
+    global _last_sweep
+    _last_sweep = now
+    for key, coalescer in list(_coalescers.items()):
+        if coalescer.idle and now - coalescer.last_used > BATCH_IDLE_TTL:
+            del _coalescers[key]
@@ -0,0 +1,255 @@
+"""
+Read-through кэш объектов Директа (LRU + TTL) с инвалидацией при записи
+
+Ключ чтения включает "поколения" (generation counters) аккаунта:
+- G   - поколение сервиса целиком (campaigns, ads, ...);
+- P:x - поколение родителя (ads группы x, adgroups кампании x);
+- U   - поколение "чтений без родителя" (все кампании аккаунта).
+Мутация увеличивает нужные поколения, и старые ключи просто перестают
+читаться (read-your-writes без удаления по префиксу).
+
+Бэкенд подключаемый: по умолчанию память процесса,
+DIRECT_CACHE_URL=redis://... - общий кэш для всех uvicorn воркеров (нужен пакет redis).
+В памяти процесса объекты get-ответа хранятся моделями app/domain.py
+(в разы компактнее вложенных dict), в Redis - JSON объектов как в API.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.domain import MODELS
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("DIRECT_CACHE", "true").lower() in ("1", "true", "yes")
+CACHE_TTL = float(os.getenv("DIRECT_CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("DIRECT_CACHE_MAX_ENTRIES", "5000"))
+CACHE_URL = os.getenv("DIRECT_CACHE_URL", "")
+
+# Сервис -> (поле родителя в SelectionCriteria, поле родителя в объекте, ключ массива объектов)
+CACHED_SERVICES: Dict[str, Tuple[Optional[str], Optional[str], str]] = {
+    "campaigns": (None, None, "Campaigns"),
+    "adgroups": ("CampaignIds", "CampaignId", "AdGroups"),
+    "ads": ("AdGroupIds", "AdGroupId", "Ads"),
+    "keywords": ("AdGroupIds", "AdGroupId", "Keywords"),
+    "bidmodifiers": ("CampaignIds", "CampaignId", "BidModifiers"),
+}
+
+
+# =========== BACKENDS ===========
+
+class CacheBackend:
+    """Интерфейс бэкенда кэша"""
+
+    # Хранит объекты Python как есть (можно класть модели)
+    compact = False
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Кэш в памяти процесса: LRU по количеству записей + TTL
+    """
+
+    compact = True
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        return [self._counters.get(key, 0) for key in keys]
+
+    async def incr(self, key: str) -> int:
+        value = self._counters.get(key, 0) + 1
+        self._counters[key] = value
+        return value
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общий кэш в Redis (значения в JSON)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self._redis.set(key, json.dumps(value, ensure_ascii=False), px=int(ttl * 1000))
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        values = await self._redis.mget(keys)
+        return [int(v) if v is not None else 0 for v in values]
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+
+def _create_backend() -> CacheBackend:
+    if CACHE_URL.startswith("redis"):
+        try:
+            return RedisCacheBackend(CACHE_URL)
+        except ImportError:
+            logger.warning("redis package not installed, using in-memory Direct cache")
+    return MemoryCacheBackend()
+
+
+# =========== CACHE ===========
+
+class _CompactResult:
+    """get-ответ, объекты массива которого хранятся моделями"""
+    __slots__ = ("items_key", "models", "rest")
+
+    def __init__(self, items_key: str, models: List[Any], rest: Dict[str, Any]):
+        self.items_key = items_key
+        self.models = models
+        self.rest = rest
+
+    def expand(self) -> Dict[str, Any]:
+        return {**self.rest, self.items_key: [model.to_get() for model in self.models]}
+
+
+def _compact(service: str, result: Dict[str, Any]) -> Any:
+    """Сжать объекты ответа в модели (если модель сохраняет все их поля)"""
+    items_key = CACHED_SERVICES[service][2]
+    items = result.get(items_key)
+    if not items:
+        return result
+    models = MODELS[service].decode_exact(items)
+    if models is None:
+        return result
+    rest = {key: value for key, value in result.items() if key != items_key}
+    return _CompactResult(items_key, models, rest)
+
+
+class DirectCache:
+    """
+    Read-through кэш get-вызовов с инвалидацией по поколениям
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _gen_key(account: str, service: str, scope: str) -> str:
+        return f"direct:gen:{account}:{service}:{scope}"
+
+    @staticmethod
+    def _read_parents(service: str, params: Dict[str, Any]) -> List[Any]:
+        criteria_field = CACHED_SERVICES[service][0]
+        if not criteria_field:
+            return []
+        return list(params.get("SelectionCriteria", {}).get(criteria_field) or [])
+
+    @staticmethod
+    def _mutation_parents(service: str, params: Dict[str, Any]) -> Optional[List[Any]]:
+        """Родители изменяемых объектов; None - неизвестны (update/moderate по Id)"""
+        _, object_field, items_key = CACHED_SERVICES[service]
+        items = params.get(items_key)
+        if not object_field or not items:
+            return None
+        parents = [item.get(object_field) for item in items]
+        if any(parent is None for parent in parents):
+            return None
+        return sorted(set(parents))
+
+    async def _read_key(self, account: str, service: str, params: Dict[str, Any]) -> str:
+        parents = self._read_parents(service, params)
+        scopes = ["G"] + ([f"P:{p}" for p in parents] if parents else ["U"])
+        gens = await self.backend.get_counters(
+            [self._gen_key(account, service, scope) for scope in scopes]
+        )
+        canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+        gen_part = ".".join(str(g) for g in gens)
+        return f"direct:obj:{account}:{service}:{gen_part}:{digest}"
+
+    async def get_or_load(
+        self,
+        account: str,
+        service: str,
+        params: Dict[str, Any],
+        loader: Callable[[], Awaitable[Dict[str, Any]]],
+        ttl: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Вернуть результат из кэша или загрузить и сохранить"""
+        key = await self._read_key(account, service, params)
+        cached = await self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached.expand() if isinstance(cached, _CompactResult) else cached
+
+        self.misses += 1
+        result = await loader()
+        value = _compact(service, result) if self.backend.compact else result
+        await self.backend.set(key, value, ttl or self.ttl)
+        return result
+
+    async def invalidate(self, account: str, service: str, parents: Optional[Iterable[Any]] = None):
+        """
+        Сбросить кэш сервиса аккаунта.
+        parents - только чтения этих родителей (и чтения без родителя),
+        None - весь сервис.
+        """
+        if parents is None:
+            await self.backend.incr(self._gen_key(account, service, "G"))
+            return
+        for parent in parents:
+            await self.backend.incr(self._gen_key(account, service, f"P:{parent}"))
+        await self.backend.incr(self._gen_key(account, service, "U"))
+
+    async def invalidate_mutation(self, account: str, service: str, params: Dict[str, Any]):
+        """Инвалидация после мутирующего вызова service с params"""
+        await self.invalidate(account, service, self._mutation_parents(service, params))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Один экземпляр на процесс
+direct_cache = DirectCache(_create_backend())
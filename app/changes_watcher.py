@@ -0,0 +1,185 @@
+"""
+Инкрементальная инвалидация кэша через сервис changes Директа
+
+Фоновая задача для каждого активного аккаунта периодически вызывает
+changes.checkCampaigns (и changes.check для кампаний с изменениями внутри)
+с Timestamp прошлой проверки и сбрасывает в кэше только изменившиеся
+кампании, группы и объявления. Пока аккаунт отслеживается, кэш может
+держать его объекты с длинным TTL.
+
+Неудачная проверка Timestamp не сдвигает: следующая повторит её с того же
+места, и изменения за время сбоя не потеряются. После
+DIRECT_CHANGES_MAX_FAILURES сбоев подряд кэш аккаунта сбрасывается целиком
+и аккаунт возвращается к обычному TTL до новой checkDictionaries.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.cache import direct_cache, CACHED_SERVICES
+
+logger = logging.getLogger(__name__)
+
+# Интервал опроса changes (сек), 0 - выключено
+CHANGES_POLL_INTERVAL = float(os.getenv("DIRECT_CHANGES_POLL_INTERVAL", "60"))
+# Аккаунт перестаёт отслеживаться после стольких секунд без обращений
+CHANGES_IDLE_TTL = float(os.getenv("DIRECT_CHANGES_IDLE_TTL", "1800"))
+# TTL кэша для отслеживаемых аккаунтов
+CACHE_TTL_WATCHED = float(os.getenv("DIRECT_CACHE_TTL_WATCHED", "900"))
+
+# Сбоев проверки подряд, после которых кэш аккаунта сбрасывается целиком
+CHANGES_MAX_FAILURES = int(os.getenv("DIRECT_CHANGES_MAX_FAILURES", "3"))
+
+# Лимит идентификаторов в одном changes.check
+CHECK_IDS_LIMIT = 3000
+
+
+class _TrackedAccount:
+    __slots__ = ("client", "timestamp", "last_used", "failures")
+
+    def __init__(self, client):
+        self.client = client
+        self.timestamp: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.failures = 0
+
+
+class ChangesWatcher:
+    """
+    Фоновый опрос changes по активным аккаунтам
+    """
+
+    def __init__(self, interval: float = CHANGES_POLL_INTERVAL):
+        self.interval = interval
+        self._accounts: Dict[str, _TrackedAccount] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def track(self, client):
+        """Отметить аккаунт клиента как активный"""
+        if not self.enabled:
+            return
+        tracked = self._accounts.get(client.account_key)
+        if tracked is None:
+            self._accounts[client.account_key] = _TrackedAccount(client)
+        else:
+            tracked.last_used = time.monotonic()
+
+    def cache_ttl(self, account_key: str) -> Optional[float]:
+        """
+        Длинный TTL, если по аккаунту уже есть Timestamp (изменения отслеживаются),
+        иначе None - обычный TTL кэша
+        """
+        tracked = self._accounts.get(account_key)
+        if tracked is not None and tracked.timestamp is not None:
+            return CACHE_TTL_WATCHED
+        return None
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Changes watcher started (interval={self.interval}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for key, tracked in list(self._accounts.items()):
+                if now - tracked.last_used > CHANGES_IDLE_TTL:
+                    del self._accounts[key]
+                    continue
+                try:
+                    await self.poll(key, tracked)
+                    tracked.failures = 0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Timestamp прежний - следующая проверка повторит эту
+                    tracked.failures += 1
+                    logger.warning(f"Changes check failed for {key} ({tracked.failures}): {e}")
+                    if tracked.failures >= CHANGES_MAX_FAILURES and tracked.timestamp is not None:
+                        try:
+                            await self._reset(key, tracked)
+                        except Exception as e:
+                            logger.warning(f"Cache reset failed for {key}: {e}")
+
+    async def _reset(self, key: str, tracked: _TrackedAccount):
+        """
+        Изменения с прошлого Timestamp так и не получены: сбросить кэш
+        аккаунта целиком и вернуться к обычному TTL
+        """
+        for service in CACHED_SERVICES:
+            await direct_cache.invalidate(key, service)
+        tracked.timestamp = None
+        tracked.failures = 0
+
+    async def poll(self, key: str, tracked: _TrackedAccount):
+        """Одна проверка изменений аккаунта"""
+        client = tracked.client
+
+        if tracked.timestamp is None:
+            result = await client._call("changes", "checkDictionaries", {})
+            tracked.timestamp = result.get("Timestamp")
+            return
+
+        result = await client._call("changes", "checkCampaigns", {
+            "Timestamp": tracked.timestamp
+        })
+        campaigns = result.get("Campaigns", [])
+
+        self_changed = [c["CampaignId"] for c in campaigns if "SELF" in c.get("ChangesIn", [])]
+        children_changed = [c["CampaignId"] for c in campaigns if "CHILDREN" in c.get("ChangesIn", [])]
+
+        if self_changed:
+            await direct_cache.invalidate(key, "campaigns")
+        if children_changed:
+            await direct_cache.invalidate(key, "adgroups", children_changed)
+            await direct_cache.invalidate(key, "bidmodifiers", children_changed)
+            await self._invalidate_children(client, key, children_changed, tracked.timestamp)
+
+        if campaigns:
+            logger.debug(f"Changes for {key}: self={len(self_changed)} children={len(children_changed)}")
+
+        tracked.timestamp = result.get("Timestamp", tracked.timestamp)
+
+    async def _invalidate_children(
+        self,
+        client,
+        key: str,
+        campaign_ids: List[int],
+        timestamp: str
+    ):
+        """Сбросить группы/объявления/фразы внутри изменившихся кампаний"""
+        for start in range(0, len(campaign_ids), CHECK_IDS_LIMIT):
+            result = await client._call("changes", "check", {
+                "CampaignIds": campaign_ids[start:start + CHECK_IDS_LIMIT],
+                "FieldNames": ["AdGroupIds", "AdIds"],
+                "Timestamp": timestamp
+            })
+            modified: Dict[str, Any] = result.get("Modified", {})
+
+            ad_group_ids = modified.get("AdGroupIds", [])
+            if ad_group_ids:
+                await direct_cache.invalidate(key, "ads", ad_group_ids)
+                await direct_cache.invalidate(key, "keywords", ad_group_ids)
+            # Группа изменённого объявления неизвестна - сбрасываем объявления аккаунта
+            if modified.get("AdIds"):
+                await direct_cache.invalidate(key, "ads")
+
+
+# Один экземпляр на процесс
+changes_watcher = ChangesWatcher()
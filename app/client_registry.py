@@ -0,0 +1,92 @@
+"""
+Реестр долгоживущих клиентов Direct API
+
+Раньше каждый AI-обработчик создавал DirectAPIClient(token) заново, и всё
+состояние клиента жило один запрос. Реестр отдаёт один и тот же объект на
+(отпечаток токена, Client-Login, sandbox, опции) между вызовами инструментов
+и выселяет клиенты, которыми долго не пользовались.
+
+Клиент не хранит состояния отдельного вызова, поэтому один объект можно
+одновременно использовать из нескольких запросов; get() синхронный
+(без await), так что два запроса не создадут два клиента на один ключ.
+"""
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.direct_client import DirectAPIClient
+
+logger = logging.getLogger(__name__)
+
+# Клиент выселяется после стольких секунд без обращений
+CLIENT_IDLE_TTL = float(os.getenv("DIRECT_CLIENT_IDLE_TTL", "900"))
+# Максимум клиентов в реестре (LRU)
+CLIENT_REGISTRY_MAX = int(os.getenv("DIRECT_CLIENT_REGISTRY_MAX", "500"))
+# Как часто просматривать реестр на простаивающие клиенты (сек)
+CLIENT_SWEEP_INTERVAL = 60.0
+
+
+class ClientRegistry:
+    """
+    Клиенты по аккаунтам с выселением по простою
+    """
+
+    def __init__(self, idle_ttl: float = CLIENT_IDLE_TTL, max_clients: int = CLIENT_REGISTRY_MAX):
+        self.idle_ttl = idle_ttl
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[Tuple, Tuple[DirectAPIClient, float]]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.evicted = 0
+
+    def get(
+        self,
+        token: str,
+        client_login: Optional[str] = None,
+        sandbox: bool = False,
+        batching: Optional[bool] = None,
+        cache: Optional[bool] = None
+    ) -> DirectAPIClient:
+        """Клиент аккаунта (создаётся при первом обращении)"""
+        now = time.monotonic()
+        if now - self._last_sweep > CLIENT_SWEEP_INTERVAL:
+            self._sweep(now)
+
+        key = (DirectAPIClient.make_account_key(token, client_login, sandbox), batching, cache)
+        entry = self._clients.get(key)
+        if entry is not None:
+            client = entry[0]
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            return client
+
+        client = DirectAPIClient(
+            token, sandbox=sandbox, client_login=client_login,
+            batching=batching, cache=cache
+        )
+        self._clients[key] = (client, now)
+        self.created += 1
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+            self.evicted += 1
+        return client
+
+    def _sweep(self, now: float):
+        self._last_sweep = now
+        for key, (_, last_used) in list(self._clients.items()):
+            if now - last_used > self.idle_ttl:
+                del self._clients[key]
+                self.evicted += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._clients),
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+# Один экземпляр на процесс
+client_registry = ClientRegistry()
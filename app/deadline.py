@@ -0,0 +1,113 @@
+"""
+Срок запроса (deadline), доступный всем вызовам внутри него
+
+DeadlineMiddleware при входе HTTP-запроса кладёт в contextvar момент, к
+которому ответ уже никому не нужен: из заголовка X-Request-Timeout (сек,
+его передаёт aihandler) или из умолчания эндпоинта. Дальше по цепочке
+роутер -> токен профиля из БД -> Direct API -> ожидание отчёта каждый шаг
+берёт только остаток срока:
+
+    timeout = deadline.clamp(120.0)          # таймаут HTTP-запроса
+    async with deadline.bound():             # ожидание (БД и т.п.)
+        ...
+
+Фоновая работа, переживающая запрос (опрос отчётов, пакеты мутаций),
+запускается через deadline.detached() - без срока запроса.
+"""
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Any, Coroutine, Dict, Optional
+
+DEADLINE_HEADER = b"x-request-timeout"
+
+# Срок по умолчанию и максимальный срок из заголовка (сек)
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("DIRECT_REQUEST_TIMEOUT", "120"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("DIRECT_REQUEST_TIMEOUT_MAX", "1800"))
+
+# Умолчания эндпоинтов с долгими отчётами
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "/ai/stats": 300,
+    "/ai/stats/campaigns": 300,
+    "/ai/stats/sections": 300,
+    "/ai/stats/queries": 600,
+    "/ai/stats/job": 300,
+    "/ai/mirror/sync": 900,
+}
+
+# time.monotonic(), к которому запрос должен завершиться; None - без срока
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def current() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Остаток срока (сек), None - срока нет"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def clamp(timeout: Optional[float]) -> Optional[float]:
+    """Таймаут шага, не выходящий за срок запроса"""
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, 0.0)
+    return left if timeout is None else min(timeout, left)
+
+
+@asynccontextmanager
+async def bound():
+    """Прервать блок asyncio.TimeoutError по истечении срока запроса"""
+    async with asyncio.timeout(clamp(None)):
+        yield
+
+
+def detached(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """Фоновая задача без срока текущего запроса"""
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return asyncio.create_task(coro, context=context)
+
+
+def request_timeout(path: str, header: Optional[bytes]) -> float:
+    """Срок запроса: из заголовка или умолчание эндпоинта"""
+    if header:
+        try:
+            seconds = float(header)
+            if seconds > 0:
+                return min(seconds, REQUEST_TIMEOUT_MAX)
+        except ValueError:
+            pass
+    return ENDPOINT_TIMEOUTS.get(path, REQUEST_TIMEOUT_DEFAULT)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware: срок запроса в contextvar на всё время его обработки,
+    включая отдачу StreamingResponse
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope.get("headers") or []).get(DEADLINE_HEADER)
+        seconds = request_timeout(scope.get("path", ""), header)
+        token = _deadline.set(time.monotonic() + seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
@@ -5,8 +5,21 @@
 import httpx
 import json
 import base64
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from app.http_pool import get_http_client
+from app.rate_limiter import AccountLimiter, get_limiter
+from app import deadline as request_deadline
+from app.retry_policy import RetryState, circuit_breakers, classify
+from app.batching import get_coalescer, BATCHING_ENABLED
+from app.singleflight import singleflight, make_key, READ_METHODS
+from app.cache import direct_cache, CACHED_SERVICES, CACHE_ENABLED
+from app.changes_watcher import changes_watcher
+from app.json_codec import codec, ArrayItemStream
+from app.domain import MODELS
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +33,29 @@ class DirectAPIError(Exception):
         super().__init__(f"[{code}] {message}: {details}")
 
 
+class DirectHTTPError(DirectAPIError):
+    """Ответ без JSON-тела API (5xx балансера, HTML-страница ошибки)"""
+    def __init__(self, status: int, details: str = ""):
+        self.status = status
+        super().__init__(0, f"HTTP {status}", details)
+
+
+class CircuitOpenError(DirectAPIError):
+    """Эндпоинт отключён размыкателем - Директ недавно не отвечал"""
+    def __init__(self, service: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            0, "Директ временно недоступен",
+            f"{service}: запросы приостановлены, повтор через {retry_after:.0f} с"
+        )
+
+
+class DeadlineExceeded(DirectAPIError):
+    """Срок запроса (app/deadline.py) истёк - вызывающий больше не ждёт"""
+    def __init__(self, service: str, method: str):
+        super().__init__(0, "Время запроса истекло", f"{service}.{method}")
+
+
 class DirectAPIClient:
     """
     Async клиент для Яндекс Директ API v5
@@ -29,25 +65,74 @@ class DirectAPIClient:
     SANDBOX_URL = "https://api-sandbox.direct.yandex.com/json/v5"
     REPORTS_URL = "https://api.direct.yandex.com/json/v5/reports"
     
-    def __init__(self, token: str, sandbox: bool = False):
+    # Максимальный размер страницы get-методов
+    PAGE_LIMIT = 10000
+    # Лимит Ids в SelectionCriteria campaigns.get
+    CAMPAIGN_IDS_LIMIT = 1000
+    
+    # Поля get-методов (общие для клиента и зеркала app/mirror.py)
+    CAMPAIGN_FIELDS = [
+        "Id", "Name", "State", "Status", "Type",
+        "StartDate", "DailyBudget", "Statistics"
+    ]
+    AD_GROUP_FIELDS = ["Id", "Name", "CampaignId", "Status", "RegionIds"]
+    AD_FIELDS = ["Id", "AdGroupId", "CampaignId", "Status", "State", "Type"]
+    TEXT_AD_FIELDS = ["Title", "Title2", "Text", "Href", "DisplayUrlPath"]
+    KEYWORD_FIELDS = ["Id", "Keyword", "AdGroupId", "CampaignId", "Status", "State"]
+    
+    def __init__(
+        self,
+        token: str,
+        sandbox: bool = False,
+        client_login: Optional[str] = None,
+        batching: Optional[bool] = None,
+        cache: Optional[bool] = None
+    ):
         self.token = token
         self.base_url = self.SANDBOX_URL if sandbox else self.BASE_URL
         self.sandbox = sandbox
+        self.client_login = client_login
+        self._account_key = self.make_account_key(token, client_login, sandbox)
+        # Склейка add/update/moderate в пакеты (opt-in, по умолчанию из env)
+        self.batching = BATCHING_ENABLED if batching is None else batching
+        # Read-through кэш get-вызовов (инвалидация при мутациях этого процесса)
+        self.cache = CACHE_ENABLED if cache is None else cache
     
+    @staticmethod
+    def make_account_key(token: str, client_login: Optional[str] = None, sandbox: bool = False) -> str:
+        """Ключ аккаунта: отпечаток токена + Client-Login (без самого токена)"""
+        fingerprint = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        key = f"{fingerprint}:{client_login or '-'}"
+        if sandbox:
+            key += ":sandbox"
+        return key
+    
+    @property
+    def account_key(self) -> str:
+        return self._account_key
+
+    @property
+    def limiter(self) -> AccountLimiter:
+        # Не кэшируется в клиенте: простаивающие лимитеры выселяются
+        return get_limiter(self.account_key)
+
     def _headers(self) -> Dict[str, str]:
         """Заголовки для запросов"""
-        return {
+        headers = {
             "Authorization": f"Bearer {self.token}",
             "Accept-Language": "ru",
             "Content-Type": "application/json; charset=utf-8",
         }
+        if self.client_login:
+            headers["Client-Login"] = self.client_login
+        return headers
     
-    def _reports_headers(self) -> Dict[str, str]:
+    def _reports_headers(self, processing_mode: str = "auto") -> Dict[str, str]:
         """Заголовки для Reports API"""
         headers = self._headers()
         headers.update({
-            "processingMode": "auto",
-            "returnMoneyInMicros": "false",
+            "processingMode": processing_mode,
+            "returnMoneyInMicros": "true",
             "skipReportHeader": "true",
             "skipReportSummary": "true"
         })
@@ -62,38 +147,290 @@ class DirectAPIClient:
     ) -> Dict[str, Any]:
         """
         Базовый вызов API
+        Одинаковые одновременные read-вызовы склеиваются (singleflight),
+        get по объектам читается через кэш, мутации его инвалидируют
         """
-        url = f"{self.base_url}/{service}"
-        body = {"method": method, "params": params}
+        cached_service = self.cache and service in CACHED_SERVICES
         
-        logger.debug(f"→ {service}.{method}")
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                headers=self._headers(),
-                json=body,
-                timeout=timeout
-            )
+        if method in READ_METHODS:
+            key = make_key(self.account_key, service, method, params)
             
-            result = response.json()
+            async def load():
+                try:
+                    return await singleflight.do(
+                        key, lambda: self._request(service, method, params, timeout)
+                    )
+                except asyncio.TimeoutError:
+                    # Общий вызов ещё идёт, но этот запрос ждать больше не может
+                    raise DeadlineExceeded(service, method) from None
             
-            if "error" in result:
-                err = result["error"]
-                raise DirectAPIError(
-                    code=err.get("error_code", 0),
-                    message=err.get("error_string", "Unknown error"),
-                    details=err.get("error_detail", "")
+            if cached_service and method == "get":
+                changes_watcher.track(self)
+                return await direct_cache.get_or_load(
+                    self.account_key, service, params, load,
+                    ttl=changes_watcher.cache_ttl(self.account_key)
                 )
+            return await load()
+        
+        try:
+            return await self._request(service, method, params, timeout)
+        finally:
+            # Даже при ошибке сети изменения могли примениться
+            if cached_service:
+                await direct_cache.invalidate_mutation(self.account_key, service, params)
+    
+    async def _request(
+        self,
+        service: str,
+        method: str,
+        params: Dict[str, Any],
+        timeout: float = 120.0
+    ) -> Dict[str, Any]:
+        """
+        HTTP запрос к API (с лимитером, повторами и размыкателем, app/retry_policy.py)
+        """
+        url = f"{self.base_url}/{service}"
+        body = codec.dumps({"method": method, "params": params})
+        
+        logger.debug(f"→ {service}.{method}")
+        
+        client = get_http_client()
+        breaker = circuit_breakers.get(self.base_url, service)
+        retry = RetryState(method)
+        
+        while True:
+            if request_deadline.expired():
+                raise DeadlineExceeded(service, method)
+            if not breaker.allow():
+                raise CircuitOpenError(service, breaker.retry_after())
+            try:
+                async with self.limiter.slot():
+                    response = await client.post(
+                        url,
+                        headers=self._headers(),
+                        content=body,
+                        timeout=retry.timeout(timeout)
+                    )
+                self.limiter.update_units(response.headers.get("Units"))
+                result = self._parse_response(response)
+            except asyncio.TimeoutError:
+                # Баллов или слота лимитера не дождались до срока запроса
+                raise DeadlineExceeded(service, method) from None
+            except (httpx.TransportError, DirectAPIError) as error:
+                kind = classify(error)
+                breaker.record(kind)
+                delay = retry.next_delay(error, kind, self.limiter)
+                if delay is None:
+                    if request_deadline.expired():
+                        raise DeadlineExceeded(service, method) from error
+                    raise
+                logger.warning(f"{service}.{method} failed ({kind}: {error}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
             
+            breaker.record(None)
             logger.debug(f"← OK")
             return result.get("result", {})
     
-    def _check_add_result(self, result: Dict, entity_name: str = "объект") -> Any:
-        """Проверяет результат add-метода"""
-        add_results = result.get("AddResults", [])
+    def _parse_response(self, response: httpx.Response) -> Dict[str, Any]:
+        """Тело ответа; ошибки API и HTTP - исключениями"""
+        if response.status_code >= 500:
+            raise DirectHTTPError(response.status_code, response.text[:200])
+        try:
+            result = codec.loads(response.content)
+        except ValueError:
+            raise DirectHTTPError(response.status_code, response.text[:200])
+        if "error" in result:
+            raise self._api_error(result["error"])
+        return result
+    
+    @staticmethod
+    def _api_error(err: Dict[str, Any]) -> DirectAPIError:
+        return DirectAPIError(
+            code=int(err.get("error_code", 0)),
+            message=err.get("error_string", "Unknown error"),
+            details=err.get("error_detail", "")
+        )
+    
+    async def _stream_request(
+        self,
+        service: str,
+        method: str,
+        params: Dict[str, Any],
+        result_key: str,
+        state: Dict[str, Any],
+        timeout: float = 120.0
+    ) -> AsyncIterator[Dict]:
+        """
+        get с инкрементальным разбором ответа: элементы result[result_key]
+        отдаются по мере прихода, LimitedBy кладётся в state.
+        Без кэша и singleflight - для больших выборок (зеркало аккаунта).
+        Повтор возможен, пока не отдан ни один элемент.
+        """
+        url = f"{self.base_url}/{service}"
+        body = codec.dumps({"method": method, "params": params})
+        client = get_http_client()
+        breaker = circuit_breakers.get(self.base_url, service)
+        retry = RetryState(method)
+        
+        while True:
+            if request_deadline.expired():
+                raise DeadlineExceeded(service, method)
+            if not breaker.allow():
+                raise CircuitOpenError(service, breaker.retry_after())
+            stream = ArrayItemStream(result_key)
+            yielded = False
+            try:
+                async with self.limiter.slot():
+                    request = client.build_request(
+                        "POST", url, headers=self._headers(), content=body,
+                        timeout=retry.timeout(timeout)
+                    )
+                    response = await client.send(request, stream=True)
+                try:
+                    self.limiter.update_units(response.headers.get("Units"))
+                    if response.status_code >= 500:
+                        await response.aread()
+                        raise DirectHTTPError(response.status_code, response.text[:200])
+                    async for chunk in response.aiter_bytes():
+                        for item in stream.feed(chunk):
+                            yielded = True
+                            yield item
+                    for item in stream.close():
+                        yielded = True
+                        yield item
+                finally:
+                    await response.aclose()
+                if stream.error is not None:
+                    # Ошибка приходит целиком до любых элементов
+                    raise self._api_error(stream.error)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(service, method) from None
+            except (httpx.TransportError, DirectAPIError) as error:
+                kind = classify(error)
+                breaker.record(kind)
+                delay = None if yielded else retry.next_delay(error, kind, self.limiter)
+                if delay is None:
+                    if request_deadline.expired():
+                        raise DeadlineExceeded(service, method) from error
+                    raise
+                logger.warning(f"{service}.{method} failed ({kind}: {error}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            
+            breaker.record(None)
+            state["LimitedBy"] = stream.limited_by
+            return
+    
+    async def _iter_items(
+        self,
+        service: str,
+        method: str,
+        params: Dict[str, Any],
+        result_key: str
+    ) -> AsyncIterator[Dict]:
+        """Поэлементный обход get-метода по LimitedBy с потоковым разбором"""
+        offset = 0
+        while True:
+            page_params = dict(params)
+            page_params["Page"] = {"Limit": self.PAGE_LIMIT, "Offset": offset}
+            state: Dict[str, Any] = {}
+            async for item in self._stream_request(service, method, page_params, result_key, state):
+                yield item
+            limited_by = state.get("LimitedBy")
+            if not limited_by:
+                return
+            offset = limited_by
+    
+    async def _iter_pages(
+        self,
+        service: str,
+        method: str,
+        params: Dict[str, Any],
+        result_key: str,
+        prefetch: bool = False
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Постраничный обход get-метода по LimitedBy.
+        prefetch=True - следующая страница запрашивается,
+        пока потребитель обрабатывает текущую.
+        """
+        async def fetch(offset: int) -> Dict[str, Any]:
+            page_params = dict(params)
+            page_params["Page"] = {"Limit": self.PAGE_LIMIT, "Offset": offset}
+            return await self._call(service, method, page_params)
+        
+        next_page = None
+        try:
+            result = await fetch(0)
+            while True:
+                # LimitedBy - номер последнего объекта, если есть ещё страницы
+                limited_by = result.get("LimitedBy")
+                if limited_by and prefetch:
+                    next_page = asyncio.create_task(fetch(limited_by))
+                
+                yield result.get(result_key, [])
+                
+                if not limited_by:
+                    return
+                if next_page is not None:
+                    result = await next_page
+                    next_page = None
+                else:
+                    result = await fetch(limited_by)
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+    
+    async def _typed(self, service: str, pages: AsyncIterator[List[Dict]]) -> AsyncIterator[List[Any]]:
+        """Страницы объектов API -> страницы моделей app/domain.py"""
+        decode = MODELS[service].decode
+        async for page in pages:
+            yield decode(page)
+    
+    async def _collect(self, pages: AsyncIterator[List[Dict]]) -> List[Dict]:
+        """Собрать все страницы в один список"""
+        items = []
+        async for page in pages:
+            items.extend(page)
+        return items
+    
+    async def _mutate(
+        self,
+        service: str,
+        method: str,
+        items: List[Any],
+        results_key: str,
+        items_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Мутирующий вызов с массивом объектов.
+        items_key - ключ массива в params (по умолчанию - SelectionCriteria.Ids).
+        При batching=True одновременные вызовы склеиваются в один запрос,
+        результат содержит только результаты своих объектов.
+        """
+        def build_params(batch_items: List[Any]) -> Dict[str, Any]:
+            if items_key:
+                return {items_key: batch_items}
+            return {"SelectionCriteria": {"Ids": batch_items}}
+        
+        if not self.batching:
+            return await self._call(service, method, build_params(items))
+        
+        coalescer = get_coalescer(self.account_key)
+        results = await coalescer.submit(self._call, service, method, items, results_key, build_params)
+        return {results_key: results}
+    
+    def _check_add_result(
+        self,
+        result: Dict,
+        entity_name: str = "объект",
+        results_key: str = "AddResults"
+    ) -> Any:
+        """Проверяет результат add/update-метода"""
+        add_results = result.get(results_key, [])
         if not add_results:
-            raise DirectAPIError(0, "Пустой ответ", "AddResults empty")
+            raise DirectAPIError(0, "Пустой ответ", f"{results_key} empty")
         
         first = add_results[0]
         if "Errors" in first and first["Errors"]:
@@ -117,21 +454,27 @@ class DirectAPIClient:
         Получить список кампаний
         States: ARCHIVED, CONVERTED, ENDED, OFF, ON, SUSPENDED
         """
+        return await self._collect(self.iter_campaigns(ids=ids, states=states))
+    
+    def iter_campaigns(
+        self,
+        ids: Optional[List[int]] = None,
+        states: Optional[List[str]] = None,
+        prefetch: bool = False,
+        typed: bool = False
+    ) -> AsyncIterator[List[Any]]:
+        """Кампании постранично (typed=True - моделями Campaign)"""
         criteria = {}
         if ids:
             criteria["Ids"] = ids
         if states:
             criteria["States"] = states
         
-        result = await self._call("campaigns", "get", {
+        pages = self._iter_pages("campaigns", "get", {
             "SelectionCriteria": criteria,
-            "FieldNames": [
-                "Id", "Name", "State", "Status", "Type",
-                "StartDate", "DailyBudget", "Statistics"
-            ]
-        })
-        
-        return result.get("Campaigns", [])
+            "FieldNames": self.CAMPAIGN_FIELDS
+        }, "Campaigns", prefetch=prefetch)
+        return self._typed("campaigns", pages) if typed else pages
     
     async def create_campaign(
         self,
@@ -195,12 +538,11 @@ class DirectAPIClient:
         if max_cpc_rub:
             strategy["Search"]["WbMaximumClicks"]["BidCeiling"] = max_cpc_rub * 1_000_000
         
-        result = await self._call("campaigns", "update", {
-            "Campaigns": [{
-                "Id": campaign_id,
-                "TextCampaign": {"BiddingStrategy": strategy}
-            }]
-        })
+        result = await self._mutate("campaigns", "update", [{
+            "Id": campaign_id,
+            "TextCampaign": {"BiddingStrategy": strategy}
+        }], "UpdateResults", items_key="Campaigns")
+        self._check_add_result(result, "кампания", results_key="UpdateResults")
         
         return True
     
@@ -228,13 +570,22 @@ class DirectAPIClient:
     
     # =========== AD GROUPS ===========
     
-    async def get_ad_groups(self, campaign_id: int) -> List[Dict]:
-        """Получить группы объявлений кампании"""
-        result = await self._call("adgroups", "get", {
+    async def get_ad_groups(self, campaign_id: int, typed: bool = False) -> List[Any]:
+        """Получить группы объявлений кампании (typed=True - моделями AdGroup)"""
+        return await self._collect(self.iter_ad_groups(campaign_id, typed=typed))
+    
+    def iter_ad_groups(
+        self,
+        campaign_id: int,
+        prefetch: bool = False,
+        typed: bool = False
+    ) -> AsyncIterator[List[Any]]:
+        """Группы объявлений кампании постранично"""
+        pages = self._iter_pages("adgroups", "get", {
             "SelectionCriteria": {"CampaignIds": [campaign_id]},
-            "FieldNames": ["Id", "Name", "CampaignId", "Status", "RegionIds"]
-        })
-        return result.get("AdGroups", [])
+            "FieldNames": self.AD_GROUP_FIELDS
+        }, "AdGroups", prefetch=prefetch)
+        return self._typed("adgroups", pages) if typed else pages
     
     async def create_ad_group(
         self,
@@ -243,13 +594,11 @@ class DirectAPIClient:
         region_ids: List[int]
     ) -> int:
         """Создать группу объявлений"""
-        result = await self._call("adgroups", "add", {
-            "AdGroups": [{
-                "Name": name,
-                "CampaignId": campaign_id,
-                "RegionIds": region_ids
-            }]
-        })
+        result = await self._mutate("adgroups", "add", [{
+            "Name": name,
+            "CampaignId": campaign_id,
+            "RegionIds": region_ids
+        }], "AddResults", items_key="AdGroups")
         first = self._check_add_result(result, "группа")
         return first["Id"]
     
@@ -257,12 +606,21 @@ class DirectAPIClient:
     
     async def get_ads(self, ad_group_id: int) -> List[Dict]:
         """Получить объявления группы"""
-        result = await self._call("ads", "get", {
+        return await self._collect(self.iter_ads(ad_group_id))
+    
+    def iter_ads(
+        self,
+        ad_group_id: int,
+        prefetch: bool = False,
+        typed: bool = False
+    ) -> AsyncIterator[List[Any]]:
+        """Объявления группы постранично (typed=True - моделями TextAd)"""
+        pages = self._iter_pages("ads", "get", {
             "SelectionCriteria": {"AdGroupIds": [ad_group_id]},
-            "FieldNames": ["Id", "AdGroupId", "Status", "State", "Type"],
-            "TextAdFieldNames": ["Title", "Title2", "Text", "Href", "DisplayUrlPath"]
-        })
-        return result.get("Ads", [])
+            "FieldNames": self.AD_FIELDS,
+            "TextAdFieldNames": self.TEXT_AD_FIELDS
+        }, "Ads", prefetch=prefetch)
+        return self._typed("ads", pages) if typed else pages
     
     async def create_text_ad(
         self,
@@ -286,28 +644,35 @@ class DirectAPIClient:
         if display_url:
             text_ad["DisplayUrlPath"] = display_url
         
-        result = await self._call("ads", "add", {
-            "Ads": [{"AdGroupId": ad_group_id, "TextAd": text_ad}]
-        })
+        result = await self._mutate("ads", "add", [
+            {"AdGroupId": ad_group_id, "TextAd": text_ad}
+        ], "AddResults", items_key="Ads")
         first = self._check_add_result(result, "объявление")
         return first["Id"]
     
     async def moderate_ads(self, ad_ids: List[int]) -> bool:
         """Отправить объявления на модерацию"""
-        await self._call("ads", "moderate", {
-            "SelectionCriteria": {"Ids": ad_ids}
-        })
+        await self._mutate("ads", "moderate", ad_ids, "ModerateResults")
         return True
     
     # =========== KEYWORDS ===========
     
     async def get_keywords(self, ad_group_id: int) -> List[Dict]:
         """Получить ключевые слова группы"""
-        result = await self._call("keywords", "get", {
+        return await self._collect(self.iter_keywords(ad_group_id))
+    
+    def iter_keywords(
+        self,
+        ad_group_id: int,
+        prefetch: bool = False,
+        typed: bool = False
+    ) -> AsyncIterator[List[Any]]:
+        """Ключевые слова группы постранично (typed=True - моделями Keyword)"""
+        pages = self._iter_pages("keywords", "get", {
             "SelectionCriteria": {"AdGroupIds": [ad_group_id]},
-            "FieldNames": ["Id", "Keyword", "AdGroupId", "Status", "State"]
-        })
-        return result.get("Keywords", [])
+            "FieldNames": self.KEYWORD_FIELDS
+        }, "Keywords", prefetch=prefetch)
+        return self._typed("keywords", pages) if typed else pages
     
     async def add_keywords(
         self,
@@ -323,7 +688,7 @@ class DirectAPIClient:
                 kw_item["Bid"] = bid_rub * 1_000_000
             keywords_data.append(kw_item)
         
-        result = await self._call("keywords", "add", {"Keywords": keywords_data})
+        result = await self._mutate("keywords", "add", keywords_data, "AddResults", items_key="Keywords")
         
         keyword_ids = []
         for r in result.get("AddResults", []):
@@ -334,79 +699,270 @@ class DirectAPIClient:
     
     # =========== STATISTICS ===========
     
+    DEFAULT_STATS_FIELDS = [
+        "Impressions", "Clicks", "Ctr", 
+        "AvgCpc", "Cost", "Conversions"
+    ]
+    
     async def get_stats(
         self,
         campaign_id: int,
         date_from: str,
         date_to: str,
         report_type: str = "CAMPAIGN_PERFORMANCE_REPORT",
-        fields: Optional[List[str]] = None
+        fields: Optional[List[str]] = None,
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None,
+        goals: Optional[List[int]] = None,
+        attribution_models: Optional[List[str]] = None
     ) -> List[Dict]:
         """
         Получить статистику через Reports API
+        Значения типизированы (app/report_parser.py), деньги - в микроединицах.
+        mode - processingMode (auto/online/offline).
+        wait - сколько ждать готовности; по истечении ReportPendingError с job_id,
+        отчёт продолжает готовиться в фоне (app/reports.py).
+        goals/attribution_models - цели Метрики и модели атрибуции (LC, LSC, FC,
+        LYDC, ...): колонки Conversions_<goal>_<model> сворачиваются в
+        row["Goals"] (GoalValues, app/report_parser.py).
         """
-        if fields is None:
-            fields = [
-                "Impressions", "Clicks", "Ctr", 
-                "AvgCpc", "Cost", "Conversions"
-            ]
-        
-        body = {
-            "params": {
-                "SelectionCriteria": {
-                    "DateFrom": date_from,
-                    "DateTo": date_to,
-                    "Filter": [{
-                        "Field": "CampaignId",
-                        "Operator": "EQUALS",
-                        "Values": [str(campaign_id)]
-                    }]
-                },
-                "FieldNames": fields,
-                "ReportName": f"stats_{campaign_id}",
-                "ReportType": report_type,
-                "DateRangeType": "CUSTOM_DATE",
-                "Format": "TSV",
-                "IncludeVAT": "YES",
-                "IncludeDiscount": "NO"
-            }
+        params = self._stats_params(
+            date_from, date_to, report_type,
+            fields or self.DEFAULT_STATS_FIELDS,
+            [{
+                "Field": "CampaignId",
+                "Operator": "EQUALS",
+                "Values": [str(campaign_id)]
+            }],
+            goals=goals,
+            attribution_models=attribution_models
+        )
+        return await self._report(params, f"stats_{campaign_id}", mode, wait, owner)
+
+    async def compare_stats(
+        self,
+        campaign_id: int,
+        date_from: str,
+        date_to: str,
+        fields: Optional[List[str]] = None,
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Период против предыдущего такой же длины (вплотную перед date_from):
+        {metric: value, metric_prev: ..., metric_delta: ...} с CTR, CPC, CPA,
+        ROAS и конверсией (StatsFrame.compare, app/stats_frame.py).
+        Оба отчёта ставятся одновременно; если какой-то не успел -
+        ReportPendingError(reissue=True): забрать пару можно только повтором.
+        """
+        from datetime import date, timedelta
+        from app.reports import ReportPendingError
+
+        start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+        prev_end = start - timedelta(days=1)
+        prev_start = prev_end - (end - start)
+        filters = [{
+            "Field": "CampaignId",
+            "Operator": "EQUALS",
+            "Values": [str(campaign_id)]
+        }]
+        fields = list(fields or self.DEFAULT_STATS_FIELDS)
+        if "Revenue" not in fields:
+            # База ROAS
+            fields.append("Revenue")
+
+        def frame(period_from: date, period_to: date):
+            params = self._stats_params(
+                period_from.isoformat(), period_to.isoformat(),
+                "CAMPAIGN_PERFORMANCE_REPORT", fields, filters
+            )
+            return self._report_frame(params, f"stats_{campaign_id}", mode, wait, owner)
+
+        try:
+            current, previous = await asyncio.gather(frame(start, end), frame(prev_start, prev_end))
+        except ReportPendingError as e:
+            raise ReportPendingError(e.job_id, reissue=True) from None
+        rows = current.compare(previous).to_dicts()
+        return rows[0] if rows else {}
+
+    async def get_campaigns_stats(
+        self,
+        date_from: str,
+        date_to: str,
+        campaign_ids: Optional[List[int]] = None,
+        fields: Optional[List[str]] = None,
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None,
+        goals: Optional[List[int]] = None,
+        attribution_models: Optional[List[str]] = None
+    ) -> Dict[int, Dict]:
+        """
+        Статистика нескольких кампаний (или всего аккаунта при campaign_ids=None)
+        одним отчётом с группировкой по CampaignId: {campaign_id: row}.
+        row["CampaignName"] - текущее название из campaigns.get: в отчёте
+        кампания, переименованная за период, дала бы по строке на название.
+        """
+        filters = []
+        if campaign_ids:
+            filters.append({
+                "Field": "CampaignId",
+                "Operator": "IN",
+                "Values": [str(cid) for cid in campaign_ids]
+            })
+        
+        params = self._stats_params(
+            date_from, date_to, "CAMPAIGN_PERFORMANCE_REPORT",
+            ["CampaignId"] + list(fields or self.DEFAULT_STATS_FIELDS),
+            filters,
+            goals=goals,
+            attribution_models=attribution_models
+        )
+        rows = await self._report(params, "stats_campaigns", mode, wait, owner)
+        stats = {row["CampaignId"]: row for row in rows}
+        
+        if stats:
+            # Больше CAMPAIGN_IDS_LIMIT - проще взять все кампании (кэшируется)
+            ids = list(stats) if len(stats) <= self.CAMPAIGN_IDS_LIMIT else None
+            try:
+                names = {c["Id"]: c.get("Name") for c in await self.get_campaigns(ids=ids)}
+            except DirectAPIError as e:
+                logger.warning(f"Campaign names for stats unavailable: {e.message}")
+                names = {}
+            for campaign_id, row in stats.items():
+                row["CampaignName"] = names.get(campaign_id)
+        return stats
+    
+    async def get_report(
+        self,
+        report_type: str,
+        fields: List[str],
+        date_from: str,
+        date_to: str,
+        campaign_id: Optional[int] = None,
+        name_prefix: str = "report",
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None
+    ) -> List[Dict]:
+        """Произвольный отчёт (тип + поля) по кампании или всему аккаунту"""
+        filters = []
+        if campaign_id is not None:
+            filters.append({
+                "Field": "CampaignId",
+                "Operator": "EQUALS",
+                "Values": [str(campaign_id)]
+            })
+        params = self._stats_params(date_from, date_to, report_type, fields, filters)
+        return await self._report(params, name_prefix, mode, wait, owner)
+    
+    async def get_report_frame(
+        self,
+        report_type: str,
+        fields: List[str],
+        date_from: str,
+        date_to: str,
+        campaign_id: Optional[int] = None,
+        name_prefix: str = "report",
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None
+    ):
+        """То же, что get_report, но колоночным StatsFrame (app/stats_frame.py)"""
+        filters = []
+        if campaign_id is not None:
+            filters.append({
+                "Field": "CampaignId",
+                "Operator": "EQUALS",
+                "Values": [str(campaign_id)]
+            })
+        params = self._stats_params(date_from, date_to, report_type, fields, filters)
+        return await self._report_frame(params, name_prefix, mode, wait, owner)
+    
+    def _stats_params(
+        self,
+        date_from: str,
+        date_to: str,
+        report_type: str,
+        fields: List[str],
+        filters: List[Dict[str, Any]],
+        goals: Optional[List[int]] = None,
+        attribution_models: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Параметры отчёта Reports API"""
+        criteria: Dict[str, Any] = {
+            "DateFrom": date_from,
+            "DateTo": date_to,
+        }
+        if filters:
+            criteria["Filter"] = filters
+        
+        params = {
+            "SelectionCriteria": criteria,
+            "FieldNames": list(fields),
+            "ReportType": report_type,
+            "DateRangeType": "CUSTOM_DATE",
+            "Format": "TSV",
+            "IncludeVAT": "YES",
+            "IncludeDiscount": "NO"
         }
+        if goals:
+            params["Goals"] = [str(goal) for goal in goals]
+        if attribution_models:
+            params["AttributionModels"] = list(attribution_models)
+        return params
+    
+    async def _report(
+        self,
+        params: Dict[str, Any],
+        name_prefix: str,
+        mode: str,
+        wait: Optional[float],
+        owner: Optional[Dict[str, str]]
+    ) -> List[Dict]:
+        """
+        Получить отчёт строками-dict
+        (при Goals колонки целей свёрнуты в row["Goals"])
+        """
+        from app.report_parser import goal_rows
         
-        headers = self._reports_headers()
+        frame = await self._report_frame(params, name_prefix, mode, wait, owner)
+        if params.get("Goals"):
+            return goal_rows(frame.header, frame.to_rows())
+        return frame.to_dicts()
+    
+    async def _report_frame(
+        self,
+        params: Dict[str, Any],
+        name_prefix: str,
+        mode: str,
+        wait: Optional[float],
+        owner: Optional[Dict[str, str]]
+    ):
+        """
+        Получить отчёт колоночным StatsFrame (через кэш закрытых дней, если включён).
+        Длинные периоды читаются шардами, производные метрики пересчитываются
+        из сумм базовых.
+        """
+        from app.report_shards import fetch_sharded
+        from app.report_cache import report_cache, REPORT_CACHE_ENABLED
+        from app.report_aggregate import required_fields
+        from app.stats_frame import StatsFrame
         
-        async with httpx.AsyncClient() as client:
-            for attempt in range(5):
-                response = await client.post(
-                    self.REPORTS_URL,
-                    headers=headers,
-                    json=body,
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    lines = response.text.strip().split("\n")
-                    if len(lines) >= 2:
-                        header = lines[0].split("\t")
-                        result = []
-                        for line in lines[1:]:
-                            data = line.split("\t")
-                            result.append(dict(zip(header, data)))
-                        return result
-                    return []
-                
-                if response.status_code in (201, 202):
-                    # Report is being prepared
-                    import asyncio
-                    await asyncio.sleep(2)
-                    continue
-                
-                raise DirectAPIError(
-                    response.status_code,
-                    "Reports API error",
-                    response.text[:200]
-                )
+        by_date = "Date" in params["FieldNames"]
+        params["FieldNames"] = required_fields(params["FieldNames"])
+        if REPORT_CACHE_ENABLED:
+            # Закрытые дни - из кэша, затем сворачиваем дни в итог
+            header, rows = await report_cache.fetch(self, params, mode=mode, wait=wait, owner=owner)
+        else:
+            header, rows = await fetch_sharded(self, params, name_prefix, mode=mode, wait=wait, owner=owner)
         
-        return []
+        frame = StatsFrame.from_rows(header, rows)
+        frame = frame.group_by([d for d in frame.dimensions if by_date or d != "Date"])
+        # ROAS нет в Reports API - считается из Revenue/Cost, если они есть
+        return frame.with_derived(("Roas",))
     
     # =========== BID MODIFIERS ===========
     
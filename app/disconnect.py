@@ -0,0 +1,89 @@
+"""
+Отмена работы запроса, когда клиент (aihandler) отключился
+
+aihandler обрывает соединение при ретраях и отменах LLM, а generate()
+продолжал бы вызывать Директ и ждать отчёты. guard_stream() читает поток
+ответа по шагам в отдельной задаче и параллельно опрашивает
+request.is_disconnected(): при отключении шаг отменяется обычным
+asyncio.CancelledError (внутренние задачи - разделы, шарды, страницы -
+отменяются своими finally), поток закрывается, сессии БД возвращаются в пул.
+
+Задания отчётов при этом не пропадают: опрос идёт в фоне (app/reports.py),
+а повторный такой же запрос подхватит то же задание.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, TypeVar
+
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, что клиент ещё подключён (сек)
+DISCONNECT_POLL = float(os.getenv("DIRECT_DISCONNECT_POLL", "1"))
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """Клиент отключился, не дождавшись ответа"""
+
+
+async def wait_disconnected(request: Request, interval: float = DISCONNECT_POLL):
+    """Вернуться, когда клиент отключится"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+async def _cancel(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+
+async def guard_stream(request: Request, stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Поток ответа, который останавливается (с отменой текущего шага),
+    как только клиент отключился
+    """
+    watcher = asyncio.ensure_future(wait_disconnected(request))
+    try:
+        while True:
+            step = asyncio.ensure_future(stream.__anext__())
+            await asyncio.wait((step, watcher), return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling upstream work")
+                await _cancel(step)
+                break
+            try:
+                chunk = step.result()
+            except StopAsyncIteration:
+                break
+            yield chunk
+    finally:
+        watcher.cancel()
+        await stream.aclose()
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Дождаться work; если клиент отключился раньше - отменить её
+    и поднять ClientDisconnected
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_disconnected(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        await _cancel(task)
+        raise
+    finally:
+        watcher.cancel()
+    if not task.done():
+        logger.info(f"Client disconnected from {request.url.path}, cancelling upstream work")
+        await _cancel(task)
+        raise ClientDisconnected()
+    return task.result()
@@ -0,0 +1,506 @@
+"""
+Типизированные объекты Direct API: кампании, группы, объявления, фразы, корректировки
+
+get-методы отдают вложенные dict: на объект приходится dict верхнего
+уровня плюс dict на каждое вложенное поле (TextAd, DailyBudget,
+Statistics...), и роутеры разбирают их цепочками .get(). Здесь объект -
+экземпляр со __slots__ и плоскими атрибутами:
+- деньги - int микроединиц (как приходят из API, без float), в рублях -
+  свойствами *_rub;
+- повторяющиеся значения (Status, State, Type...) интернируются - на
+  аккаунт хранится одна строка "ACCEPTED", а не по одной на объект;
+- from_api() разбирает объект API; to_api() собирает объект для add,
+  to_api(update=True) - для update/set. Выводятся только поля, которые
+  эти методы принимают и которые заданы: статусы, тип, статистика из get
+  только читаются, умолчаний (Mode бюджета и т.п.) модель не подставляет;
+- to_get() - объект целиком, как в ответе get (null-поля опускаются).
+
+Где живут модели:
+- кэш get-ответов в памяти процесса (app/cache.py) хранит страницы
+  моделями; Redis и зеркало в MySQL - JSON объектов API, общий для
+  воркеров (to_get() даёт его же без null-полей);
+- страничные get клиента (iter_campaigns(typed=True) и т.п.) и чтение
+  из зеркала отдают модели - роутеры работают с атрибутами, а не .get().
+decode_exact() сжимает страницу, только если модели сохраняют все её поля
+(запрос с FieldNames шире модели остаётся dict).
+
+Память на объект и скорость разбора: poc/bench_domain.py
+"""
+import sys
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MICROS = 1_000_000
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
+def _put(data: Dict[str, Any], key: str, value: Any):
+    if value is not None:
+        data[key] = value
+
+
+def micros_to_rub(value: Optional[int]) -> Optional[float]:
+    return None if value is None else value / MICROS
+
+
+def rub_to_micros(value: Optional[float]) -> Optional[int]:
+    return None if value is None else int(round(value * MICROS))
+
+
+def _without_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _without_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_without_nulls(v) for v in value]
+    return value
+
+
+class _Model(ABC):
+    __slots__ = ()
+
+    @classmethod
+    @abstractmethod
+    def from_api(cls, data: Dict[str, Any]) -> "_Model":
+        """Объект из ответа get"""
+
+    @abstractmethod
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        """Объект для add (update=True - для update/set, с Id и без неизменяемых полей)"""
+
+    @abstractmethod
+    def to_get(self) -> Dict[str, Any]:
+        """Объект целиком, как в ответе get"""
+
+    @classmethod
+    def decode(cls, items: Iterable[Dict[str, Any]]) -> List[Any]:
+        """Страница get-метода -> список объектов"""
+        from_api = cls.from_api
+        return [from_api(item) for item in items]
+
+    @classmethod
+    def decode_exact(cls, items: Iterable[Dict[str, Any]]) -> Optional[List[Any]]:
+        """Страница -> объекты; None, если модель теряет какое-то поле"""
+        models = []
+        for item in items:
+            model = cls.from_api(item)
+            if model.to_get() != _without_nulls(item):
+                return None
+            models.append(model)
+        return models
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        values = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__
+            if getattr(self, name) is not None
+        )
+        return f"{type(self).__name__}({values})"
+
+
+class Campaign(_Model):
+    __slots__ = (
+        "id", "name", "type", "status", "state", "start_date",
+        "daily_budget", "daily_budget_mode", "clicks", "impressions",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        name: Optional[str] = None,
+        type: Optional[str] = None,
+        status: Optional[str] = None,
+        state: Optional[str] = None,
+        start_date: Optional[str] = None,
+        daily_budget: Optional[int] = None,
+        daily_budget_mode: Optional[str] = None,
+        clicks: Optional[int] = None,
+        impressions: Optional[int] = None
+    ):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.status = status
+        self.state = state
+        self.start_date = start_date
+        self.daily_budget = daily_budget
+        self.daily_budget_mode = daily_budget_mode
+        self.clicks = clicks
+        self.impressions = impressions
+
+    @property
+    def daily_budget_rub(self) -> Optional[float]:
+        return micros_to_rub(self.daily_budget)
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "Campaign":
+        budget = data.get("DailyBudget") or {}
+        stats = data.get("Statistics") or {}
+        return cls(
+            data.get("Id"),
+            data.get("Name"),
+            _intern(data.get("Type")),
+            _intern(data.get("Status")),
+            _intern(data.get("State")),
+            _intern(data.get("StartDate")),
+            budget.get("Amount"),
+            _intern(budget.get("Mode")),
+            stats.get("Clicks"),
+            stats.get("Impressions"),
+        )
+
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if update:
+            _put(data, "Id", self.id)
+        _put(data, "Name", self.name)
+        _put(data, "StartDate", self.start_date)
+        if self.daily_budget is not None:
+            budget = {"Amount": self.daily_budget}
+            _put(budget, "Mode", self.daily_budget_mode)
+            data["DailyBudget"] = budget
+        return data
+
+    def to_get(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        _put(data, "Id", self.id)
+        _put(data, "Name", self.name)
+        _put(data, "Type", self.type)
+        _put(data, "Status", self.status)
+        _put(data, "State", self.state)
+        _put(data, "StartDate", self.start_date)
+        budget: Dict[str, Any] = {}
+        _put(budget, "Amount", self.daily_budget)
+        _put(budget, "Mode", self.daily_budget_mode)
+        if budget:
+            data["DailyBudget"] = budget
+        stats: Dict[str, Any] = {}
+        _put(stats, "Clicks", self.clicks)
+        _put(stats, "Impressions", self.impressions)
+        if stats:
+            data["Statistics"] = stats
+        return data
+
+
+class AdGroup(_Model):
+    __slots__ = ("id", "name", "campaign_id", "status", "region_ids")
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        name: Optional[str] = None,
+        campaign_id: Optional[int] = None,
+        status: Optional[str] = None,
+        region_ids: Optional[Tuple[int, ...]] = None
+    ):
+        self.id = id
+        self.name = name
+        self.campaign_id = campaign_id
+        self.status = status
+        self.region_ids = region_ids
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "AdGroup":
+        region_ids = data.get("RegionIds")
+        return cls(
+            data.get("Id"),
+            data.get("Name"),
+            data.get("CampaignId"),
+            _intern(data.get("Status")),
+            None if region_ids is None else tuple(region_ids),
+        )
+
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if update:
+            _put(data, "Id", self.id)
+        else:
+            _put(data, "CampaignId", self.campaign_id)
+        _put(data, "Name", self.name)
+        if self.region_ids is not None:
+            data["RegionIds"] = list(self.region_ids)
+        return data
+
+    def to_get(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        _put(data, "Id", self.id)
+        _put(data, "Name", self.name)
+        _put(data, "CampaignId", self.campaign_id)
+        _put(data, "Status", self.status)
+        if self.region_ids is not None:
+            data["RegionIds"] = list(self.region_ids)
+        return data
+
+
+class TextAd(_Model):
+    """Объявление с полями TextAd, поднятыми на верхний уровень"""
+    __slots__ = (
+        "id", "ad_group_id", "campaign_id", "status", "state", "type",
+        "title", "title2", "text", "href", "display_url_path", "mobile",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        ad_group_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+        status: Optional[str] = None,
+        state: Optional[str] = None,
+        type: Optional[str] = None,
+        title: Optional[str] = None,
+        title2: Optional[str] = None,
+        text: Optional[str] = None,
+        href: Optional[str] = None,
+        display_url_path: Optional[str] = None,
+        mobile: Optional[str] = None
+    ):
+        self.id = id
+        self.ad_group_id = ad_group_id
+        self.campaign_id = campaign_id
+        self.status = status
+        self.state = state
+        self.type = type
+        self.title = title
+        self.title2 = title2
+        self.text = text
+        self.href = href
+        self.display_url_path = display_url_path
+        self.mobile = mobile
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "TextAd":
+        text_ad = data.get("TextAd") or {}
+        return cls(
+            data.get("Id"),
+            data.get("AdGroupId"),
+            data.get("CampaignId"),
+            _intern(data.get("Status")),
+            _intern(data.get("State")),
+            _intern(data.get("Type")),
+            text_ad.get("Title"),
+            text_ad.get("Title2"),
+            text_ad.get("Text"),
+            text_ad.get("Href"),
+            text_ad.get("DisplayUrlPath"),
+            _intern(text_ad.get("Mobile")),
+        )
+
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if update:
+            _put(data, "Id", self.id)
+        else:
+            _put(data, "AdGroupId", self.ad_group_id)
+        text_ad: Dict[str, Any] = {}
+        _put(text_ad, "Title", self.title)
+        _put(text_ad, "Title2", self.title2)
+        _put(text_ad, "Text", self.text)
+        _put(text_ad, "Href", self.href)
+        _put(text_ad, "DisplayUrlPath", self.display_url_path)
+        if not update:
+            # Mobile задаётся только при создании
+            _put(text_ad, "Mobile", self.mobile)
+        if text_ad:
+            data["TextAd"] = text_ad
+        return data
+
+    def to_get(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        _put(data, "Id", self.id)
+        _put(data, "AdGroupId", self.ad_group_id)
+        _put(data, "CampaignId", self.campaign_id)
+        _put(data, "Status", self.status)
+        _put(data, "State", self.state)
+        _put(data, "Type", self.type)
+        text_ad: Dict[str, Any] = {}
+        _put(text_ad, "Title", self.title)
+        _put(text_ad, "Title2", self.title2)
+        _put(text_ad, "Text", self.text)
+        _put(text_ad, "Href", self.href)
+        _put(text_ad, "DisplayUrlPath", self.display_url_path)
+        _put(text_ad, "Mobile", self.mobile)
+        if text_ad:
+            data["TextAd"] = text_ad
+        return data
+
+
+class Keyword(_Model):
+    __slots__ = (
+        "id", "keyword", "ad_group_id", "campaign_id", "status", "state",
+        "bid", "context_bid",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        keyword: Optional[str] = None,
+        ad_group_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+        status: Optional[str] = None,
+        state: Optional[str] = None,
+        bid: Optional[int] = None,
+        context_bid: Optional[int] = None
+    ):
+        self.id = id
+        self.keyword = keyword
+        self.ad_group_id = ad_group_id
+        self.campaign_id = campaign_id
+        self.status = status
+        self.state = state
+        self.bid = bid
+        self.context_bid = context_bid
+
+    @property
+    def bid_rub(self) -> Optional[float]:
+        return micros_to_rub(self.bid)
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "Keyword":
+        return cls(
+            data.get("Id"),
+            data.get("Keyword"),
+            data.get("AdGroupId"),
+            data.get("CampaignId"),
+            _intern(data.get("Status")),
+            _intern(data.get("State")),
+            data.get("Bid"),
+            data.get("ContextBid"),
+        )
+
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if update:
+            # Ставки в update не меняются - для них keywordbids/bids.set
+            _put(data, "Id", self.id)
+            _put(data, "Keyword", self.keyword)
+            return data
+        _put(data, "Keyword", self.keyword)
+        _put(data, "AdGroupId", self.ad_group_id)
+        _put(data, "Bid", self.bid)
+        _put(data, "ContextBid", self.context_bid)
+        return data
+
+    def to_get(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        _put(data, "Id", self.id)
+        _put(data, "Keyword", self.keyword)
+        _put(data, "AdGroupId", self.ad_group_id)
+        _put(data, "CampaignId", self.campaign_id)
+        _put(data, "Status", self.status)
+        _put(data, "State", self.state)
+        _put(data, "Bid", self.bid)
+        _put(data, "ContextBid", self.context_bid)
+        return data
+
+
+# Вложенные объекты корректировок bidmodifiers.get
+ADJUSTMENT_KEYS = (
+    "MobileAdjustment", "TabletAdjustment", "DesktopAdjustment",
+    "DemographicsAdjustment", "RegionalAdjustment",
+)
+
+
+# Поля корректировок, которые отдаёт только get
+READ_ONLY_OPTIONS = frozenset({"Enabled"})
+
+
+class BidModifier(_Model):
+    """
+    Корректировка ставки. bid_modifier - процент (не деньги);
+    adjustment - имя вложенного объекта API (MobileAdjustment...),
+    options - остальные его поля (Gender, Age, RegionId...).
+    """
+    __slots__ = (
+        "id", "campaign_id", "ad_group_id", "level", "type",
+        "adjustment", "bid_modifier", "options",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+        ad_group_id: Optional[int] = None,
+        level: Optional[str] = None,
+        type: Optional[str] = None,
+        adjustment: Optional[str] = None,
+        bid_modifier: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None
+    ):
+        self.id = id
+        self.campaign_id = campaign_id
+        self.ad_group_id = ad_group_id
+        self.level = level
+        self.type = type
+        self.adjustment = adjustment
+        self.bid_modifier = bid_modifier
+        self.options = options
+
+    @classmethod
+    def from_api(cls, data: Dict[str, Any]) -> "BidModifier":
+        adjustment = bid_modifier = options = None
+        for key in ADJUSTMENT_KEYS:
+            nested = data.get(key)
+            if nested is not None:
+                adjustment = sys.intern(key)
+                bid_modifier = nested.get("BidModifier")
+                options = {k: v for k, v in nested.items() if k != "BidModifier" and v is not None} or None
+                break
+        return cls(
+            data.get("Id"),
+            data.get("CampaignId"),
+            data.get("AdGroupId"),
+            _intern(data.get("Level")),
+            _intern(data.get("Type")),
+            adjustment,
+            bid_modifier,
+            options,
+        )
+
+    def to_api(self, update: bool = False) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if update:
+            # bidmodifiers.set меняет только процент
+            _put(data, "Id", self.id)
+            _put(data, "BidModifier", self.bid_modifier)
+            return data
+        # Корректировка уровня группы привязывается к группе, иначе - к кампании
+        if self.ad_group_id is not None:
+            data["AdGroupId"] = self.ad_group_id
+        else:
+            _put(data, "CampaignId", self.campaign_id)
+        if self.adjustment is not None:
+            nested = {k: v for k, v in (self.options or {}).items() if k not in READ_ONLY_OPTIONS}
+            _put(nested, "BidModifier", self.bid_modifier)
+            data[self.adjustment] = nested
+        return data
+
+    def to_get(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        _put(data, "Id", self.id)
+        _put(data, "CampaignId", self.campaign_id)
+        _put(data, "AdGroupId", self.ad_group_id)
+        _put(data, "Level", self.level)
+        _put(data, "Type", self.type)
+        if self.adjustment is not None:
+            nested = dict(self.options or {})
+            _put(nested, "BidModifier", self.bid_modifier)
+            data[self.adjustment] = nested
+        return data
+
+
+# Сервис Direct API -> модель его объектов
+MODELS = {
+    "campaigns": Campaign,
+    "adgroups": AdGroup,
+    "ads": TextAd,
+    "keywords": Keyword,
+    "bidmodifiers": BidModifier,
+}
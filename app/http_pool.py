@@ -0,0 +1,79 @@
+"""
+Общий HTTP транспорт для Яндекс Директ API
+
+Один httpx.AsyncClient на процесс: keep-alive пул соединений и HTTP/2,
+чтобы каждый вызов API не платил за DNS + TCP + TLS.
+Создаётся в lifespan (app/main.py), закрывается при остановке.
+"""
+import os
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Лимиты пула (через env, как ENCRYPT_KEY_PATH)
+HTTP_MAX_CONNECTIONS = int(os.getenv("DIRECT_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("DIRECT_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("DIRECT_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("DIRECT_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP2_ENABLED = os.getenv("DIRECT_HTTP2", "true").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 в httpx требует пакет h2 (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("h2 not installed, HTTP/2 disabled for Direct API transport")
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(120.0, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Создать общий транспорт (вызывается на старте)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+        logger.info(
+            f"HTTP transport ready (max_connections={HTTP_MAX_CONNECTIONS}, "
+            f"keepalive={HTTP_MAX_KEEPALIVE})"
+        )
+    return _client
+
+
+async def close_http_client():
+    """Закрыть общий транспорт (вызывается при остановке)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Получить общий транспорт (singleton).
+    Вне lifespan (скрипты, отладка) создаётся лениво.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
@@ -0,0 +1,245 @@
+"""
+JSON-кодек клиента Direct API
+
+- codec.dumps / codec.loads: orjson или msgspec, если установлены,
+  иначе stdlib json (DIRECT_JSON_CODEC=auto|orjson|msgspec|json);
+  битый JSON у любого кодека - ValueError;
+- ArrayItemStream: инкрементальный разбор ответа get - элементы массива
+  result.<Ads|Keywords|...> отдаются по мере прихода байтов, без
+  одновременного хранения всего тела и всего дерева. С ijson - через него,
+  без ijson - stdlib raw_decode по каждому элементу (недошедший элемент
+  разбирается заново, только когда буфер вырос вдвое - суммарно линейно).
+
+Замеры: poc/bench_json.py
+"""
+import os
+import re
+import json
+import codecs
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JSON_CODEC = os.getenv("DIRECT_JSON_CODEC", "auto").lower()
+
+
+class StdlibCodec:
+    name = "json"
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self.dumps = msgspec.json.encode
+        self._decode = msgspec.json.decode
+        self._error = msgspec.DecodeError
+
+    def loads(self, data: bytes) -> Any:
+        # DecodeError msgspec - не ValueError; приводим к контракту остальных кодеков
+        try:
+            return self._decode(data)
+        except self._error as e:
+            raise ValueError(str(e)) from e
+
+
+_CODECS = {"orjson": OrjsonCodec, "msgspec": MsgspecCodec, "json": StdlibCodec}
+
+
+def get_codec(name: str = JSON_CODEC):
+    """Кодек по имени; auto - самый быстрый из установленных"""
+    candidates = ["orjson", "msgspec", "json"] if name == "auto" else [name]
+    for candidate in candidates:
+        try:
+            return _CODECS[candidate]()
+        except ImportError:
+            if name != "auto":
+                logger.warning(f"JSON codec {candidate} is not installed, using stdlib json")
+        except KeyError:
+            raise ValueError(f"Unknown JSON codec: {candidate}")
+    return StdlibCodec()
+
+
+# Один экземпляр на процесс
+codec = get_codec()
+
+
+# =========== INCREMENTAL ===========
+
+_LIMITED_BY = re.compile(r'"LimitedBy"\s*:\s*(\d+)')
+_WHITESPACE = " \t\r\n,"
+
+
+class ArrayItemStream:
+    """
+    Инкрементальный разбор {"result": {"<key>": [...], "LimitedBy": N}}
+
+        stream = ArrayItemStream("Ads")
+        async for chunk in response.aiter_bytes():
+            for item in stream.feed(chunk):
+                ...
+        stream.close()    # -> stream.limited_by, stream.error
+
+    Тело без массива (ошибка, пустой результат) разбирается целиком
+    в close(): оно маленькое.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.limited_by: Optional[int] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self._impl = _IjsonItems(key) if _ijson is not None else _StdlibItems(key)
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        return self._impl.feed(chunk)
+
+    def close(self) -> List[Any]:
+        items, self.limited_by, self.error = self._impl.close()
+        return items
+
+
+class _StdlibItems:
+    """
+    Поиск начала массива + raw_decode каждого элемента
+
+    Куски текста копятся в списке и склеиваются только перед попыткой
+    разбора. Если элемент (или начало массива) ещё не дошёл целиком,
+    следующая попытка - когда накопится вдвое больше: крупный элемент из
+    многих мелких кусков разбирается O(log n) раз, а не на каждый кусок.
+    """
+
+    def __init__(self, key: str):
+        self._marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._chunks: List[str] = []
+        self._size = 0
+        # Сколько символов накопить до следующей попытки разбора
+        self._retry_at = 0
+        self._state = "head"  # head -> items -> tail
+        self._head = ""
+        self._tail = ""
+
+    @property
+    def _buffer(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        return self._consume(self._text.decode(chunk))
+
+    def _consume(self, text: str, final: bool = False) -> List[Any]:
+        if self._state == "tail":
+            self._tail += text
+            return []
+        if text:
+            self._chunks.append(text)
+            self._size += len(text)
+        if self._size < self._retry_at and not final:
+            return []
+        buffer = self._buffer
+
+        if self._state == "head":
+            match = self._marker.search(buffer)
+            if match is None:
+                self._keep(buffer)
+                return []
+            self._head = buffer[:match.start()]
+            buffer = buffer[match.end():]
+            self._state = "items"
+
+        items = []
+        pos = 0
+        length = len(buffer)
+        while True:
+            while pos < length and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= length:
+                break
+            if buffer[pos] == "]":
+                self._state = "tail"
+                self._tail = buffer[pos + 1:]
+                pos = length
+                break
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Элемент ещё не дошёл целиком
+                break
+            items.append(item)
+            pos = end
+        self._keep(buffer[pos:])
+        return items
+
+    def _keep(self, rest: str):
+        """Оставить неразобранный хвост; повторить разбор, когда он вырастет вдвое"""
+        self._chunks = [rest] if rest else []
+        self._size = len(rest)
+        self._retry_at = 2 * len(rest)
+
+    def close(self):
+        items = self._consume(self._text.decode(b"", final=True), final=True)
+        if self._state == "head":
+            # Массива не было: ошибка или пустой результат
+            body = json.loads(self._buffer) if self._buffer.strip() else {}
+            result = body.get("result", {})
+            return items, result.get("LimitedBy"), body.get("error")
+        if self._state == "items":
+            raise ValueError(f"Truncated JSON array: {self._buffer[:100]!r}")
+        match = _LIMITED_BY.search(self._head) or _LIMITED_BY.search(self._tail)
+        return items, int(match.group(1)) if match else None, None
+
+
+try:
+    import ijson as _ijson
+except ImportError:
+    _ijson = None
+
+
+class _IjsonItems:
+    """Потоковый разбор через ijson (push-корутины)"""
+
+    def __init__(self, key: str):
+        self._items = _ijson.sendable_list()
+        self._meta = _ijson.sendable_list()
+        self._errors = _ijson.sendable_list()
+        self._coros = [
+            _ijson.items_coro(self._items, f"result.{key}.item", use_float=True),
+            _ijson.items_coro(self._meta, "result.LimitedBy", use_float=True),
+            _ijson.items_coro(self._errors, "error", use_float=True),
+        ]
+
+    def _drain(self) -> List[Any]:
+        items = list(self._items)
+        del self._items[:]
+        return items
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        for coro in self._coros:
+            coro.send(chunk)
+        return self._drain()
+
+    def close(self):
+        for coro in self._coros:
+            coro.close()
+        limited_by = int(self._meta[0]) if self._meta else None
+        error = self._errors[0] if self._errors else None
+        return self._drain(), limited_by, error
@@ -13,6 +13,15 @@ from app.routers import profiles, ai
 from app.vbai.registration import api_reg
 from app.toolset.reg import register_tools
 from app.migrations import run_migrations
+from app.http_pool import init_http_client, close_http_client
+from app.singleflight import singleflight
+from app.rate_limiter import limiter_stats
+from app.retry_policy import circuit_breakers
+from app.deadline import DeadlineMiddleware
+from app.cache import direct_cache
+from app.changes_watcher import changes_watcher
+from app.token_cache import token_cache
+from app.client_registry import client_registry
 
 # Настройка логирования
 logging.basicConfig(
@@ -46,6 +55,15 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("⚠️ Failed to connect to database")
     
+    # Общий HTTP транспорт для Direct API (keep-alive + HTTP/2)
+    await init_http_client()
+    
+    # Фоновая инвалидация кэша через changes
+    changes_watcher.start()
+    
+    # Кэш токенов профилей + опрос событий других воркеров
+    token_cache.start()
+    
     # Регистрация в api-vbai gateway
     try:
         api_reg()
@@ -64,6 +82,9 @@ async def lifespan(app: FastAPI):
     
     # ========== SHUTDOWN ==========
     logger.info(f"🛑 Shutting down {settings.SERVICE_NAME}...")
+    await changes_watcher.stop()
+    await token_cache.stop()
+    await close_http_client()
 
 
 app = FastAPI(
@@ -73,6 +94,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Срок запроса (X-Request-Timeout) для всех вызовов внутри него
+app.add_middleware(DeadlineMiddleware)
+
 # Подключаем роутеры
 app.include_router(profiles.router)
 app.include_router(ai.router)
@@ -99,6 +123,19 @@ async def health():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Счётчики клиентского слоя Direct API"""
+    return {
+        "singleflight": singleflight.stats(),
+        "cache": direct_cache.stats(),
+        "units": limiter_stats(),
+        "tokens": token_cache.stats(),
+        "clients": client_registry.stats(),
+        "breakers": circuit_breakers.stats(),
+    }
+
+
 @app.get("/live")
 async def liveness():
     """Liveness probe"""
@@ -37,12 +37,176 @@ async def run_migrations(session: AsyncSession):
         logger.warning(f"Migration note: {e}")
         await session.rollback()
     
+    # Зеркало структуры аккаунта (app/mirror.py)
+    for table, create_sql in MIRROR_TABLES.items():
+        await _create_table(session, table, create_sql)
+    # Промежуточные таблицы потоковой записи объявлений и фраз
+    for table in MIRROR_STAGED_TABLES:
+        await _create_table(
+            session, f"{table}_staging",
+            f"CREATE TABLE IF NOT EXISTS {table}_staging LIKE {table}"
+        )
+    
+    # Задания Reports API (app/reports.py)
+    await _create_table(session, "ydirect_report_jobs", REPORT_JOBS_TABLE)
+    
+    # Кэш закрытых дней отчётов (app/report_cache.py)
+    await _create_table(session, "ydirect_report_cache", REPORT_CACHE_TABLE)
+    
+    # События изменения профилей для кэша токенов (app/token_cache.py)
+    await _create_table(session, "ydirect_profile_events", PROFILE_EVENTS_TABLE)
+    
     # Будущие миграции добавлять здесь:
     # await _add_column_if_not_exists(session, "ydirect_profiles", "new_column", "VARCHAR(255)")
     
     logger.info("✅ Migrations completed")
 
 
+MIRROR_TABLES = {
+    "ydirect_mirror_state": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_state (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        changes_timestamp VARCHAR(32) DEFAULT NULL,
+        full_synced_at TIMESTAMP NULL DEFAULT NULL,
+        synced_at TIMESTAMP NULL DEFAULT NULL,
+        PRIMARY KEY (user_email, alias)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+    "ydirect_mirror_campaigns": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_campaigns (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        id BIGINT NOT NULL,
+        name VARCHAR(255) DEFAULT NULL,
+        state VARCHAR(32) DEFAULT NULL,
+        status VARCHAR(32) DEFAULT NULL,
+        data JSON NOT NULL,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_email, alias, id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+    "ydirect_mirror_adgroups": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_adgroups (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        id BIGINT NOT NULL,
+        campaign_id BIGINT NOT NULL,
+        name VARCHAR(255) DEFAULT NULL,
+        status VARCHAR(32) DEFAULT NULL,
+        data JSON NOT NULL,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_email, alias, id),
+        INDEX idx_mirror_adgroups_campaign (user_email, alias, campaign_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+    "ydirect_mirror_ads": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_ads (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        id BIGINT NOT NULL,
+        campaign_id BIGINT NOT NULL,
+        ad_group_id BIGINT NOT NULL,
+        status VARCHAR(32) DEFAULT NULL,
+        state VARCHAR(32) DEFAULT NULL,
+        data JSON NOT NULL,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_email, alias, id),
+        INDEX idx_mirror_ads_campaign (user_email, alias, campaign_id),
+        INDEX idx_mirror_ads_adgroup (user_email, alias, ad_group_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+    "ydirect_mirror_keywords": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_keywords (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        id BIGINT NOT NULL,
+        campaign_id BIGINT NOT NULL,
+        ad_group_id BIGINT NOT NULL,
+        keyword VARCHAR(4096) DEFAULT NULL,
+        status VARCHAR(32) DEFAULT NULL,
+        state VARCHAR(32) DEFAULT NULL,
+        data JSON NOT NULL,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_email, alias, id),
+        INDEX idx_mirror_keywords_campaign (user_email, alias, campaign_id),
+        INDEX idx_mirror_keywords_adgroup (user_email, alias, ad_group_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+    "ydirect_mirror_bidmodifiers": """
+    CREATE TABLE IF NOT EXISTS ydirect_mirror_bidmodifiers (
+        user_email VARCHAR(255) NOT NULL,
+        alias VARCHAR(255) NOT NULL,
+        id BIGINT NOT NULL,
+        campaign_id BIGINT NOT NULL,
+        ad_group_id BIGINT DEFAULT NULL,
+        type VARCHAR(64) DEFAULT NULL,
+        data JSON NOT NULL,
+        synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_email, alias, id),
+        INDEX idx_mirror_bidmodifiers_campaign (user_email, alias, campaign_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """,
+}
+
+MIRROR_STAGED_TABLES = ["ydirect_mirror_ads", "ydirect_mirror_keywords"]
+
+
+REPORT_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS ydirect_report_jobs (
+    id CHAR(32) NOT NULL,
+    user_email VARCHAR(255) DEFAULT NULL,
+    alias VARCHAR(255) DEFAULT NULL,
+    account_key VARCHAR(128) NOT NULL,
+    report_name VARCHAR(255) NOT NULL,
+    params JSON NOT NULL,
+    mode VARCHAR(16) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    error TEXT DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    INDEX idx_report_jobs_profile (user_email, alias)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+"""
+
+
+REPORT_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS ydirect_report_cache (
+    account_key VARCHAR(128) NOT NULL,
+    report_key CHAR(40) NOT NULL,
+    day DATE NOT NULL,
+    header JSON NOT NULL,
+    rows_json LONGTEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_key, report_key, day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+"""
+
+
+PROFILE_EVENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS ydirect_profile_events (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    user_email VARCHAR(255) NOT NULL,
+    alias VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    INDEX idx_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+"""
+
+
+async def _create_table(session: AsyncSession, table: str, create_sql: str):
+    """Создать таблицу если её нет"""
+    try:
+        await session.execute(text(create_sql))
+        await session.commit()
+        logger.info(f"✅ Table '{table}' ready")
+    except Exception as e:
+        logger.warning(f"Migration note ({table}): {e}")
+        await session.rollback()
+
+
 async def _add_column_if_not_exists(
     session: AsyncSession, 
     table: str, 
@@ -0,0 +1,483 @@
+"""
+Локальное зеркало структуры аккаунта Яндекс.Директ в MySQL
+
+Кампании, группы, объявления, фразы и корректировки ставок профиля
+(user_email + alias) хранятся в таблицах ydirect_mirror_* (app/migrations.py).
+Полная синхронизация обходит всё дерево, инкрементальная - только кампании,
+изменившиеся с прошлого Timestamp сервиса changes.
+Read-only endpoints (/ai/campaigns, /ai/adgroups, /ai/ads) могут отвечать
+из зеркала за миллисекунды вместо обхода API; чтение отдаёт модели
+app/domain.py, как typed-обходы клиента.
+
+Запись идёт короткими транзакциями по пачкам кампаний: DB-сессия
+не держится открытой во время запросов к Директу. Объявления и фразы -
+самые крупные выборки - по мере потокового разбора ответа
+(app/json_codec.py) пишутся порциями в промежуточные таблицы
+ydirect_mirror_*_staging (каждая порция - своя короткая сессия), без
+списка всей выборки в памяти. Затем одна короткая транзакция заменяет
+поддеревья пачки: DELETE + INSERT групп и корректировок + INSERT ... SELECT
+из промежуточных таблиц. Полная синхронизация
+сбрасывает full_synced_at в начале и ставит его только в конце, так что
+пока поддеревья пересобираются, чтение идёт из API, а не из полупустого
+зеркала. Одновременную синхронизацию профиля из нескольких воркеров
+исключает именованная блокировка MySQL (GET_LOCK).
+"""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import text, bindparam
+
+from app import deadline as request_deadline
+from app.database import AsyncSessionLocal, engine
+from app.direct_client import DeadlineExceeded, DirectAPIClient
+from app.domain import AdGroup, Campaign, TextAd
+from app.migrations import MIRROR_STAGED_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Лимит CampaignIds в SelectionCriteria adgroups/ads/keywords/bidmodifiers.get
+CAMPAIGNS_PER_REQUEST = 10
+
+# Объектов в одном INSERT при потоковой записи объявлений и фраз
+MIRROR_INSERT_BATCH = int(os.getenv("DIRECT_MIRROR_INSERT_BATCH", "1000"))
+
+BID_MODIFIER_FIELDS = {
+    "FieldNames": ["Id", "CampaignId", "AdGroupId", "Level", "Type"],
+    "MobileAdjustmentFieldNames": ["BidModifier", "OperatingSystemType"],
+    "TabletAdjustmentFieldNames": ["BidModifier", "OperatingSystemType"],
+    "DesktopAdjustmentFieldNames": ["BidModifier"],
+    "DemographicsAdjustmentFieldNames": ["Gender", "Age", "BidModifier", "Enabled"],
+    "RegionalAdjustmentFieldNames": ["RegionId", "BidModifier", "Enabled"],
+}
+
+# Таблица -> (колонки кроме user_email/alias/data, функция значений из объекта API)
+_TABLES = {
+    "ydirect_mirror_campaigns": (
+        ["id", "name", "state", "status"],
+        lambda o: [o["Id"], o.get("Name"), o.get("State"), o.get("Status")],
+    ),
+    "ydirect_mirror_adgroups": (
+        ["id", "campaign_id", "name", "status"],
+        lambda o: [o["Id"], o["CampaignId"], o.get("Name"), o.get("Status")],
+    ),
+    "ydirect_mirror_ads": (
+        ["id", "campaign_id", "ad_group_id", "status", "state"],
+        lambda o: [o["Id"], o["CampaignId"], o["AdGroupId"], o.get("Status"), o.get("State")],
+    ),
+    "ydirect_mirror_keywords": (
+        ["id", "campaign_id", "ad_group_id", "keyword", "status", "state"],
+        lambda o: [o["Id"], o["CampaignId"], o["AdGroupId"], o.get("Keyword"), o.get("Status"), o.get("State")],
+    ),
+    "ydirect_mirror_bidmodifiers": (
+        ["id", "campaign_id", "ad_group_id", "type"],
+        lambda o: [o["Id"], o["CampaignId"], o.get("AdGroupId"), o.get("Type")],
+    ),
+}
+
+_CHILD_TABLES = [
+    "ydirect_mirror_adgroups",
+    "ydirect_mirror_ads",
+    "ydirect_mirror_keywords",
+    "ydirect_mirror_bidmodifiers",
+]
+
+# Сколько ждать синхронизацию профиля, идущую в другом воркере (сек)
+SYNC_LOCK_TIMEOUT = int(os.getenv("DIRECT_MIRROR_LOCK_TIMEOUT", "600"))
+
+_sync_locks: Dict[tuple, asyncio.Lock] = {}
+
+
+class MirrorSyncBusy(Exception):
+    """Профиль синхронизирует другой воркер, блокировку не дождались"""
+
+
+class AccountMirror:
+    """
+    Зеркало одного профиля
+    """
+
+    def __init__(self, user_email: str, alias: str):
+        self.user_email = user_email
+        self.alias = alias
+
+    @property
+    def _profile(self) -> Dict[str, str]:
+        return {"user_email": self.user_email, "alias": self.alias}
+
+    # =========== STATE ===========
+
+    async def get_state(self) -> Optional[Dict[str, Any]]:
+        """
+        Состояние синхронизации (None - зеркало ещё не собиралось).
+        Чтение ограничено сроком запроса (app/deadline.py)
+        """
+        try:
+            async with request_deadline.bound():
+                async with AsyncSessionLocal() as session:
+                    result = await session.execute(text("""
+                        SELECT changes_timestamp, full_synced_at, synced_at
+                        FROM ydirect_mirror_state
+                        WHERE user_email = :user_email AND alias = :alias
+                    """), self._profile)
+                    row = result.fetchone()
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("mirror", "state") from None
+
+        if not row:
+            return None
+        return {"changes_timestamp": row[0], "full_synced_at": row[1], "synced_at": row[2]}
+
+    async def is_synced(self) -> bool:
+        state = await self.get_state()
+        return state is not None and state["full_synced_at"] is not None
+
+    async def _reset_full_synced(self):
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("""
+                UPDATE ydirect_mirror_state SET full_synced_at = NULL
+                WHERE user_email = :user_email AND alias = :alias
+            """), self._profile)
+            await session.commit()
+
+    async def _save_state(self, timestamp: str, full: bool):
+        full_synced_at = "NOW()" if full else "full_synced_at"
+        async with AsyncSessionLocal() as session:
+            await session.execute(text(f"""
+                INSERT INTO ydirect_mirror_state (user_email, alias, changes_timestamp, full_synced_at, synced_at)
+                VALUES (:user_email, :alias, :timestamp, NOW(), NOW())
+                ON DUPLICATE KEY UPDATE
+                    changes_timestamp = VALUES(changes_timestamp),
+                    full_synced_at = {full_synced_at},
+                    synced_at = NOW()
+            """), {**self._profile, "timestamp": timestamp})
+            await session.commit()
+
+    # =========== SYNC ===========
+
+    async def sync(self, client: DirectAPIClient, full: bool = False) -> Dict[str, int]:
+        """
+        Синхронизировать зеркало.
+        Без full - инкрементально, если есть Timestamp прошлой синхронизации.
+        client лучше создавать с cache=False, чтобы читать свежие данные.
+        """
+        lock = _sync_locks.setdefault((self.user_email, self.alias), asyncio.Lock())
+        async with lock, self._db_lock():
+            # Состояние - после блокировки: другой воркер мог только что закончить
+            state = await self.get_state()
+            if full or not state or not state["changes_timestamp"] or not state["full_synced_at"]:
+                return await self._full_sync(client)
+            return await self._incremental_sync(client, state["changes_timestamp"])
+
+    @asynccontextmanager
+    async def _db_lock(self):
+        """
+        Блокировка синхронизации профиля между воркерами (GET_LOCK).
+        Именованная блокировка принадлежит соединению, поэтому одно
+        соединение пула занято до конца синхронизации (без транзакции).
+        """
+        key = hashlib.sha1(f"{self.user_email}/{self.alias}".encode()).hexdigest()
+        name = f"ydirect_mirror:{key}"
+        timeout = int(request_deadline.clamp(SYNC_LOCK_TIMEOUT))
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}
+            )
+            if result.scalar() != 1:
+                raise MirrorSyncBusy(f"Зеркало {self.alias} уже синхронизируется, попробуйте позже")
+            try:
+                yield
+            finally:
+                await conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+    async def _full_sync(self, client: DirectAPIClient) -> Dict[str, int]:
+        logger.info(f"Mirror full sync: {self.user_email}/{self.alias}")
+
+        # Пока дерево пересобирается, зеркало не считается собранным;
+        # если синхронизация упадёт, следующая снова будет полной
+        await self._reset_full_synced()
+
+        # Timestamp берём до обхода, чтобы изменения во время синхронизации
+        # попали в следующую инкрементальную
+        timestamp = (await client._call("changes", "checkDictionaries", {})).get("Timestamp")
+
+        campaigns = await client.get_campaigns()
+        campaign_ids = [c["Id"] for c in campaigns]
+        await self._replace("ydirect_mirror_campaigns", campaigns)
+        # Поддеревья живых кампаний заменяются по пачкам в _sync_children,
+        # здесь - только хвосты кампаний, которых в аккаунте больше нет
+        await self._delete_stale_children(campaign_ids)
+
+        counts = {"campaigns": len(campaigns)}
+        await self._sync_children(client, campaign_ids, counts)
+
+        await self._save_state(timestamp, full=True)
+        return counts
+
+    async def _incremental_sync(self, client: DirectAPIClient, timestamp: str) -> Dict[str, int]:
+        result = await client._call("changes", "checkCampaigns", {"Timestamp": timestamp})
+        changed = result.get("Campaigns", [])
+        new_timestamp = result.get("Timestamp", timestamp)
+
+        counts = {"changed_campaigns": len(changed)}
+
+        if changed:
+            # Список кампаний - один дешёвый вызов, заодно видно удалённые
+            campaigns = await client.get_campaigns()
+            current_ids = {c["Id"] for c in campaigns}
+            mirrored_ids = await self._mirrored_campaign_ids()
+            removed = list(mirrored_ids - current_ids)
+
+            await self._replace("ydirect_mirror_campaigns", campaigns)
+            if removed:
+                await self._delete_children(removed)
+
+            # Новые кампании и кампании с изменениями внутри - пересобираем поддерево
+            children = [
+                c["CampaignId"] for c in changed
+                if "CHILDREN" in c.get("ChangesIn", []) or c["CampaignId"] not in mirrored_ids
+            ]
+            children = [cid for cid in children if cid in current_ids]
+            counts["campaigns"] = len(campaigns)
+            counts["removed_campaigns"] = len(removed)
+            await self._sync_children(client, children, counts)
+
+        await self._save_state(new_timestamp, full=False)
+        return counts
+
+    async def _sync_children(
+        self,
+        client: DirectAPIClient,
+        campaign_ids: List[int],
+        counts: Dict[str, int]
+    ):
+        """Пересобрать группы/объявления/фразы/корректировки кампаний пачками"""
+        for start in range(0, len(campaign_ids), CAMPAIGNS_PER_REQUEST):
+            chunk = campaign_ids[start:start + CAMPAIGNS_PER_REQUEST]
+
+            ad_groups = await self._fetch(client, "adgroups", "AdGroups", chunk, {
+                "FieldNames": client.AD_GROUP_FIELDS
+            })
+            bid_modifiers = await self._fetch(
+                client, "bidmodifiers", "BidModifiers", chunk, BID_MODIFIER_FIELDS,
+                criteria={"Levels": ["CAMPAIGN", "AD_GROUP"]}
+            )
+
+            # Объявления и фразы - потоком в промежуточные таблицы
+            await self._clear_staging()
+            ads = await self._stage(client, "ads", "Ads", "ydirect_mirror_ads", chunk, {
+                "FieldNames": client.AD_FIELDS,
+                "TextAdFieldNames": client.TEXT_AD_FIELDS
+            })
+            keywords = await self._stage(client, "keywords", "Keywords", "ydirect_mirror_keywords", chunk, {
+                "FieldNames": client.KEYWORD_FIELDS
+            })
+
+            # Одна короткая транзакция на пачку
+            async with AsyncSessionLocal() as session:
+                await self._delete_children(chunk, session)
+                await self._insert(session, "ydirect_mirror_adgroups", ad_groups)
+                await self._insert(session, "ydirect_mirror_bidmodifiers", bid_modifiers)
+                for table in MIRROR_STAGED_TABLES:
+                    await self._publish_staging(session, table)
+                await session.commit()
+
+            for name, count in (
+                ("adgroups", len(ad_groups)), ("ads", ads),
+                ("keywords", keywords), ("bidmodifiers", len(bid_modifiers))
+            ):
+                counts[name] = counts.get(name, 0) + count
+
+    async def _fetch(
+        self,
+        client: DirectAPIClient,
+        service: str,
+        result_key: str,
+        campaign_ids: List[int],
+        fields: Dict[str, Any],
+        criteria: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        params = {
+            "SelectionCriteria": {"CampaignIds": campaign_ids, **(criteria or {})},
+            **fields
+        }
+        return await client._collect(
+            client._iter_pages(service, "get", params, result_key, prefetch=True)
+        )
+
+    async def _stage(
+        self,
+        client: DirectAPIClient,
+        service: str,
+        result_key: str,
+        table: str,
+        campaign_ids: List[int],
+        fields: Dict[str, Any]
+    ) -> int:
+        """
+        Потоковый get с записью в <table>_staging порциями по
+        MIRROR_INSERT_BATCH, каждая порция - своей короткой сессией;
+        в памяти не больше одной порции
+        """
+        params = {"SelectionCriteria": {"CampaignIds": campaign_ids}, **fields}
+        batch: List[Dict] = []
+        count = 0
+        async for item in client._iter_items(service, "get", params, result_key):
+            batch.append(item)
+            if len(batch) >= MIRROR_INSERT_BATCH:
+                await self._insert_staging(table, batch)
+                count += len(batch)
+                batch = []
+        await self._insert_staging(table, batch)
+        return count + len(batch)
+
+    # =========== DB WRITE ===========
+
+    async def _mirrored_campaign_ids(self) -> set:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT id FROM ydirect_mirror_campaigns
+                WHERE user_email = :user_email AND alias = :alias
+            """), self._profile)
+            return {row[0] for row in result.fetchall()}
+
+    async def _replace(self, table: str, items: List[Dict]):
+        """Заменить все строки профиля в таблице"""
+        async with AsyncSessionLocal() as session:
+            await session.execute(text(f"""
+                DELETE FROM {table} WHERE user_email = :user_email AND alias = :alias
+            """), self._profile)
+            await self._insert(session, table, items)
+            await session.commit()
+
+    async def _delete_children(self, campaign_ids: Optional[List[int]], session=None):
+        """Удалить поддеревья кампаний (None - все)"""
+        if session is None:
+            async with AsyncSessionLocal() as own_session:
+                await self._delete_children(campaign_ids, own_session)
+                await own_session.commit()
+            return
+
+        for table in _CHILD_TABLES:
+            if campaign_ids is None:
+                await session.execute(text(f"""
+                    DELETE FROM {table} WHERE user_email = :user_email AND alias = :alias
+                """), self._profile)
+            else:
+                query = text(f"""
+                    DELETE FROM {table}
+                    WHERE user_email = :user_email AND alias = :alias
+                      AND campaign_id IN :campaign_ids
+                """).bindparams(bindparam("campaign_ids", expanding=True))
+                await session.execute(query, {**self._profile, "campaign_ids": campaign_ids})
+
+    async def _delete_stale_children(self, campaign_ids: List[int]):
+        """Удалить поддеревья всех кампаний, кроме campaign_ids"""
+        if not campaign_ids:
+            await self._delete_children(None)
+            return
+        async with AsyncSessionLocal() as session:
+            for table in _CHILD_TABLES:
+                query = text(f"""
+                    DELETE FROM {table}
+                    WHERE user_email = :user_email AND alias = :alias
+                      AND campaign_id NOT IN :campaign_ids
+                """).bindparams(bindparam("campaign_ids", expanding=True))
+                await session.execute(query, {**self._profile, "campaign_ids": campaign_ids})
+            await session.commit()
+
+    async def _insert_staging(self, table: str, items: List[Dict]):
+        if not items:
+            return
+        async with AsyncSessionLocal() as session:
+            await self._insert(session, table, items, into=f"{table}_staging")
+            await session.commit()
+
+    async def _clear_staging(self):
+        """Остатки прерванной синхронизации профиля в промежуточных таблицах"""
+        async with AsyncSessionLocal() as session:
+            for table in MIRROR_STAGED_TABLES:
+                await session.execute(text(f"""
+                    DELETE FROM {table}_staging WHERE user_email = :user_email AND alias = :alias
+                """), self._profile)
+            await session.commit()
+
+    async def _publish_staging(self, session, table: str):
+        """Перенести строки профиля из <table>_staging в table (в транзакции session)"""
+        columns = ", ".join(["user_email", "alias", *_TABLES[table][0], "data"])
+        await session.execute(text(f"""
+            INSERT INTO {table} ({columns})
+            SELECT {columns} FROM {table}_staging
+            WHERE user_email = :user_email AND alias = :alias
+        """), self._profile)
+        await session.execute(text(f"""
+            DELETE FROM {table}_staging WHERE user_email = :user_email AND alias = :alias
+        """), self._profile)
+
+    async def _insert(self, session, table: str, items: List[Dict], into: Optional[str] = None):
+        """Вставить объекты API в table (или в into с колонками table)"""
+        if not items:
+            return
+        columns, values = _TABLES[table]
+        placeholders = ", ".join(f":{c}" for c in columns)
+        query = text(f"""
+            INSERT INTO {into or table} (user_email, alias, {", ".join(columns)}, data)
+            VALUES (:user_email, :alias, {placeholders}, :data)
+        """)
+        rows = []
+        for item in items:
+            row = dict(zip(columns, values(item)))
+            row.update(self._profile)
+            row["data"] = json.dumps(item, ensure_ascii=False)
+            rows.append(row)
+        await session.execute(query, rows)
+
+    # =========== DB READ ===========
+
+    async def _select(
+        self,
+        model,
+        table: str,
+        where: str = "",
+        params: Optional[Dict] = None,
+        expanding=()
+    ) -> List[Any]:
+        """Объекты профиля из table моделями model"""
+        query = text(f"""
+            SELECT data FROM {table}
+            WHERE user_email = :user_email AND alias = :alias {where}
+            ORDER BY id
+        """)
+        if expanding:
+            query = query.bindparams(*(bindparam(name, expanding=True) for name in expanding))
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query, {**self._profile, **(params or {})})
+            return [model.from_api(json.loads(row[0])) for row in result.fetchall()]
+
+    async def iter_campaigns(self, states: Optional[List[str]] = None) -> AsyncIterator[List[Campaign]]:
+        """Кампании из зеркала (одной страницей, как DirectAPIClient.iter_campaigns(typed=True))"""
+        if states:
+            yield await self._select(
+                Campaign, "ydirect_mirror_campaigns", "AND state IN :states",
+                {"states": states}, expanding=("states",)
+            )
+        else:
+            yield await self._select(Campaign, "ydirect_mirror_campaigns")
+
+    async def get_ad_groups(self, campaign_id: int) -> List[AdGroup]:
+        """Группы кампании из зеркала"""
+        return await self._select(
+            AdGroup, "ydirect_mirror_adgroups", "AND campaign_id = :campaign_id",
+            {"campaign_id": campaign_id}
+        )
+
+    async def iter_ads(self, ad_group_id: int) -> AsyncIterator[List[TextAd]]:
+        """Объявления группы из зеркала"""
+        yield await self._select(
+            TextAd, "ydirect_mirror_ads", "AND ad_group_id = :ad_group_id",
+            {"ad_group_id": ad_group_id}
+        )
@@ -0,0 +1,325 @@
+"""
+Разбор поисковых запросов (SEARCH_QUERY_PERFORMANCE_REPORT)
+
+Конвейер без накопления отчёта в памяти:
+движок отчётов -> потоковый TSV (TsvReader) -> инкрементальная свёртка
+по нормализованному запросу -> выгрузка кусками (CSV / JSONL / Parquet).
+
+Память ограничена числом уникальных нормализованных запросов, а оно -
+DIRECT_QUERY_MINING_MAX_KEYS: при переполнении хвост с наименьшим числом
+показов сбрасывается в общую строку "(прочие)". Вытесненный запрос, если
+он встретится в отчёте снова, начинает новую строку с нуля: его суммы до
+вытеснения остаются в "(прочие)" (итог по всем строкам при этом точный).
+Помнить все вытесненные ключи значило бы снова держать в памяти все запросы.
+"""
+import io
+import os
+import re
+import csv
+import json
+import time
+import heapq
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.direct_client import DirectAPIClient
+from app.reports import report_engine, report_name, composite_job_id, ReportPendingError
+from app.report_shards import shard_ranges
+
+logger = logging.getLogger(__name__)
+
+# Максимум уникальных запросов в свёртке
+QUERY_MINING_MAX_KEYS = int(os.getenv("DIRECT_QUERY_MINING_MAX_KEYS", "200000"))
+# Строк в одном куске выгрузки
+QUERY_MINING_CHUNK_ROWS = int(os.getenv("DIRECT_QUERY_MINING_CHUNK_ROWS", "5000"))
+# Сколько разных написаний запроса различать (дальше счётчик не растёт)
+QUERY_MINING_MAX_VARIANTS = int(os.getenv("DIRECT_QUERY_MINING_MAX_VARIANTS", "50"))
+
+QUERY_FIELDS = ["Query", "Impressions", "Clicks", "Cost", "Conversions"]
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_COLUMNS = ["query", "variants", "impressions", "clicks", "ctr", "cost_rub", "avg_cpc_rub", "conversions"]
+OTHER_QUERY = "(прочие)"
+
+# Операторы Директа и пунктуация, не меняющие смысл запроса
+_OPERATORS = re.compile(r"[!+\"\[\]()«»,.?;:]")
+_SPACES = re.compile(r"\s+")
+
+# Позиции сумм: показы, клики, расход (микро), конверсии, разных написаний
+_IMPRESSIONS, _CLICKS, _COST, _CONVERSIONS, _VARIANTS = range(5)
+
+
+def normalise_query(query: Optional[str]) -> str:
+    """Регистр, ё/е, операторы и лишние пробелы не различаются"""
+    if not query:
+        return ""
+    query = query.lower().replace("ё", "е")
+    query = _OPERATORS.sub(" ", query)
+    return _SPACES.sub(" ", query).strip()
+
+
+class QueryAggregator:
+    """
+    Инкрементальная свёртка строк отчёта по нормализованному запросу
+    """
+
+    def __init__(self, max_keys: int = QUERY_MINING_MAX_KEYS, max_variants: int = QUERY_MINING_MAX_VARIANTS):
+        self.max_keys = max_keys
+        self.max_variants = max_variants
+        self._sums: Dict[str, List[int]] = {}
+        # Написания запроса: hash одного исходного запроса или set хэшей.
+        # Строка отчёта - это запрос в разрезе кампании/группы/дня, поэтому
+        # одно написание приходит многими строками и считать строки нельзя
+        self._seen: Dict[str, Any] = {}
+        self._other = [0, 0, 0, 0, 0]
+        self.rows = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sums)
+
+    def add(self, query: Optional[str], impressions: int, clicks: int, cost: int, conversions: float):
+        key = normalise_query(query)
+        sums = self._sums.get(key)
+        if sums is None:
+            if len(self._sums) >= self.max_keys:
+                self._evict()
+            sums = [0, 0, 0, 0, 0.0]
+            self._sums[key] = sums
+        sums[_IMPRESSIONS] += impressions or 0
+        sums[_CLICKS] += clicks or 0
+        sums[_COST] += cost or 0
+        sums[_CONVERSIONS] += conversions or 0
+        self._count_variant(key, sums, query)
+        self.rows += 1
+
+    def _count_variant(self, key: str, sums: List[int], query: Optional[str]):
+        variant = hash(query)
+        seen = self._seen.get(key)
+        if seen is None:
+            self._seen[key] = variant
+            sums[_VARIANTS] = 1
+        elif isinstance(seen, set):
+            if variant not in seen and len(seen) < self.max_variants:
+                seen.add(variant)
+                sums[_VARIANTS] = len(seen)
+        elif seen != variant:
+            self._seen[key] = {seen, variant}
+            sums[_VARIANTS] = 2
+
+    def _evict(self):
+        """
+        Оставить половину запросов с наибольшим числом показов, хвост - в "(прочие)".
+        Написания разных ключей заведомо разные, поэтому их число просто складывается.
+        """
+        keep = heapq.nlargest(
+            self.max_keys // 2, self._sums.items(), key=lambda item: item[1][_IMPRESSIONS]
+        )
+        kept = dict(keep)
+        for key, sums in self._sums.items():
+            if key not in kept:
+                for i, value in enumerate(sums):
+                    self._other[i] += value
+                del self._seen[key]
+                self.evicted += 1
+        self._sums = kept
+        logger.debug(f"Query mining: evicted tail, {self.evicted} queries folded into other")
+
+    def items(self, sort_by: str = "cost", min_impressions: int = 0) -> List[Tuple[str, List[int]]]:
+        """Запросы с суммами, отсортированные по убыванию sort_by"""
+        index = {"cost": _COST, "clicks": _CLICKS, "impressions": _IMPRESSIONS, "conversions": _CONVERSIONS}[sort_by]
+        items = [
+            (key, sums) for key, sums in self._sums.items()
+            if sums[_IMPRESSIONS] >= min_impressions
+        ]
+        items.sort(key=lambda item: item[1][index], reverse=True)
+        if self.evicted:
+            items.append((OTHER_QUERY, self._other))
+        return items
+
+
+async def mine_queries(
+    client: DirectAPIClient,
+    date_from: str,
+    date_to: str,
+    campaign_ids: Optional[List[int]] = None,
+    mode: str = "auto",
+    wait: Optional[float] = None,
+    owner: Optional[Dict[str, str]] = None,
+    aggregator: Optional[QueryAggregator] = None
+) -> QueryAggregator:
+    """
+    Поставить отчёт по запросам (длинный период - шардами, все сразу) и
+    свернуть его потоково. wait - общий лимит ожидания на все шарды.
+    Не дождались какого-то шарда - ReportPendingError с составным job_id
+    всех шардов и reissue: свёртка не сохраняется, забрать её можно только
+    повтором запроса (шарды к тому времени будут готовы).
+    """
+    filters = []
+    if campaign_ids:
+        filters.append({
+            "Field": "CampaignId",
+            "Operator": "IN",
+            "Values": [str(cid) for cid in campaign_ids]
+        })
+    params = client._stats_params(
+        date_from, date_to, "SEARCH_QUERY_PERFORMANCE_REPORT", QUERY_FIELDS, filters
+    )
+
+    jobs = []
+    for shard_from, shard_to in shard_ranges(date_from, date_to):
+        shard_params = {
+            **params,
+            "SelectionCriteria": {**params["SelectionCriteria"], "DateFrom": shard_from, "DateTo": shard_to},
+        }
+        shard_params["ReportName"] = report_name("queries", shard_params)
+        jobs.append(await report_engine.submit(client, shard_params, mode=mode, owner=owner))
+
+    if aggregator is None:
+        aggregator = QueryAggregator()
+    deadline = None if wait is None else time.monotonic() + wait
+    # Шарды готовятся параллельно, читаем по одному - в памяти только свёртка
+    try:
+        for job in jobs:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.1)
+            async with report_engine.reader(job, remaining) as reader:
+                header = await reader.read_header()
+                positions = [header.index(field) for field in QUERY_FIELDS]
+                async for row in reader:
+                    aggregator.add(*(row[i] for i in positions))
+    except ReportPendingError:
+        raise ReportPendingError(composite_job_id(jobs), reissue=True) from None
+
+    logger.info(
+        f"Query mining: {aggregator.rows} rows -> {len(aggregator)} queries "
+        f"({len(jobs)} shards, {aggregator.evicted} evicted)"
+    )
+    return aggregator
+
+
+# =========== EXPORT ===========
+
+def _export_rows(items: List[Tuple[str, List[int]]]) -> Iterator[List[Any]]:
+    for query, sums in items:
+        impressions, clicks, cost = sums[_IMPRESSIONS], sums[_CLICKS], sums[_COST]
+        yield [
+            query,
+            sums[_VARIANTS],
+            impressions,
+            clicks,
+            round(clicks / impressions * 100, 2) if impressions else 0.0,
+            round(cost / 1_000_000, 2),
+            round(cost / clicks / 1_000_000, 2) if clicks else 0.0,
+            round(sums[_CONVERSIONS], 2),
+        ]
+
+
+def iter_csv(items: List[Tuple[str, List[int]]], chunk_rows: int = QUERY_MINING_CHUNK_ROWS) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in _export_rows(items):
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(items: List[Tuple[str, List[int]]], chunk_rows: int = QUERY_MINING_CHUNK_ROWS) -> Iterator[str]:
+    lines: List[str] = []
+    for row in _export_rows(items):
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Файл только на запись: отдаёт накопленные байты кусками, но tell()
+    продолжает считать от начала файла (нужно для смещений в футере Parquet)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_parquet(items: List[Tuple[str, List[int]]], chunk_rows: int = QUERY_MINING_CHUNK_ROWS) -> Iterator[bytes]:
+    """Parquet кусками (одна row group на кусок); нужен pyarrow"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("query", pa.string()), ("variants", pa.int64()), ("impressions", pa.int64()),
+        ("clicks", pa.int64()), ("ctr", pa.float64()), ("cost_rub", pa.float64()),
+        ("avg_cpc_rub", pa.float64()), ("conversions", pa.float64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    chunk: List[List[Any]] = []
+    for row in _export_rows(items):
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(EXPORT_COLUMNS, r)) for r in chunk], schema=schema
+            ))
+            chunk = []
+            yield sink.take()
+    if chunk:
+        writer.write_table(pa.Table.from_pylist(
+            [dict(zip(EXPORT_COLUMNS, r)) for r in chunk], schema=schema
+        ))
+    writer.close()
+    yield sink.take()
+
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_export(items: List[Tuple[str, List[int]]], fmt: str) -> Iterator[Any]:
+    if fmt == "csv":
+        return iter_csv(items)
+    if fmt == "jsonl":
+        return iter_jsonl(items)
+    if fmt == "parquet":
+        return iter_parquet(items)
+    raise ValueError(f"Unknown export format: {fmt}")
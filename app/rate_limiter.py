@@ -0,0 +1,220 @@
+"""
+Ограничитель запросов к Яндекс Директ API по баллам (Units)
+
+Direct API v5 возвращает заголовок `Units: spent/remaining/limit`.
+Для каждого аккаунта (токен + Client-Login) держим:
+- семафор на количество одновременных запросов (ошибка 506);
+- token bucket по баллам: баллы восстанавливаются равномерно в течение суток,
+  при подходе к лимиту запросы ждут в очереди, а не падают с ошибкой 152.
+
+Запрос резервирует баллы по текущей средней стоимости и при выходе снимает
+ровно свой резерв (средняя за это время могла измениться). Лимитеры
+аккаунтов, которыми долго не пользовались, выселяются; клиент берёт
+лимитер через get_limiter() на каждый запрос, так что после выселения
+аккаунт получает новый, а не делит очередь со старым.
+"""
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Dict, Tuple
+
+from app import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_PER_ACCOUNT = int(os.getenv("DIRECT_MAX_CONCURRENT_PER_ACCOUNT", "4"))
+# Сколько максимум ждать баллы/слот перед запросом (сек)
+UNITS_MAX_WAIT = float(os.getenv("DIRECT_UNITS_MAX_WAIT", "30"))
+# Ниже этой доли от суточного лимита начинаем растягивать запросы
+UNITS_LOW_WATERMARK = float(os.getenv("DIRECT_UNITS_LOW_WATERMARK", "0.1"))
+# Лимитер выселяется после стольких секунд без запросов
+LIMITER_IDLE_TTL = float(os.getenv("DIRECT_LIMITER_IDLE_TTL", "3600"))
+# Как часто просматривать лимитеры на простаивающие (сек)
+LIMITER_SWEEP_INTERVAL = 60.0
+
+# Коды ошибок Direct API, связанные с ограничениями
+ERROR_NOT_ENOUGH_UNITS = 152      # недостаточно баллов
+ERROR_TOO_MANY_CONNECTIONS = 506  # превышено число одновременных запросов
+ERROR_REQUEST_LIMIT = 56          # превышен лимит запросов к методу
+
+THROTTLING_CODES = (ERROR_NOT_ENOUGH_UNITS, ERROR_TOO_MANY_CONNECTIONS, ERROR_REQUEST_LIMIT)
+
+SECONDS_PER_DAY = 86400
+
+
+def parse_units(header: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """Разобрать заголовок Units: '10/20828/64000' -> (spent, remaining, limit)"""
+    if not header:
+        return None
+    try:
+        spent, remaining, limit = (int(part) for part in header.split("/"))
+    except ValueError:
+        return None
+    return spent, remaining, limit
+
+
+class AccountLimiter:
+    """
+    Лимитер одного аккаунта
+    """
+
+    def __init__(self, key: str, max_concurrent: int = MAX_CONCURRENT_PER_ACCOUNT):
+        self.key = key
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.updated_at = 0.0
+        # Средняя стоимость запроса в баллах (EMA)
+        self.avg_cost = 10.0
+        # Сериализует ожидание баллов, чтобы очередь шла по порядку
+        self._pacing_lock = asyncio.Lock()
+        self._reserved = 0.0
+        # Запросов, взявших резерв и ещё не отпустивших его
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def refill_rate(self) -> float:
+        """Скорость восстановления баллов (баллов/сек)"""
+        return (self.limit or 0) / SECONDS_PER_DAY
+
+    def available(self) -> Optional[float]:
+        """Оценка доступных баллов на текущий момент"""
+        if self.remaining is None:
+            return None
+        elapsed = time.monotonic() - self.updated_at
+        estimate = self.remaining + elapsed * self.refill_rate - self._reserved
+        return min(estimate, float(self.limit or estimate))
+
+    def pacing_delay(self) -> float:
+        """Сколько нужно подождать, чтобы хватило баллов на запрос"""
+        available = self.available()
+        if available is None or not self.limit:
+            return 0.0
+        # Пока баллов много - не тормозим
+        if available - self.avg_cost > self.limit * UNITS_LOW_WATERMARK:
+            return 0.0
+        reserve = self.limit * UNITS_LOW_WATERMARK / 2
+        deficit = self.avg_cost + reserve - available
+        if deficit <= 0 or self.refill_rate <= 0:
+            return 0.0
+        return deficit / self.refill_rate
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self._pacing_lock.locked()
+
+    async def acquire(self) -> float:
+        """
+        Дождаться баллов и слота для запроса; вернуть взятый резерв.
+        Ожидание не выходит за срок запроса (app/deadline.py): не успели -
+        asyncio.TimeoutError
+        """
+        self.last_used = time.monotonic()
+        async with request_deadline.bound():
+            async with self._pacing_lock:
+                delay = self.pacing_delay()
+                if delay > 0:
+                    wait = min(delay, UNITS_MAX_WAIT)
+                    left = request_deadline.remaining()
+                    if left is not None and left < wait:
+                        # Баллов к сроку не накопится - не держим очередь зря
+                        raise asyncio.TimeoutError()
+                    logger.info(f"Units low for {self.key}: waiting {wait:.1f}s (remaining={self.remaining})")
+                    await asyncio.sleep(wait)
+                reserved = self.avg_cost
+                self._reserved += reserved
+                self.in_flight += 1
+            try:
+                await self.semaphore.acquire()
+            except BaseException:
+                # Отмена или срок в очереди за слотом - резерв не должен остаться навсегда
+                self._unreserve(reserved)
+                raise
+        return reserved
+
+    def release(self, reserved: float):
+        """Отпустить слот и снять резерв, взятый acquire()"""
+        self.semaphore.release()
+        self._unreserve(reserved)
+
+    def _unreserve(self, reserved: float):
+        self._reserved = max(0.0, self._reserved - reserved)
+        self.in_flight -= 1
+        self.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator["AccountLimiter"]:
+        """Баллы и слот на время запроса"""
+        reserved = await self.acquire()
+        try:
+            yield self
+        finally:
+            self.release(reserved)
+
+    def update_units(self, header: Optional[str]):
+        """Обновить состояние по заголовку Units ответа"""
+        units = parse_units(header)
+        if units is None:
+            return
+        spent, remaining, limit = units
+        self.remaining = remaining
+        self.limit = limit
+        self.updated_at = time.monotonic()
+        if spent > 0:
+            self.avg_cost = self.avg_cost * 0.8 + spent * 0.2
+
+    def throttle_delay(self, code: int, attempt: int) -> Optional[float]:
+        """
+        Пауза перед повтором после ошибки ограничения.
+        None - повторять бессмысленно (ждать дольше UNITS_MAX_WAIT).
+        """
+        if code == ERROR_NOT_ENOUGH_UNITS:
+            self.remaining = 0
+            self.updated_at = time.monotonic()
+            if self.refill_rate <= 0:
+                return None
+            delay = self.avg_cost / self.refill_rate
+            return delay if delay <= UNITS_MAX_WAIT else None
+        if code in (ERROR_TOO_MANY_CONNECTIONS, ERROR_REQUEST_LIMIT):
+            return min(2.0 ** attempt, UNITS_MAX_WAIT)
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "remaining": self.remaining,
+            "limit": self.limit,
+            "avg_cost": round(self.avg_cost, 1),
+        }
+
+
+_limiters: Dict[str, AccountLimiter] = {}
+_last_sweep = time.monotonic()
+
+
+def get_limiter(key: str) -> AccountLimiter:
+    """Получить лимитер аккаунта (один на процесс)"""
+    now = time.monotonic()
+    if now - _last_sweep > LIMITER_SWEEP_INTERVAL:
+        _sweep(now)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = AccountLimiter(key)
+        _limiters[key] = limiter
+    return limiter
+
+
+def _sweep(now: float):
+    """Выселить лимитеры без запросов дольше LIMITER_IDLE_TTL"""
+    global _last_sweep
+    _last_sweep = now
+    for key, limiter in list(_limiters.items()):
+        if limiter.idle and now - limiter.last_used > LIMITER_IDLE_TTL:
+            del _limiters[key]
+
+
+def limiter_stats() -> Dict[str, Dict]:
+    """Текущие показания Units по аккаунтам"""
+    return {key: limiter.stats() for key, limiter in _limiters.items()}
@@ -0,0 +1,159 @@
+"""
+Пересборка строк отчёта: суммирование базовых метрик и пересчёт производных
+
+Производные метрики (Ctr, AvgCpc, ConversionRate, ...) нельзя усреднять
+между днями/шардами - они пересчитываются из сумм базовых метрик.
+Колонки целей (Conversions_<goal>_<model>) пересчитываются с тем же суффиксом.
+
+Измерения перечислены явно: метрика, которую нельзя ни сложить, ни
+пересчитать из сумм (средние позиции, GoalsRoi, WeightedCtr, ...), не
+становится измерением молча - такой отчёт отклоняется required_fields().
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.report_parser import base_field
+
+# Метрики, которые можно складывать
+ADDITIVE_FIELDS = frozenset({
+    "Impressions", "Clicks", "Cost", "Conversions", "Revenue", "Profit",
+    "Sessions", "Bounces",
+})
+
+# Производная метрика -> (числитель, знаменатель, множитель)
+DERIVED_FIELDS: Dict[str, Tuple[str, str, float]] = {
+    "Ctr": ("Clicks", "Impressions", 100.0),
+    "AvgCpc": ("Cost", "Clicks", 1.0),
+    "AvgCpm": ("Cost", "Impressions", 1000.0),
+    "ConversionRate": ("Conversions", "Clicks", 100.0),
+    "CostPerConversion": ("Cost", "Conversions", 1.0),
+    "BounceRate": ("Bounces", "Sessions", 100.0),
+}
+
+# Деньги в производных - целые микроединицы, как в отчёте
+MONEY_DERIVED = frozenset({"AvgCpc", "AvgCpm", "CostPerConversion"})
+
+# Поля-измерения Reports API: по ним строки группируются
+DIMENSION_FIELDS = frozenset({
+    "Date", "Week", "Month", "Quarter", "Year",
+    "CampaignId", "CampaignName", "CampaignType", "CampaignUrlPath",
+    "AdGroupId", "AdGroupName", "AdId", "AdFormat",
+    "Criteria", "CriteriaId", "CriteriaType",
+    "Criterion", "CriterionId", "CriterionType",
+    "Query", "MatchType", "MatchedKeyword",
+    "AdNetworkType", "Placement", "ExternalNetworkName", "Slot",
+    "Device", "MobilePlatform", "CarrierType", "Age", "Gender", "IncomeGrade",
+    "LocationOfPresenceId", "LocationOfPresenceName",
+    "TargetingLocationId", "TargetingLocationName", "TargetingCategory",
+    "ClickType", "RlAdjustmentId",
+})
+
+
+def is_metric(column: str) -> bool:
+    return base_field(column) not in DIMENSION_FIELDS
+
+
+def non_additive(fields: Sequence[str]) -> List[str]:
+    """Метрики, которые нельзя свернуть по дням/шардам/измерениям"""
+    return [
+        column for column in fields
+        if is_metric(column)
+        and base_field(column) not in ADDITIVE_FIELDS
+        and base_field(column) not in DERIVED_FIELDS
+    ]
+
+
+def required_fields(fields: Sequence[str]) -> List[str]:
+    """
+    Поля отчёта + базовые метрики, нужные для пересчёта производных.
+    ValueError - в полях есть метрика, которую нельзя свернуть.
+    """
+    rejected = non_additive(fields)
+    if rejected:
+        raise ValueError(
+            f"Метрики {', '.join(rejected)} нельзя сложить по дням и шардам"
+        )
+    result = list(fields)
+    for column in fields:
+        field = base_field(column)
+        if field in DERIVED_FIELDS:
+            numerator, denominator, _ = DERIVED_FIELDS[field]
+            for base in (numerator, denominator):
+                if base not in result:
+                    result.append(base)
+    return result
+
+
+def _suffix(column: str) -> str:
+    field = base_field(column)
+    return column[len(field):]
+
+
+def aggregate(
+    header: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    drop: Sequence[str] = ()
+) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Сгруппировать строки по измерениям (все не-метрики кроме drop),
+    сложить базовые метрики и пересчитать производные.
+    """
+    drop_set = set(drop)
+    out_header = [c for c in header if c not in drop_set]
+    rejected = non_additive(out_header)
+    if rejected:
+        raise ValueError(f"Non-additive metrics can't be aggregated: {', '.join(rejected)}")
+    positions = {c: i for i, c in enumerate(header)}
+
+    dimensions = [positions[c] for c in out_header if not is_metric(c)]
+    additive = [positions[c] for c in out_header if base_field(c) in ADDITIVE_FIELDS]
+
+    groups: Dict[Tuple, Dict[int, Any]] = {}
+    for row in rows:
+        key = tuple(row[i] for i in dimensions)
+        sums = groups.get(key)
+        if sums is None:
+            sums = {i: 0 for i in additive}
+            groups[key] = sums
+        for i in additive:
+            value = row[i]
+            if value is not None:
+                sums[i] += value
+
+    result = []
+    for key, sums in groups.items():
+        dims = dict(zip(dimensions, key))
+        out_row = []
+        for column in out_header:
+            i = positions[column]
+            if i in dims:
+                out_row.append(dims[i])
+            elif i in sums:
+                out_row.append(sums[i])
+            else:
+                out_row.append(_derive(column, positions, sums))
+        result.append(out_row)
+    return out_header, result
+
+
+def _derive(column: str, positions: Dict[str, int], sums: Dict[int, Any]) -> Optional[float]:
+    field = base_field(column)
+    if field not in DERIVED_FIELDS:
+        return None
+    numerator, denominator, multiplier = DERIVED_FIELDS[field]
+    suffix = _suffix(column)
+
+    def value(name: str) -> Optional[Any]:
+        # Сначала колонка с тем же суффиксом цели, потом общая
+        for candidate in (name + suffix, name):
+            i = positions.get(candidate)
+            if i is not None and i in sums:
+                return sums[i]
+        return None
+
+    num, den = value(numerator), value(denominator)
+    if num is None or not den:
+        return None
+    derived = num / den * multiplier
+    if field in MONEY_DERIVED:
+        return int(round(derived))
+    return round(derived, 2)
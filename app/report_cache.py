@@ -0,0 +1,230 @@
+"""
+Постоянный кэш отчётов по дням
+
+Статистика дней старше окна атрибуции не меняется, поэтому такие
+("закрытые") дни хранятся в ydirect_report_cache навсегда, а заново
+запрашиваются только последние "горячие" дни и дни, которых нет в кэше.
+Ключ: аккаунт + тип отчёта + набор полей + фильтры + цели + модели атрибуции + день.
+"""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text, bindparam
+
+from app import deadline as request_deadline
+from app.database import AsyncSessionLocal
+from app.direct_client import DirectAPIClient
+from app.report_shards import fetch_sharded, shard_ranges
+from app.reports import ReportPendingError
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_ENABLED = os.getenv("DIRECT_REPORT_CACHE", "true").lower() in ("1", "true", "yes")
+# Последние N дней (включая сегодня) считаются незакрытыми
+REPORT_HOT_DAYS = int(os.getenv("DIRECT_REPORT_HOT_DAYS", "3"))
+# Часовой пояс дней статистики Директа: "сегодня" считается по нему, а не по
+# поясу сервера - иначе на сервере восточнее Москвы незакрытый день ушёл бы в кэш
+REPORT_TIMEZONE = ZoneInfo(os.getenv("DIRECT_REPORT_TIMEZONE", "Europe/Moscow"))
+
+
+def _days(date_from: str, date_to: str) -> List[str]:
+    start = date.fromisoformat(date_from)
+    end = date.fromisoformat(date_to)
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def first_hot_day(today: Optional[date] = None) -> str:
+    today = today or datetime.now(REPORT_TIMEZONE).date()
+    return (today - timedelta(days=REPORT_HOT_DAYS - 1)).isoformat()
+
+
+def report_key(params: Dict[str, Any]) -> str:
+    """Ключ отчёта без периода и имени"""
+    criteria = {
+        k: v for k, v in params.get("SelectionCriteria", {}).items()
+        if k not in ("DateFrom", "DateTo")
+    }
+    key = {
+        "ReportType": params.get("ReportType"),
+        # Порядок полей = порядок колонок в закэшированных строках
+        "FieldNames": list(params.get("FieldNames", [])),
+        "SelectionCriteria": criteria,
+        "Goals": params.get("Goals"),
+        "AttributionModels": params.get("AttributionModels"),
+        "IncludeVAT": params.get("IncludeVAT"),
+        "IncludeDiscount": params.get("IncludeDiscount"),
+    }
+    canonical = json.dumps(key, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """
+    Кэш закрытых дней отчёта
+    """
+
+    async def load(
+        self,
+        account_key: str,
+        key: str,
+        days: Sequence[str]
+    ) -> Dict[str, Tuple[List[str], List[List[Any]]]]:
+        """Закэшированные дни: {day: (header, rows)}"""
+        if not days:
+            return {}
+        query = text("""
+            SELECT day, header, rows_json FROM ydirect_report_cache
+            WHERE account_key = :account_key AND report_key = :report_key
+              AND day IN :days
+        """).bindparams(bindparam("days", expanding=True))
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(query, {
+                    "account_key": account_key,
+                    "report_key": key,
+                    "days": list(days),
+                })
+                rows = result.fetchall()
+        except Exception as e:
+            logger.warning(f"Report cache read failed: {e}")
+            return {}
+        return {str(row[0]): (json.loads(row[1]), json.loads(row[2])) for row in rows}
+
+    async def store(
+        self,
+        account_key: str,
+        key: str,
+        header: List[str],
+        day_rows: Dict[str, List[List[Any]]]
+    ):
+        """Сохранить закрытые дни (пустой день тоже сохраняется - "данных нет")"""
+        if not day_rows:
+            return
+        header_json = json.dumps(header, ensure_ascii=False)
+        values = [
+            {
+                "account_key": account_key,
+                "report_key": key,
+                "day": day,
+                "header": header_json,
+                "rows_json": json.dumps(rows, ensure_ascii=False),
+            }
+            for day, rows in day_rows.items()
+        ]
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(text("""
+                    INSERT INTO ydirect_report_cache (account_key, report_key, day, header, rows_json)
+                    VALUES (:account_key, :report_key, :day, :header, :rows_json)
+                    ON DUPLICATE KEY UPDATE header = VALUES(header), rows_json = VALUES(rows_json)
+                """), values)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Report cache write failed: {e}")
+
+    async def fetch(
+        self,
+        client: DirectAPIClient,
+        params: Dict[str, Any],
+        mode: str = "auto",
+        wait: Optional[float] = None,
+        owner: Optional[Dict[str, str]] = None
+    ) -> Tuple[List[str], List[List[Any]]]:
+        """
+        Отчёт по дням (колонка Date добавляется): закрытые дни из кэша,
+        остальное - с первого недостающего дня (длинный период - шардами).
+        """
+        criteria = params["SelectionCriteria"]
+        days = _days(criteria["DateFrom"], criteria["DateTo"])
+        fields = list(params["FieldNames"])
+        if "Date" not in fields:
+            fields.insert(0, "Date")
+        params = {**params, "FieldNames": fields}
+
+        key = report_key(params)
+        hot_from = first_hot_day()
+        closed = [d for d in days if d < hot_from]
+        cached = await self.load(client.account_key, key, closed)
+        missing = [d for d in days if d not in cached]
+
+        header = fields
+        rows: List[List[Any]] = []
+        for day in days:
+            if day in cached:
+                header = cached[day][0]
+                rows.extend(cached[day][1])
+
+        if missing:
+            # Отключение клиента (отмена) не прерывает докачку: закрытые дни
+            # всё равно попадут в кэш и достанутся следующему запросу.
+            # Докачка переживает запрос и идёт без его срока; ожидание
+            # готовности отчёта - не дольше остатка срока (дальше - ReportPendingError)
+            task = request_deadline.detached(self._fetch_missing(
+                client, params, key, missing, hot_from, mode, request_deadline.clamp(wait), owner
+            ))
+            task.add_done_callback(_consume_error)
+            try:
+                header, fresh = await asyncio.shield(task)
+            except ReportPendingError as e:
+                if cached:
+                    # Задания покрывают только недостающие дни - результат
+                    # собирает повтор исходного запроса (дни из кэша + задания)
+                    raise ReportPendingError(e.job_id, reissue=True) from None
+                raise
+            for day_list in fresh.values():
+                rows.extend(day_list)
+            logger.debug(f"Report cache: {len(cached)} cached days, {len(missing)} fetched")
+
+        return header, rows
+
+    async def _fetch_missing(
+        self,
+        client: DirectAPIClient,
+        params: Dict[str, Any],
+        key: str,
+        missing: List[str],
+        hot_from: str,
+        mode: str,
+        wait: Optional[float],
+        owner: Optional[Dict[str, str]]
+    ) -> Tuple[List[str], Dict[str, List[List[Any]]]]:
+        """Запросить недостающие дни и сохранить закрытые из них"""
+        # Длинный недостающий хвост режется на шарды (app/report_shards.py),
+        # шарды целиком из кэша не запрашиваются
+        missing_set = set(missing)
+        ranges = [
+            (start, end) for start, end in shard_ranges(missing[0], params["SelectionCriteria"]["DateTo"])
+            if any(d in missing_set for d in _days(start, end))
+        ]
+        header, fetched = await fetch_sharded(
+            client, params, "cached", mode=mode, wait=wait, owner=owner, ranges=ranges
+        )
+        date_index = header.index("Date")
+        fresh: Dict[str, List[List[Any]]] = {d: [] for d in missing}
+        for row in fetched:
+            day_list = fresh.get(row[date_index])
+            # Дни, уже взятые из кэша, не дублируем
+            if day_list is not None:
+                day_list.append(row)
+
+        await self.store(
+            client.account_key, key, header,
+            {d: r for d, r in fresh.items() if d < hot_from}
+        )
+        return header, fresh
+
+
+def _consume_error(task: asyncio.Task):
+    # Докачка, чей запрос уже отменён: ошибку никто не заберёт
+    if not task.cancelled():
+        task.exception()
+
+
+# Один экземпляр на процесс
+report_cache = ReportCache()
@@ -0,0 +1,213 @@
+"""
+Потоковый разбор TSV отчётов Reports API
+
+Строки читаются из response.aiter_lines() по одной, значения сразу
+приводятся к типам (деньги - int микроединиц при returnMoneyInMicros=true,
+счётчики - int, доли - float, "--" - None) и отдаются компактными кортежами.
+Потребитель может остановиться в любой момент - остаток отчёта не читается.
+"""
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# Денежные поля (микроединицы при returnMoneyInMicros=true)
+MONEY_FIELDS = frozenset({
+    "Cost", "AvgCpc", "AvgCpm", "CostPerConversion", "Revenue", "Profit",
+    "AvgEffectiveBid", "Bid",
+})
+
+# Целочисленные поля
+INT_FIELDS = frozenset({
+    "Impressions", "Clicks", "Sessions", "Bounces",
+    "CampaignId", "AdGroupId", "AdId", "CriterionId", "CriteriaId",
+    "LocationOfPresenceId", "TargetingLocationId", "ImpressionReach",
+})
+
+# Дробные поля (проценты, средние; конверсии дробные при атрибуции)
+FLOAT_FIELDS = frozenset({
+    "Conversions", "Ctr", "ConversionRate", "BounceRate", "AvgImpressionPosition",
+    "AvgClickPosition", "AvgPageviews", "AvgTrafficVolume", "GoalsRoi",
+    "WeightedCtr", "WeightedImpressions", "AvgImpressionFrequency",
+})
+
+EMPTY_VALUES = ("--", "")
+
+Converter = Callable[[str], Any]
+
+
+def _to_int(value: str) -> Optional[int]:
+    if value in EMPTY_VALUES:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        # Целое, выгруженное как "12.0"
+        return int(float(value))
+
+
+def _to_float(value: str) -> Optional[float]:
+    if value in EMPTY_VALUES:
+        return None
+    return float(value)
+
+
+def _to_str(value: str) -> Optional[str]:
+    return None if value == "--" else value
+
+
+def base_field(column: str) -> str:
+    """Имя поля без суффикса цели/модели: Conversions_123_LC -> Conversions"""
+    return column.split("_", 1)[0]
+
+
+def converter_for(column: str) -> Converter:
+    """Конвертер значения колонки по имени поля"""
+    field = base_field(column)
+    if field in MONEY_FIELDS or field in INT_FIELDS:
+        return _to_int
+    if field in FLOAT_FIELDS:
+        return _to_float
+    return _to_str
+
+
+class TsvReader:
+    """
+    Потоковый читатель TSV отчёта
+
+        reader = TsvReader(response.aiter_lines())
+        header = await reader.read_header()
+        async for row in reader:   # кортежи в порядке header
+            ...
+    """
+
+    def __init__(self, lines: AsyncIterator[str]):
+        self._lines = lines.__aiter__()
+        self.header: Optional[List[str]] = None
+        self._converters: List[Converter] = []
+
+    async def read_header(self) -> List[str]:
+        if self.header is None:
+            self.header = []
+            async for line in self._lines:
+                line = line.rstrip("\r\n")
+                if line:
+                    self.header = line.split("\t")
+                    break
+            self._converters = [converter_for(column) for column in self.header]
+        return self.header
+
+    def __aiter__(self) -> AsyncIterator[Tuple]:
+        return self._rows()
+
+    async def _rows(self) -> AsyncIterator[Tuple]:
+        await self.read_header()
+        converters = self._converters
+        async for line in self._lines:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            values = line.split("\t")
+            yield tuple(convert(value) for convert, value in zip(converters, values))
+
+    async def dicts(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Строки как dict (для маленьких отчётов)"""
+        header = await self.read_header()
+        result = []
+        async for row in self:
+            result.append(dict(zip(header, row)))
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    async def columns(self, limit: Optional[int] = None) -> Dict[str, List[Any]]:
+        """Отчёт колонками: {поле: [значения]}"""
+        header = await self.read_header()
+        arrays: List[List[Any]] = [[] for _ in header]
+        count = 0
+        async for row in self:
+            for array, value in zip(arrays, row):
+                array.append(value)
+            count += 1
+            if limit is not None and count >= limit:
+                break
+        return dict(zip(header, arrays))
+
+
+# =========== GOALS ===========
+
+def parse_goal_column(column: str) -> Optional[Tuple[str, str, str]]:
+    """Conversions_123_LC -> ("Conversions", "123", "LC"); обычная колонка -> None"""
+    parts = column.split("_")
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+class GoalLayout:
+    """
+    Раскладка широких колонок целей одного отчёта (общая для всех строк):
+    цели, модели атрибуции, метрики и позиция каждой тройки в строке.
+    """
+    __slots__ = ("goals", "models", "metrics", "slots", "columns", "plain")
+
+    def __init__(self, header: List[str]):
+        self.goals: List[str] = []
+        self.models: List[str] = []
+        self.metrics: List[str] = []
+        # (goal, model, metric) -> номер в GoalValues.values
+        self.slots: Dict[Tuple[str, str, str], int] = {}
+        # Позиции колонок целей в строке отчёта (в порядке slots)
+        self.columns: List[int] = []
+        # Обычные колонки: (имя, позиция)
+        self.plain: List[Tuple[str, int]] = []
+        for i, column in enumerate(header):
+            parsed = parse_goal_column(column)
+            if parsed is None:
+                self.plain.append((column, i))
+                continue
+            metric, goal, model = parsed
+            for values, value in ((self.metrics, metric), (self.goals, goal), (self.models, model)):
+                if value not in values:
+                    values.append(value)
+            self.slots[(goal, model, metric)] = len(self.columns)
+            self.columns.append(i)
+
+    def __bool__(self) -> bool:
+        return bool(self.slots)
+
+
+class GoalValues:
+    """
+    Метрики целей одной строки: плоский кортеж значений + общая раскладка.
+    Вместо goals*models*metrics ключей в каждом dict строки.
+    """
+    __slots__ = ("layout", "values")
+
+    def __init__(self, layout: GoalLayout, row: List[Any]):
+        self.layout = layout
+        self.values = tuple(row[i] for i in layout.columns)
+
+    def get(self, goal: Any, model: str, metric: str) -> Any:
+        slot = self.layout.slots.get((str(goal), model, metric))
+        return None if slot is None else self.values[slot]
+
+    def items(self):
+        """((goal, model, metric), value) для всех троек"""
+        return zip(self.layout.slots, self.values)
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{goal: {model: {metric: value}}} - для JSON/вывода"""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (goal, model, metric), value in self.items():
+            result.setdefault(goal, {}).setdefault(model, {})[metric] = value
+        return result
+
+
+def goal_rows(header: List[str], rows: List[List[Any]]) -> List[Dict[str, Any]]:
+    """Строки-dict, где колонки целей свёрнуты в "Goals": GoalValues"""
+    layout = GoalLayout(header)
+    result = []
+    for row in rows:
+        item = {name: row[i] for name, i in layout.plain}
+        if layout:
+            item["Goals"] = GoalValues(layout, row)
+        result.append(item)
+    return result
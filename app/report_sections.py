@@ -0,0 +1,157 @@
+"""
+Разделы полной статистики кампании (как в poc/get_stats.py)
+
+Все запрошенные разделы ставятся в движок отчётов одновременно и
+отдаются по мере готовности: проверка кампании занимает время самого
+медленного отчёта, а не сумму. Повторные опросы всех разделов идут
+через общий планировщик движка (app/reports.py).
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from app.direct_client import DirectAPIClient, DirectAPIError
+
+logger = logging.getLogger(__name__)
+
+_METRICS = ["Impressions", "Clicks", "Ctr", "AvgCpc", "Cost", "Sessions",
+            "Conversions", "ConversionRate", "CostPerConversion"]
+
+# Раздел -> тип отчёта, поля, сортировка, сколько строк показывать
+SECTIONS: Dict[str, Dict[str, Any]] = {
+    "total": {
+        "title": "Общая статистика",
+        "report_type": "CAMPAIGN_PERFORMANCE_REPORT",
+        "fields": _METRICS,
+    },
+    "daily": {
+        "title": "По дням",
+        "report_type": "CAMPAIGN_PERFORMANCE_REPORT",
+        "fields": ["Date", "Impressions", "Clicks", "Ctr", "AvgCpc", "Cost", "Sessions"],
+        "sort": "Date",
+    },
+    "device": {
+        "title": "По устройствам",
+        "report_type": "CAMPAIGN_PERFORMANCE_REPORT",
+        "fields": ["Device"] + _METRICS,
+        "sort": "-Cost",
+    },
+    "criteria": {
+        "title": "По ключевым словам",
+        "report_type": "CRITERIA_PERFORMANCE_REPORT",
+        "fields": ["Criterion", "CriteriaType"] + _METRICS,
+        "sort": "-Cost",
+        "limit": 15,
+    },
+    "regions": {
+        "title": "По регионам",
+        "report_type": "CAMPAIGN_PERFORMANCE_REPORT",
+        "fields": ["LocationOfPresenceName"] + _METRICS,
+        "sort": "-Cost",
+        "limit": 10,
+    },
+    "placements": {
+        "title": "По площадкам",
+        "report_type": "CAMPAIGN_PERFORMANCE_REPORT",
+        "fields": ["AdNetworkType", "Placement"] + _METRICS,
+        "sort": "-Cost",
+        "limit": 15,
+    },
+    "queries": {
+        "title": "По поисковым запросам",
+        "report_type": "SEARCH_QUERY_PERFORMANCE_REPORT",
+        "fields": ["Query", "Impressions", "Clicks", "Ctr", "Cost"],
+        "sort": "-Cost",
+        "limit": 20,
+    },
+    "ads": {
+        "title": "По объявлениям",
+        "report_type": "AD_PERFORMANCE_REPORT",
+        "fields": ["AdId", "AdGroupId"] + _METRICS,
+        "sort": "-Cost",
+        "limit": 20,
+    },
+}
+
+
+async def fetch_section(
+    client: DirectAPIClient,
+    name: str,
+    campaign_id: int,
+    date_from: str,
+    date_to: str,
+    mode: str = "auto",
+    wait: Optional[float] = None,
+    owner: Optional[Dict[str, str]] = None
+) -> List[Dict]:
+    """Строки одного раздела (отсортированные и обрезанные)"""
+    spec = SECTIONS[name]
+    frame = await client.get_report_frame(
+        spec["report_type"],
+        spec["fields"],
+        date_from,
+        date_to,
+        campaign_id=campaign_id,
+        name_prefix=f"section_{name}",
+        mode=mode,
+        wait=wait,
+        owner=owner,
+    )
+    sort = spec.get("sort")
+    if sort:
+        by = sort.lstrip("-")
+        descending = sort.startswith("-")
+        limit = spec.get("limit")
+        if limit is not None:
+            frame = frame.top(limit, by, descending=descending)
+        else:
+            frame = frame.sort(by, descending=descending)
+    return frame.to_dicts()
+
+
+async def iter_sections(
+    client: DirectAPIClient,
+    sections: Sequence[str],
+    campaign_id: int,
+    date_from: str,
+    date_to: str,
+    mode: str = "auto",
+    wait: Optional[float] = None,
+    owner: Optional[Dict[str, str]] = None
+) -> AsyncIterator[Tuple[str, Optional[List[Dict]], Optional[DirectAPIError]]]:
+    """
+    Поставить все разделы сразу и отдавать (name, rows, error) по мере готовности.
+    Если потребитель перестал читать, незавершённые ожидания отменяются,
+    а сами отчёты продолжают готовиться в движке.
+    """
+    unknown = [name for name in sections if name not in SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown stats sections: {', '.join(unknown)}")
+
+    tasks: Dict[asyncio.Task, str] = {}
+    for name in sections:
+        task = asyncio.create_task(fetch_section(
+            client, name, campaign_id, date_from, date_to,
+            mode=mode, wait=wait, owner=owner
+        ))
+        tasks[task] = name
+
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Порядок внутри пачки - как в запросе
+            for task in sorted(done, key=lambda t: sections.index(tasks[t])):
+                name = tasks[task]
+                error = task.exception()
+                if error is None:
+                    yield name, task.result(), None
+                elif isinstance(error, DirectAPIError):
+                    yield name, None, error
+                else:
+                    logger.exception(f"Stats section {name} failed", exc_info=error)
+                    yield name, None, DirectAPIError(0, "Ошибка раздела", str(error))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,134 @@
+"""
+Шардирование длинных отчётов по периоду
+
+Отчёт за 90+ дней по крупной кампании долго готовится в Директе и часто
+не укладывается в ожидание. Длинный период режется на недели или
+календарные месяцы, шарды ставятся в движок одновременно (движок сам
+держит лимит одновременных отчётов аккаунта) и читаются параллельно.
+Строки шардов просто склеиваются - итоговую свёртку с пересчётом
+производных метрик делает вызывающий (app/report_aggregate.py).
+"""
+import os
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.direct_client import DirectAPIClient
+from app.reports import report_engine, report_name, composite_job_id, ReportPendingError
+
+logger = logging.getLogger(__name__)
+
+# Единица шарда: week / month / off
+REPORT_SHARD_UNIT = os.getenv("DIRECT_REPORT_SHARD", "month").lower()
+# Периоды не длиннее N дней не режутся
+REPORT_SHARD_MIN_DAYS = int(os.getenv("DIRECT_REPORT_SHARD_MIN_DAYS", "31"))
+
+SHARD_UNITS = ("week", "month", "off")
+
+
+def _next_boundary(day: date, unit: str) -> date:
+    """Первый день следующей недели (понедельник) / месяца"""
+    if unit == "week":
+        return day + timedelta(days=7 - day.weekday())
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def shard_ranges(
+    date_from: str,
+    date_to: str,
+    unit: str = REPORT_SHARD_UNIT,
+    min_days: int = REPORT_SHARD_MIN_DAYS
+) -> List[Tuple[str, str]]:
+    """Разбить период на шарды по границам недель/месяцев"""
+    start = date.fromisoformat(date_from)
+    end = date.fromisoformat(date_to)
+    if unit not in SHARD_UNITS:
+        raise ValueError(f"Unknown shard unit: {unit}")
+    if unit == "off" or (end - start).days + 1 <= min_days:
+        return [(date_from, date_to)]
+
+    ranges = []
+    current = start
+    while current <= end:
+        shard_end = min(_next_boundary(current, unit) - timedelta(days=1), end)
+        ranges.append((current.isoformat(), shard_end.isoformat()))
+        current = shard_end + timedelta(days=1)
+    return ranges
+
+
+async def _read_shard(job, wait: Optional[float]) -> Tuple[List[str], List[List[Any]]]:
+    async with report_engine.reader(job, wait) as reader:
+        header = await reader.read_header()
+        rows = [list(row) async for row in reader]
+    return header, rows
+
+
+async def fetch_sharded(
+    client: DirectAPIClient,
+    params: Dict[str, Any],
+    name_prefix: str = "shard",
+    mode: str = "auto",
+    wait: Optional[float] = None,
+    owner: Optional[Dict[str, str]] = None,
+    ranges: Optional[List[Tuple[str, str]]] = None
+) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Отчёт за период params одним или несколькими шардами: (header, rows).
+    ranges - явный список шардов (по умолчанию shard_ranges периода).
+    Если какой-то шард не успел за wait - ReportPendingError с составным
+    job_id всех шардов (read_jobs); шарды готовятся дальше.
+    """
+    criteria = params["SelectionCriteria"]
+    if ranges is None:
+        ranges = shard_ranges(criteria["DateFrom"], criteria["DateTo"])
+
+    jobs = []
+    for shard_from, shard_to in ranges:
+        shard_params = {
+            **params,
+            "SelectionCriteria": {**criteria, "DateFrom": shard_from, "DateTo": shard_to},
+        }
+        shard_params.pop("ReportName", None)
+        shard_params["ReportName"] = report_name(name_prefix, shard_params)
+        jobs.append(await report_engine.submit(client, shard_params, mode=mode, owner=owner))
+
+    if len(jobs) > 1:
+        logger.debug(f"Report {name_prefix}: {len(jobs)} shards {ranges[0][0]}..{ranges[-1][1]}")
+
+    return await read_jobs(jobs, wait, params["FieldNames"])
+
+
+async def read_jobs(
+    jobs: List[Any],
+    wait: Optional[float],
+    fields: List[str]
+) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Прочитать задания параллельно и склеить строки.
+    Если какое-то не успело за wait - ReportPendingError с составным job_id
+    всех заданий: по нему /ai/stats/job соберёт весь период, а не один шард.
+    """
+    tasks = [asyncio.ensure_future(_read_shard(job, wait)) for job in jobs]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, ReportPendingError):
+            raise result
+    if any(isinstance(result, ReportPendingError) for result in results):
+        raise ReportPendingError(composite_job_id(jobs))
+
+    header: List[str] = list(fields)
+    rows: List[List[Any]] = []
+    for shard_header, shard_rows in results:
+        if shard_header:
+            header = shard_header
+        rows.extend(shard_rows)
+    return header, rows
@@ -0,0 +1,527 @@
+"""
+Движок заданий Reports API Яндекс.Директа
+
+- processingMode: online / offline / auto;
+- опрос по заголовку retryIn (как в poc/get_stats.py), а не фиксированный sleep;
+  сбой сети или 5xx при опросе не роняет задание - опрос повторяется с
+  растущей паузой до fatal-ошибки (app/retry_policy.py) или срока задания;
+- очередь на лимит одновременных offline-отчётов аккаунта;
+- состояние задания пишется в ydirect_report_jobs, опрос идёт в фоновой задаче:
+  отчёт переживает обрыв запроса и забирается позже по job_id
+  (Директ отдаёт готовый отчёт повторно по тому же ReportName и параметрам).
+"""
+import os
+import json
+import time
+import math
+import uuid
+import heapq
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from sqlalchemy import text
+
+from app import deadline as request_deadline
+from app.database import AsyncSessionLocal
+from app.direct_client import DirectAPIClient, DirectAPIError, DirectHTTPError
+from app.http_pool import get_http_client
+from app.json_codec import codec
+from app.report_parser import TsvReader
+from app.retry_policy import FATAL, classify
+
+logger = logging.getLogger(__name__)
+
+# Лимит одновременных offline-отчётов в очереди Директа на аккаунт
+REPORTS_MAX_OFFLINE = int(os.getenv("DIRECT_REPORTS_MAX_OFFLINE", "5"))
+# Пауза между опросами, если Директ не прислал retryIn (сек)
+REPORTS_RETRY_DEFAULT = float(os.getenv("DIRECT_REPORTS_RETRY_DEFAULT", "2"))
+REPORTS_RETRY_MAX = float(os.getenv("DIRECT_REPORTS_RETRY_MAX", "60"))
+# Сколько задание может ждать готовности отчёта (сек)
+REPORTS_JOB_MAX_AGE = float(os.getenv("DIRECT_REPORTS_JOB_MAX_AGE", "1800"))
+# Сколько держать завершённые задания в памяти (сек)
+REPORTS_JOB_KEEP = float(os.getenv("DIRECT_REPORTS_JOB_KEEP", "3600"))
+# Шаг общего планировщика опросов: повторы, назначенные на один шаг, идут пачкой (сек)
+REPORTS_POLL_TICK = float(os.getenv("DIRECT_REPORTS_POLL_TICK", "0.5"))
+
+PROCESSING_MODES = ("auto", "online", "offline")
+
+# Статусы задания
+STATUS_QUEUED = "queued"
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+# Разделитель в составном job_id отчёта из нескольких шардов
+JOB_ID_SEPARATOR = ","
+
+
+class ReportPendingError(DirectAPIError):
+    """
+    Отчёт не успел подготовиться за время ожидания - его можно забрать позже.
+    job_id - id задания или составной id всех его шардов (composite_job_id);
+    reissue - задания покрывают только часть периода (остальное взято из
+    кэша отчётов), поэтому забирать результат нужно повтором исходного
+    запроса, а не по job_id.
+    """
+    def __init__(self, job_id: str, reissue: bool = False):
+        self.job_id = job_id
+        self.reissue = reissue
+        super().__init__(0, "Отчёт ещё готовится", f"job_id={job_id}")
+
+
+def composite_job_id(jobs: List["ReportJob"]) -> str:
+    return JOB_ID_SEPARATOR.join(job.id for job in jobs)
+
+
+def report_name(prefix: str, params: Dict[str, Any]) -> str:
+    """
+    Стабильное имя отчёта по параметрам: одинаковые параметры -> тот же отчёт
+    (Директ не даёт переиспользовать имя с другими параметрами)
+    """
+    canonical = json.dumps(
+        {k: v for k, v in params.items() if k != "ReportName"},
+        sort_keys=True, ensure_ascii=False
+    )
+    digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+    return f"{prefix}_{digest}"
+
+
+class ReportJob:
+    """
+    Задание на отчёт
+    """
+
+    def __init__(
+        self,
+        client: DirectAPIClient,
+        params: Dict[str, Any],
+        mode: str = "auto",
+        job_id: Optional[str] = None,
+        owner: Optional[Dict[str, str]] = None
+    ):
+        self.id = job_id or uuid.uuid4().hex
+        self.client = client
+        self.params = params
+        self.mode = mode
+        self.owner = owner or {}
+        self.status = STATUS_QUEUED
+        self.error: Optional[DirectAPIError] = None
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        # Ожидающий потребитель: получит открытый потоковый ответ 200
+        self._waiter: Optional[asyncio.Future] = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _body(self) -> Dict[str, Any]:
+        return {"params": self.params}
+
+    def _request(self, timeout: float = 30.0) -> httpx.Request:
+        return get_http_client().build_request(
+            "POST",
+            self.client.REPORTS_URL,
+            headers=self.client._reports_headers(self.mode),
+            content=codec.dumps(self._body()),
+            timeout=timeout
+        )
+
+
+class PollScheduler:
+    """
+    Общий планировщик повторных опросов всех заданий процесса
+
+    Вместо отдельного таймера на каждое задание - одна куча сроков и один
+    таймер event loop. Сроки округляются вверх до шага tick, поэтому задания,
+    поставленные вместе (например, разделы одной проверки кампании),
+    опрашиваются пачкой.
+    """
+
+    def __init__(self, tick: float = REPORTS_POLL_TICK):
+        self.tick = tick
+        self._heap: List[tuple] = []
+        self._seq = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_due = 0.0
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for _, _, future in self._heap if not future.done())
+
+    async def sleep(self, delay: float):
+        """Проснуться не раньше чем через delay (с точностью до tick)"""
+        loop = asyncio.get_running_loop()
+        due = loop.time() + delay
+        if self.tick > 0:
+            due = math.ceil(due / self.tick) * self.tick
+        future = loop.create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, future))
+        self._arm(loop)
+        # Отмена ожидающего просто помечает future - _wake его пропустит
+        await future
+
+    def _arm(self, loop: asyncio.AbstractEventLoop):
+        if not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(due, self._wake, loop)
+        self._timer_due = due
+
+    def _wake(self, loop: asyncio.AbstractEventLoop):
+        self._timer = None
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                future.set_result(None)
+        self._arm(loop)
+
+
+class ReportEngine:
+    """
+    Фоновые задания отчётов с очередью по аккаунтам
+    """
+
+    def __init__(self, max_offline: int = REPORTS_MAX_OFFLINE):
+        self.max_offline = max_offline
+        self._jobs: Dict[str, ReportJob] = {}
+        # (аккаунт, владелец, имя отчёта, режим) -> задание: одинаковый отчёт
+        # после отключения клиента подхватывается, а не ставится заново
+        self._by_report: Dict[tuple, ReportJob] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.scheduler = PollScheduler()
+
+    def _slot(self, account_key: str) -> asyncio.Semaphore:
+        slot = self._slots.get(account_key)
+        if slot is None:
+            slot = asyncio.Semaphore(self.max_offline)
+            self._slots[account_key] = slot
+        return slot
+
+    def _cleanup(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > REPORTS_JOB_KEEP:
+                del self._jobs[job_id]
+                key = self._report_key(job)
+                if self._by_report.get(key) is job:
+                    del self._by_report[key]
+
+    @staticmethod
+    def _report_key(job: ReportJob) -> tuple:
+        return (
+            job.client.account_key,
+            tuple(sorted(job.owner.items())),
+            job.params.get("ReportName"),
+            job.mode,
+        )
+
+    # =========== SUBMIT ===========
+
+    async def submit(
+        self,
+        client: DirectAPIClient,
+        params: Dict[str, Any],
+        mode: str = "auto",
+        owner: Optional[Dict[str, str]] = None,
+        job_id: Optional[str] = None
+    ) -> ReportJob:
+        """
+        Поставить отчёт в очередь (опрос идёт в фоне). Если такой же отчёт
+        ещё готовится - возвращается то же задание. Готовое задание
+        переиспользуется, только если период целиком из закрытых дней:
+        статистика горячих дней за это время могла измениться.
+        """
+        if mode not in PROCESSING_MODES:
+            raise ValueError(f"Unknown processing mode: {mode}")
+
+        self._cleanup()
+        job = ReportJob(client, params, mode, job_id=job_id, owner=owner)
+        key = self._report_key(job)
+        if job_id is None and key[2]:
+            existing = self._by_report.get(key)
+            if existing is not None and self._reusable(existing):
+                logger.debug(f"Report {key[2]}: reusing job {existing.id}")
+                return existing
+            self._by_report[key] = job
+        self._jobs[job.id] = job
+        await self._persist(job, insert=True)
+        job.task = request_deadline.detached(self._run(job))
+        return job
+
+    @staticmethod
+    def _reusable(job: ReportJob) -> bool:
+        if job.error is not None:
+            return False
+        if not job.done:
+            return True
+        from app.report_cache import first_hot_day
+
+        criteria = job.params.get("SelectionCriteria", {})
+        date_to = criteria.get("DateTo")
+        return (
+            job.params.get("DateRangeType") == "CUSTOM_DATE"
+            and date_to is not None
+            and date_to < first_hot_day()
+        )
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: ReportJob):
+        http = get_http_client()
+        deadline = job.created_at + REPORTS_JOB_MAX_AGE
+        try:
+            async with self._slot(job.client.account_key):
+                failures = 0
+                while True:
+                    try:
+                        response = await http.send(job._request(), stream=True)
+                        if response.status_code not in (200, 201, 202):
+                            try:
+                                await response.aread()
+                            finally:
+                                await response.aclose()
+                            raise self._error(response)
+                    except (httpx.TransportError, DirectAPIError) as error:
+                        # Сбой сети или 5xx при опросе - отчёт в Директе
+                        # продолжает строиться; сдаёмся на fatal или по сроку задания
+                        kind = classify(error)
+                        delay = min(REPORTS_RETRY_DEFAULT * 2 ** failures, REPORTS_RETRY_MAX)
+                        if kind == FATAL or time.monotonic() + delay > deadline:
+                            raise
+                        failures += 1
+                        logger.warning(f"Report {job.id}: poll failed ({kind}: {error}), retry in {delay:.1f}s")
+                        await self.scheduler.sleep(delay)
+                        continue
+                    failures = 0
+
+                    if response.status_code == 200:
+                        job.status = STATUS_READY
+                        if job._waiter is not None and not job._waiter.done():
+                            # Отдаём поток ожидающему, он сам закроет ответ
+                            job._waiter.set_result(response)
+                        else:
+                            # Никто не ждёт (клиент отключился) - отчёт заберут позже
+                            await response.aclose()
+                        break
+
+                    if response.status_code in (201, 202):
+                        retry_in = response.headers.get("retryIn")
+                        await response.aclose()
+                        if job.status != STATUS_PENDING:
+                            job.status = STATUS_PENDING
+                            await self._persist(job)
+                        if time.monotonic() > deadline:
+                            raise DirectAPIError(0, "Отчёт не готов", f"waited {REPORTS_JOB_MAX_AGE:.0f}s")
+                        await self.scheduler.sleep(self._retry_delay(retry_in))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.status = STATUS_FAILED
+            job.error = e if isinstance(e, DirectAPIError) else DirectAPIError(0, "Reports API error", str(e))
+            if job._waiter is not None and not job._waiter.done():
+                job._waiter.set_exception(job.error)
+        finally:
+            job.finished_at = time.monotonic()
+            job._done.set()
+
+        await self._persist(job)
+
+    @staticmethod
+    def _retry_delay(retry_in: Optional[str]) -> float:
+        try:
+            delay = float(retry_in) if retry_in else REPORTS_RETRY_DEFAULT
+        except ValueError:
+            delay = REPORTS_RETRY_DEFAULT
+        return min(max(delay, 0.5), REPORTS_RETRY_MAX)
+
+    @staticmethod
+    def _error(response: httpx.Response) -> DirectAPIError:
+        """Ошибка Reports API (JSON с error или текст)"""
+        try:
+            err = response.json().get("error", {})
+            return DirectAPIError(
+                int(err.get("error_code", response.status_code)),
+                err.get("error_string", "Reports API error"),
+                err.get("error_detail", "")
+            )
+        except (ValueError, AttributeError):
+            if response.status_code >= 500:
+                return DirectHTTPError(response.status_code, response.text[:200])
+            return DirectAPIError(response.status_code, "Reports API error", response.text[:200])
+
+    # =========== RESULT ===========
+
+    @asynccontextmanager
+    async def open(self, job: ReportJob, timeout: Optional[float] = None) -> AsyncIterator[httpx.Response]:
+        """
+        Дождаться готовности отчёта и открыть поток с TSV.
+        Если ожидание прервано (таймаут, срок запроса, отмена), задание
+        продолжает работу в фоне.
+        """
+        timeout = request_deadline.clamp(timeout)
+        try:
+            if job._waiter is not None and not job._waiter.done():
+                # Поток уже ждёт другой потребитель - дожидаемся готовности
+                await asyncio.wait_for(job._done.wait(), timeout)
+            if job.done:
+                response = await self._fetch_ready(job)
+            else:
+                response = await self._wait_stream(job, timeout)
+        except asyncio.TimeoutError:
+            raise ReportPendingError(job.id)
+
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def _fetch_ready(self, job: ReportJob) -> httpx.Response:
+        """Отчёт уже готов в Директе - запрашиваем его повторно"""
+        if job.error is not None:
+            raise job.error
+        timeout = request_deadline.clamp(30.0)
+        if timeout <= 0:
+            raise ReportPendingError(job.id)
+        try:
+            response = await get_http_client().send(job._request(timeout), stream=True)
+        except httpx.TimeoutException:
+            if request_deadline.expired():
+                raise ReportPendingError(job.id)
+            raise
+        if response.status_code != 200:
+            await response.aread()
+            await response.aclose()
+            if response.status_code in (201, 202):
+                raise ReportPendingError(job.id)
+            raise self._error(response)
+        return response
+
+    async def _wait_stream(self, job: ReportJob, timeout: Optional[float]) -> httpx.Response:
+        """Дождаться, пока фоновая задача передаст поток готового отчёта"""
+        waiter = asyncio.get_running_loop().create_future()
+        job._waiter = waiter
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            job._waiter = None
+            # Поток мог быть передан в момент отмены - закрываем его
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                await waiter.result().aclose()
+            else:
+                waiter.cancel()
+            raise
+
+    @asynccontextmanager
+    async def reader(self, job: ReportJob, timeout: Optional[float] = None) -> AsyncIterator[TsvReader]:
+        """
+        Потоковое чтение готового отчёта типизированными строками.
+        Выход из контекста закрывает поток (остаток отчёта не скачивается).
+        """
+        async with self.open(job, timeout) as response:
+            yield TsvReader(response.aiter_lines())
+
+    async def read_rows(
+        self,
+        job: ReportJob,
+        timeout: Optional[float] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Дождаться отчёта и прочитать его строками-dict (для небольших отчётов)"""
+        async with self.reader(job, timeout) as reader:
+            return await reader.dicts(limit=limit)
+
+    # =========== PERSISTENCE ===========
+
+    async def _persist(self, job: ReportJob, insert: bool = False):
+        """
+        Записать состояние задания (ошибки БД не ломают отчёт). Внутри
+        запроса запись ограничена его сроком (app/deadline.py), фоновый опрос
+        идёт без срока
+        """
+        try:
+            async with request_deadline.bound(), AsyncSessionLocal() as session:
+                if insert:
+                    await session.execute(text("""
+                        INSERT INTO ydirect_report_jobs
+                            (id, user_email, alias, account_key, report_name, params, mode, status)
+                        VALUES
+                            (:id, :user_email, :alias, :account_key, :report_name, :params, :mode, :status)
+                    """), {
+                        "id": job.id,
+                        "user_email": job.owner.get("user_email"),
+                        "alias": job.owner.get("alias"),
+                        "account_key": job.client.account_key,
+                        "report_name": job.params.get("ReportName"),
+                        "params": json.dumps(job.params, ensure_ascii=False),
+                        "mode": job.mode,
+                        "status": job.status,
+                    })
+                else:
+                    await session.execute(text("""
+                        UPDATE ydirect_report_jobs
+                        SET status = :status, error = :error
+                        WHERE id = :id
+                    """), {
+                        "id": job.id,
+                        "status": job.status,
+                        "error": str(job.error) if job.error else None,
+                    })
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Failed to persist report job {job.id}: {e}")
+
+    async def load(self, job_id: str, client: DirectAPIClient, owner: Dict[str, str]) -> Optional[ReportJob]:
+        """
+        Найти задание по id: в памяти или в БД (после рестарта/на другом воркере).
+        Задание из БД перезапускается с теми же параметрами - Директ вернёт
+        уже построенный отчёт.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            if job.owner != owner:
+                return None
+            return job
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT params, mode FROM ydirect_report_jobs
+                WHERE id = :id AND user_email = :user_email AND alias = :alias
+            """), {"id": job_id, **owner})
+            row = result.fetchone()
+
+        if not row:
+            return None
+
+        job = ReportJob(client, json.loads(row[0]), row[1], job_id=job_id, owner=owner)
+        self._jobs[job.id] = job
+        job.task = request_deadline.detached(self._run(job))
+        return job
+
+    async def load_many(self, job_id: str, client: DirectAPIClient, owner: Dict[str, str]) -> Optional[List[ReportJob]]:
+        """Задания составного job_id (None - какого-то из них нет)"""
+        jobs = []
+        for part in job_id.split(JOB_ID_SEPARATOR):
+            job = await self.load(part.strip(), client, owner)
+            if job is None:
+                return None
+            jobs.append(job)
+        return jobs
+
+
+# Один экземпляр на процесс
+report_engine = ReportEngine()
@@ -0,0 +1,218 @@
+"""
+Повторы запросов к Direct API и размыкатель по эндпоинтам
+
+Ошибки делятся на классы:
+- throttling (56/152/506) - запрос отклонён до выполнения, пауза берётся
+  у лимитера аккаунта (app/rate_limiter.py);
+- unsent - соединение не установлено, запрос до Директа не дошёл;
+- retryable (52/1000/1001/1002, HTTP 5xx, обрыв и таймаут чтения) - Директ
+  временно недоступен, но запрос мог выполниться;
+- fatal - всё остальное, повтор не поможет.
+
+throttling и unsent повторяются для любых методов. retryable - только для
+безопасных: чтения и мутаций, повтор которых не создаёт дублей (update,
+delete, suspend...). add не повторяется: ключей идемпотентности в Direct API
+нет, а второй add создаст второй объект.
+
+Паузы - экспоненциальные со случайным разбросом (full jitter), все попытки
+укладываются в общий срок запроса.
+
+Размыкатель (circuit breaker) на (хост, сервис): после
+DIRECT_BREAKER_FAILURES подряд сбоев класса unsent/retryable запросы к
+эндпоинту DIRECT_BREAKER_COOLDOWN секунд отклоняются сразу, затем
+пропускается один пробный запрос.
+"""
+import os
+import time
+import random
+import logging
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app import deadline as request_deadline
+from app.rate_limiter import THROTTLING_CODES
+from app.singleflight import READ_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять запрос (не считая первой попытки)
+RETRY_MAX_RETRIES = int(os.getenv("DIRECT_RETRY_MAX_RETRIES", "3"))
+# Базовая и максимальная пауза между попытками (сек)
+RETRY_BASE_DELAY = float(os.getenv("DIRECT_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("DIRECT_RETRY_MAX_DELAY", "10"))
+# Общий срок запроса со всеми повторами (сек); срок HTTP-запроса сервиса
+# (app/deadline.py), если он ближе, ограничивает сильнее
+RETRY_DEADLINE = float(os.getenv("DIRECT_RETRY_DEADLINE", "120"))
+
+# Подряд сбоев до размыкания и время в разомкнутом состоянии (сек)
+BREAKER_FAILURES = int(os.getenv("DIRECT_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("DIRECT_BREAKER_COOLDOWN", "30"))
+
+# Коды Direct API "сервис временно недоступен"
+RETRYABLE_CODES = frozenset({52, 1000, 1001, 1002})
+
+# Мутации, повтор которых не меняет результат
+IDEMPOTENT_METHODS = frozenset({
+    "update", "set", "setAuto", "delete", "suspend", "resume",
+    "archive", "unarchive", "moderate", "toggle",
+})
+
+FATAL = "fatal"
+THROTTLING = "throttling"
+UNSENT = "unsent"
+RETRYABLE = "retryable"
+
+# Ошибки httpx, при которых запрос точно не отправлен
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def classify(error: BaseException) -> str:
+    """Класс ошибки запроса (FATAL / THROTTLING / UNSENT / RETRYABLE)"""
+    if isinstance(error, _UNSENT_ERRORS):
+        return UNSENT
+    if isinstance(error, httpx.TransportError):
+        return RETRYABLE
+    status = getattr(error, "status", None)
+    if status is not None:
+        return RETRYABLE if status >= 500 else FATAL
+    code = getattr(error, "code", None)
+    if code in THROTTLING_CODES:
+        return THROTTLING
+    if code in RETRYABLE_CODES:
+        return RETRYABLE
+    return FATAL
+
+
+def is_safe(method: str) -> bool:
+    """Можно ли повторить метод, не зная, выполнился ли он"""
+    return method in READ_METHODS or method in IDEMPOTENT_METHODS
+
+
+class RetryState:
+    """
+    Попытки одного запроса
+    """
+    __slots__ = ("method", "deadline", "attempt")
+
+    def __init__(self, method: str):
+        self.method = method
+        self.deadline = time.monotonic() + RETRY_DEADLINE
+        outer = request_deadline.current()
+        if outer is not None and outer < self.deadline:
+            self.deadline = outer
+        self.attempt = 0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def timeout(self, timeout: float) -> float:
+        """Таймаут попытки - не дальше срока запроса"""
+        return max(min(timeout, self.remaining()), 0.1)
+
+    def backoff(self) -> float:
+        cap = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** self.attempt)
+        return random.uniform(0, cap)
+
+    def next_delay(self, error: BaseException, kind: str, limiter) -> Optional[float]:
+        """Пауза перед следующей попыткой; None - не повторять"""
+        if kind == FATAL or self.attempt >= RETRY_MAX_RETRIES:
+            return None
+        if kind == RETRYABLE and not is_safe(self.method):
+            return None
+        if kind == THROTTLING:
+            delay = limiter.throttle_delay(error.code, self.attempt)
+            if delay is None:
+                return None
+        else:
+            delay = self.backoff()
+        if delay >= self.remaining():
+            return None
+        self.attempt += 1
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Размыкатель одного эндпоинта
+    """
+    __slots__ = ("key", "failures", "opened_at", "probe_at", "rejected")
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Когда ушёл пробный запрос (если пробный запрос отменили и он не
+        # отчитался, через BREAKER_COOLDOWN пропускается следующий)
+        self.probe_at: Optional[float] = None
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        since = self.opened_at if self.probe_at is None else self.probe_at
+        if time.monotonic() - since < BREAKER_COOLDOWN:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Пропустить запрос? В half_open - только один пробный"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open":
+            self.probe_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        since = self.opened_at if self.probe_at is None else self.probe_at
+        return max(BREAKER_COOLDOWN - (time.monotonic() - since), 0.0)
+
+    def record(self, kind: Optional[str]):
+        """Итог попытки: None - успех, иначе класс ошибки"""
+        if kind in (UNSENT, RETRYABLE):
+            self.failures += 1
+            if self.probe_at is not None or self.failures >= BREAKER_FAILURES:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit open for {self.key[1]} ({self.failures} failures)")
+                self.opened_at = time.monotonic()
+                self.probe_at = None
+            return
+        # Директ ответил (пусть и ошибкой) - эндпоинт жив
+        if self.opened_at is not None:
+            logger.info(f"Circuit closed for {self.key[1]}")
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+
+class CircuitBreakers:
+    """
+    Размыкатели по (хост API, сервис)
+    """
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, base_url: str, service: str) -> CircuitBreaker:
+        key = (base_url, service)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key)
+            self._breakers[key] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            f"{base_url}/{service}": {"state": b.state, "failures": b.failures, "rejected": b.rejected}
+            for (base_url, service), b in self._breakers.items()
+        }
+
+
+# Один экземпляр на процесс
+circuit_breakers = CircuitBreakers()
@@ -7,15 +7,25 @@ import base64
 import logging
 from typing import Optional, List
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
 from app.auth import get_user_email_from_token
 from app.routers.profiles import get_profile_token
-from app.direct_client import DirectAPIClient, DirectAPIError
+from app.direct_client import DirectAPIError
+from app.client_registry import client_registry
+from app.disconnect import ClientDisconnected, cancel_on_disconnect, guard_stream
+from app.mirror import AccountMirror, MirrorSyncBusy
+from app.reports import report_engine, ReportPendingError
+from app.report_sections import SECTIONS, iter_sections
+from app.report_shards import read_jobs
+from app.report_aggregate import is_metric
+from app.report_parser import GoalValues, goal_rows
+from app.stats_frame import StatsFrame
+from app.query_mining import (
+    EXPORT_FORMATS, EXPORT_MEDIA_TYPES, iter_export, mine_queries, parquet_available
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/ai", tags=["ai"])
@@ -53,12 +63,21 @@ def sse_error(message: str):
     return f"data: {data}\n\n"
 
 
+def sse_response(http_request: Request, stream) -> StreamingResponse:
+    """
+    SSE-ответ инструмента чтения: если aihandler отключился, текущий вызов
+    Директа / ожидание отчёта отменяется (app/disconnect.py)
+    """
+    return StreamingResponse(guard_stream(http_request, stream), media_type="text/event-stream")
+
+
 # =========== SCHEMAS ===========
 
 class GetCampaignsRequest(BaseModel):
     """Запрос списка кампаний"""
     alias: str
     states: Optional[List[str]] = None  # ON, OFF, SUSPENDED, ENDED, ARCHIVED
+    from_mirror: bool = False  # ответ из локального зеркала (если синхронизировано)
 
 
 class GetStatsRequest(BaseModel):
@@ -68,6 +87,55 @@ class GetStatsRequest(BaseModel):
     days: Optional[int] = 7
     date_from: Optional[str] = None
     date_to: Optional[str] = None
+    mode: str = "auto"  # processingMode: auto, online, offline
+    wait: Optional[int] = 60  # сек ожидания отчёта, потом - job_id
+    goals: Optional[List[int]] = None  # ID целей Метрики (не номер счётчика)
+    attribution_models: Optional[List[str]] = None  # LC, LSC, FC, LYDC, LSCCD, AUTO
+    compare: bool = False  # сравнить с предыдущим периодом такой же длины (без целей)
+
+
+class GetCampaignsStatsRequest(BaseModel):
+    """Статистика нескольких кампаний (или всего аккаунта) одним отчётом"""
+    alias: str
+    campaign_ids: Optional[List[int]] = None  # None = все кампании аккаунта
+    days: Optional[int] = 7
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    mode: str = "auto"
+    wait: Optional[int] = 60
+
+
+class GetStatsSectionsRequest(BaseModel):
+    """Полная статистика кампании по разделам"""
+    alias: str
+    campaign_id: int
+    sections: Optional[List[str]] = None  # total, daily, device, criteria, regions, placements, queries, ads
+    days: Optional[int] = 7
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    mode: str = "auto"
+    wait: Optional[int] = 60
+
+
+class ExportQueriesRequest(BaseModel):
+    """Выгрузка поисковых запросов (свёрнутых по нормализованному тексту)"""
+    alias: str
+    campaign_ids: Optional[List[int]] = None  # None = весь аккаунт
+    days: Optional[int] = 30
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    format: str = "csv"  # csv, jsonl, parquet
+    sort_by: str = "cost"  # cost, clicks, impressions, conversions
+    min_impressions: int = 0
+    mode: str = "auto"
+    wait: Optional[int] = 120
+
+
+class GetReportJobRequest(BaseModel):
+    """Забрать отчёт, поставленный ранее"""
+    alias: str
+    job_id: str
+    wait: Optional[int] = 60
 
 
 class CreateCampaignRequest(BaseModel):
@@ -130,12 +198,195 @@ class GetAdsRequest(BaseModel):
     """Получение объявлений"""
     alias: str
     ad_group_id: int
+    from_mirror: bool = False
 
 
 class GetAdGroupsRequest(BaseModel):
     """Получение групп объявлений"""
     alias: str
     campaign_id: int
+    from_mirror: bool = False
+
+
+class SyncMirrorRequest(BaseModel):
+    """Синхронизация локального зеркала аккаунта"""
+    alias: str
+    full: bool = False  # полная пересборка вместо инкрементальной
+
+
+# =========== FORMATTERS ===========
+
+def format_stats(title: str, date_from: str, date_to: str, stats: List[dict]) -> str:
+    """Текст сводной статистики для LLM"""
+    output_lines = [
+        title,
+        f"Период: {date_from} — {date_to}\n"
+    ]
+    
+    if stats:
+        row = stats[0]
+        # Деньги приходят в микроединицах (returnMoneyInMicros=true)
+        cost = (row.get('Cost') or 0) / 1_000_000
+        avg_cpc = (row.get('AvgCpc') or 0) / 1_000_000
+        output_lines.append(f"👁️  Показы: {row.get('Impressions') or 0}")
+        output_lines.append(f"🖱️  Клики: {row.get('Clicks') or 0}")
+        output_lines.append(f"📊 CTR: {row.get('Ctr') or 0}%")
+        output_lines.append(f"💰 Расход: {cost:.2f} руб")
+        output_lines.append(f"💵 Ср. CPC: {avg_cpc:.2f} руб")
+        if row.get('Conversions'):
+            output_lines.append(f"🎯 Конверсии: {format_conversions(row['Conversions'])}")
+        if row.get('Goals'):
+            output_lines.append(format_goals(row['Goals']))
+    else:
+        output_lines.append("Нет данных за указанный период")
+    
+    return "\n".join(output_lines)
+
+
+# Метрики сравнения периодов: (поле, подпись, формат значения)
+COMPARISON_METRICS = [
+    ("Impressions", "👁️  Показы", lambda v: f"{v}"),
+    ("Clicks", "🖱️  Клики", lambda v: f"{v}"),
+    ("Ctr", "📊 CTR", lambda v: f"{v}%"),
+    ("Cost", "💰 Расход", lambda v: f"{v / 1_000_000:.2f} руб"),
+    ("AvgCpc", "💵 Ср. CPC", lambda v: f"{v / 1_000_000:.2f} руб"),
+    ("Conversions", "🎯 Конверсии", lambda v: format_conversions(v)),
+    ("ConversionRate", "📈 CR", lambda v: f"{v}%"),
+    ("CostPerConversion", "🧾 CPA", lambda v: f"{v / 1_000_000:.2f} руб"),
+    ("Revenue", "💎 Доход", lambda v: f"{v / 1_000_000:.2f} руб"),
+    ("Roas", "🔁 ROAS", lambda v: f"{v}"),
+]
+
+
+def format_comparison(title: str, date_from: str, date_to: str, row: dict) -> str:
+    """Текст сравнения периода с предыдущим: значение, было, изменение"""
+    output_lines = [
+        title,
+        f"Период: {date_from} — {date_to} (в скобках - предыдущий такой же длины)\n"
+    ]
+    if not row:
+        output_lines.append("Нет данных за оба периода")
+        return "\n".join(output_lines)
+    for field, label, fmt in COMPARISON_METRICS:
+        cur, prev = row.get(field), row.get(f"{field}_prev")
+        if cur is None and prev is None:
+            continue
+        line = f"{label}: {fmt(cur) if cur is not None else '—'} (было {fmt(prev) if prev is not None else '—'})"
+        if cur is not None and prev:
+            line += f", {(cur - prev) / abs(prev) * 100:+.1f}%"
+        output_lines.append(line)
+    return "\n".join(output_lines)
+
+
+def format_conversions(value: Optional[float]) -> str:
+    """Конверсии дробные при атрибуции: 12 / 12.5, без хвостов сложения float"""
+    value = round(value or 0, 2)
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def format_goals(goals: GoalValues) -> str:
+    """Конверсии по целям и моделям атрибуции"""
+    output_lines = ["\n🎯 Цели:"]
+    for goal, models in goals.to_dict().items():
+        for model, metrics in models.items():
+            line = f"  [{goal}] {model}: конверсии {format_conversions(metrics.get('Conversions'))}"
+            if metrics.get('ConversionRate') is not None:
+                line += f" | CR {metrics['ConversionRate']}%"
+            if metrics.get('CostPerConversion') is not None:
+                line += f" | CPA {metrics['CostPerConversion'] / 1_000_000:.2f} руб"
+            if metrics.get('Revenue'):
+                line += f" | доход {metrics['Revenue'] / 1_000_000:.2f} руб"
+            if metrics.get('Roas') is not None:
+                line += f" | ROAS {metrics['Roas']}"
+            output_lines.append(line)
+    return "\n".join(output_lines)
+
+
+def format_campaigns_stats(date_from: str, date_to: str, stats: dict) -> str:
+    """Текст статистики по кампаниям + итог"""
+    output_lines = [
+        "📈 Статистика по кампаниям",
+        f"Период: {date_from} — {date_to}"
+    ]
+    
+    if not stats:
+        output_lines.append("\nНет данных за указанный период")
+        return "\n".join(output_lines)
+    
+    total_impressions = total_clicks = total_cost = total_conversions = 0
+    # Сортируем по расходу - самые затратные сверху
+    rows = sorted(stats.values(), key=lambda r: r.get('Cost') or 0, reverse=True)
+    for row in rows:
+        impressions = row.get('Impressions') or 0
+        clicks = row.get('Clicks') or 0
+        cost = row.get('Cost') or 0
+        conversions = row.get('Conversions') or 0
+        total_impressions += impressions
+        total_clicks += clicks
+        total_cost += cost
+        total_conversions += conversions
+        
+        output_lines.append(f"\n[{row.get('CampaignId')}] {row.get('CampaignName') or ''}")
+        line = (
+            f"  Показы: {impressions} | Клики: {clicks} | CTR: {row.get('Ctr') or 0}% | "
+            f"Расход: {cost / 1_000_000:.2f} руб | CPC: {(row.get('AvgCpc') or 0) / 1_000_000:.2f} руб"
+        )
+        if conversions:
+            line += f" | Конверсии: {format_conversions(conversions)}"
+        output_lines.append(line)
+    
+    ctr = round(total_clicks / total_impressions * 100, 2) if total_impressions else 0
+    avg_cpc = total_cost / total_clicks / 1_000_000 if total_clicks else 0
+    output_lines.append(f"\n📊 Итого по {len(rows)} кампаниям:")
+    output_lines.append(
+        f"  Показы: {total_impressions} | Клики: {total_clicks} | CTR: {ctr}% | "
+        f"Расход: {total_cost / 1_000_000:.2f} руб | CPC: {avg_cpc:.2f} руб"
+    )
+    if total_conversions:
+        output_lines.append(f"  Конверсии: {format_conversions(total_conversions)}")
+    
+    return "\n".join(output_lines)
+
+
+def format_section(name: str, rows: List[dict]) -> str:
+    """Текст одного раздела статистики"""
+    spec = SECTIONS[name]
+    output_lines = [f"📊 {spec['title']}"]
+    if not rows:
+        output_lines.append("  Нет данных")
+        return "\n".join(output_lines)
+    
+    dimensions = [f for f in spec["fields"] if not is_metric(f)]
+    for row in rows:
+        parts = []
+        if dimensions:
+            parts.append(" | ".join(str(row.get(d) or "—") for d in dimensions))
+        metrics = f"{row.get('Impressions') or 0} показов | {row.get('Clicks') or 0} кликов | CTR {row.get('Ctr') or 0}%"
+        metrics += f" | {(row.get('Cost') or 0) / 1_000_000:.2f} руб"
+        if row.get('AvgCpc'):
+            metrics += f" | CPC {row['AvgCpc'] / 1_000_000:.2f} руб"
+        if row.get('Conversions'):
+            metrics += f" | конв. {format_conversions(row['Conversions'])}"
+        parts.append(metrics)
+        output_lines.append("  " + " — ".join(parts))
+    
+    return "\n".join(output_lines)
+
+
+def format_report_pending(e: ReportPendingError) -> str:
+    """Отчёт готовится дольше ожидания"""
+    if e.reissue:
+        # Часть дней уже в кэше отчётов - по job_id весь период не собрать
+        return (
+            f"⏳ Отчёт ещё готовится в Директе.\n\n"
+            f"Повтори этот же запрос позже: готовые дни возьмутся из кэша, "
+            f"а недостающие - из уже поставленного отчёта."
+        )
+    return (
+        f"⏳ Отчёт ещё готовится в Директе.\n\n"
+        f"job_id: {e.job_id}\n"
+        f"Забери его позже через /ai/stats/job - повторно ставить отчёт не нужно."
+    )
 
 
 # =========== ENDPOINTS ===========
@@ -143,8 +394,8 @@ class GetAdGroupsRequest(BaseModel):
 @router.post("/campaigns")
 async def get_campaigns(
     request: GetCampaignsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Получить список кампаний Яндекс.Директ
@@ -154,28 +405,35 @@ async def get_campaigns(
         
         try:
             # Получаем токен профиля
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
-            
-            # Запрос кампаний
-            campaigns = await client.get_campaigns(states=request.states)
-            
-            # Форматируем ответ
-            output_lines = [f"📊 Найдено кампаний: {len(campaigns)}\n"]
-            
-            for c in campaigns:
-                budget = c.get("DailyBudget", {}).get("Amount", 0) / 1_000_000
-                output_lines.append(f"\n[{c['Id']}] {c['Name']}")
-                output_lines.append(f"  Статус: {c['Status']} | Состояние: {c['State']}")
-                output_lines.append(f"  Тип: {c['Type']}")
-                if budget > 0:
-                    output_lines.append(f"  Бюджет: {budget:.0f} руб/день")
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
+            
+            # Запрос кампаний постранично, каждая страница уходит клиенту сразу
+            mirror = AccountMirror(user_email, request.alias)
+            if request.from_mirror and await mirror.is_synced():
+                pages = mirror.iter_campaigns(states=request.states)
+            else:
+                pages = client.iter_campaigns(states=request.states, prefetch=True, typed=True)
+            
+            total = 0
+            async for campaigns in pages:
+                total += len(campaigns)
+                output_lines = []
+                
+                for c in campaigns:
+                    output_lines.append(f"\n[{c.id}] {c.name}")
+                    output_lines.append(f"  Статус: {c.status} | Состояние: {c.state}")
+                    output_lines.append(f"  Тип: {c.type}")
+                    if c.daily_budget:
+                        output_lines.append(f"  Бюджет: {c.daily_budget_rub:.0f} руб/день")
+                    
+                    if c.clicks is not None or c.impressions is not None:
+                        output_lines.append(f"  Клики: {c.clicks or 0} | Показы: {c.impressions or 0}")
                 
-                stats = c.get("Statistics", {})
-                if stats:
-                    output_lines.append(f"  Клики: {stats.get('Clicks', 0)} | Показы: {stats.get('Impressions', 0)}")
+                if output_lines:
+                    yield sse_output("\n".join(output_lines))
             
-            yield sse_output("\n".join(output_lines))
+            yield sse_output(f"\n📊 Найдено кампаний: {total}")
             yield sse_status(0)
             
         except DirectAPIError as e:
@@ -192,17 +450,14 @@ async def get_campaigns(
         
         yield sse_end()
     
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream"
-    )
+    return sse_response(http_request, generate())
 
 
 @router.post("/stats")
 async def get_stats(
     request: GetStatsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Получить статистику кампании
@@ -211,8 +466,8 @@ async def get_stats(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             # Определяем даты
             date_to = request.date_to or datetime.now().strftime("%Y-%m-%d")
@@ -221,34 +476,283 @@ async def get_stats(
             else:
                 date_from = (datetime.now() - timedelta(days=request.days)).strftime("%Y-%m-%d")
             
-            # Получаем статистику
-            stats = await client.get_stats(
-                campaign_id=request.campaign_id,
+            if request.compare:
+                if request.goals:
+                    raise HTTPException(status_code=400, detail="Сравнение периодов - без целей (goals)")
+                row = await client.compare_stats(
+                    campaign_id=request.campaign_id,
+                    date_from=date_from,
+                    date_to=date_to,
+                    mode=request.mode,
+                    wait=request.wait,
+                    owner={"user_email": user_email, "alias": request.alias}
+                )
+                yield sse_output(format_comparison(
+                    f"📈 Статистика кампании {request.campaign_id}", date_from, date_to, row
+                ))
+            else:
+                # Получаем статистику
+                stats = await client.get_stats(
+                    campaign_id=request.campaign_id,
+                    date_from=date_from,
+                    date_to=date_to,
+                    mode=request.mode,
+                    wait=request.wait,
+                    owner={"user_email": user_email, "alias": request.alias},
+                    goals=request.goals,
+                    attribution_models=request.attribution_models
+                )
+                
+                yield sse_output(format_stats(
+                    f"📈 Статистика кампании {request.campaign_id}", date_from, date_to, stats
+                ))
+            yield sse_status(0)
+            
+        except ReportPendingError as e:
+            yield sse_output(format_report_pending(e))
+            yield sse_status(0)
+        except DirectAPIError as e:
+            yield sse_error(f"Ошибка API: {e.message}")
+            yield sse_status(1)
+        except HTTPException as e:
+            yield sse_error(e.detail)
+            yield sse_status(1)
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+            yield sse_error(f"Ошибка: {str(e)}")
+            yield sse_status(1)
+        
+        yield sse_end()
+    
+    return sse_response(http_request, generate())
+
+
+@router.post("/stats/campaigns")
+async def get_campaigns_stats(
+    request: GetCampaignsStatsRequest,
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
+):
+    """
+    Статистика нескольких кампаний (или всего аккаунта) одним отчётом
+    """
+    async def generate():
+        yield sse_start()
+        
+        try:
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
+            
+            date_to = request.date_to or datetime.now().strftime("%Y-%m-%d")
+            if request.date_from:
+                date_from = request.date_from
+            else:
+                date_from = (datetime.now() - timedelta(days=request.days)).strftime("%Y-%m-%d")
+            
+            stats = await client.get_campaigns_stats(
                 date_from=date_from,
-                date_to=date_to
+                date_to=date_to,
+                campaign_ids=request.campaign_ids,
+                mode=request.mode,
+                wait=request.wait,
+                owner={"user_email": user_email, "alias": request.alias}
             )
             
-            # Форматируем ответ
-            output_lines = [
-                f"📈 Статистика кампании {request.campaign_id}",
-                f"Период: {date_from} — {date_to}\n"
-            ]
-            
-            if stats:
-                row = stats[0]
-                output_lines.append(f"👁️  Показы: {row.get('Impressions', 0)}")
-                output_lines.append(f"🖱️  Клики: {row.get('Clicks', 0)}")
-                output_lines.append(f"📊 CTR: {row.get('Ctr', 0)}%")
-                output_lines.append(f"💰 Расход: {row.get('Cost', 0)} руб")
-                output_lines.append(f"💵 Ср. CPC: {row.get('AvgCpc', 0)} руб")
-                if row.get('Conversions'):
-                    output_lines.append(f"🎯 Конверсии: {row.get('Conversions')}")
+            yield sse_output(format_campaigns_stats(date_from, date_to, stats))
+            yield sse_status(0)
+            
+        except ReportPendingError as e:
+            yield sse_output(format_report_pending(e))
+            yield sse_status(0)
+        except DirectAPIError as e:
+            yield sse_error(f"Ошибка API: {e.message}")
+            yield sse_status(1)
+        except HTTPException as e:
+            yield sse_error(e.detail)
+            yield sse_status(1)
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+            yield sse_error(f"Ошибка: {str(e)}")
+            yield sse_status(1)
+        
+        yield sse_end()
+    
+    return sse_response(http_request, generate())
+
+
+@router.post("/stats/sections")
+async def get_stats_sections(
+    request: GetStatsSectionsRequest,
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
+):
+    """
+    Полная статистика кампании: все разделы ставятся одновременно,
+    каждый уходит клиенту, как только готов
+    """
+    async def generate():
+        yield sse_start()
+        
+        try:
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
+            
+            date_to = request.date_to or datetime.now().strftime("%Y-%m-%d")
+            if request.date_from:
+                date_from = request.date_from
             else:
-                output_lines.append("Нет данных за указанный период")
+                date_from = (datetime.now() - timedelta(days=request.days)).strftime("%Y-%m-%d")
             
-            yield sse_output("\n".join(output_lines))
+            sections = request.sections or list(SECTIONS)
+            unknown = [name for name in sections if name not in SECTIONS]
+            if unknown:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Неизвестные разделы: {', '.join(unknown)}. Доступны: {', '.join(SECTIONS)}"
+                )
+            
+            yield sse_output(f"📈 Статистика кампании {request.campaign_id}\nПериод: {date_from} — {date_to}\n")
+            
+            failed = 0
+            async for name, rows, error in iter_sections(
+                client, sections, request.campaign_id, date_from, date_to,
+                mode=request.mode,
+                wait=request.wait,
+                owner={"user_email": user_email, "alias": request.alias}
+            ):
+                if isinstance(error, ReportPendingError):
+                    yield sse_output(f"📊 {SECTIONS[name]['title']}\n{format_report_pending(error)}\n")
+                elif error is not None:
+                    failed += 1
+                    yield sse_output(f"📊 {SECTIONS[name]['title']}\n  ❌ {error.message}\n")
+                else:
+                    yield sse_output(format_section(name, rows) + "\n")
+            
+            yield sse_status(1 if failed == len(sections) else 0)
+            
+        except DirectAPIError as e:
+            yield sse_error(f"Ошибка API: {e.message}")
+            yield sse_status(1)
+        except HTTPException as e:
+            yield sse_error(e.detail)
+            yield sse_status(1)
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+            yield sse_error(f"Ошибка: {str(e)}")
+            yield sse_status(1)
+        
+        yield sse_end()
+    
+    return sse_response(http_request, generate())
+
+
+@router.post("/stats/queries")
+async def export_queries(
+    request: ExportQueriesRequest,
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
+):
+    """
+    Поисковые запросы: отчёт читается потоково и сворачивается по
+    нормализованному запросу, результат отдаётся кусками (CSV/JSONL/Parquet)
+    """
+    if request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат: {', '.join(EXPORT_FORMATS)}")
+    if request.format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet недоступен (не установлен pyarrow)")
+    if request.sort_by not in ("cost", "clicks", "impressions", "conversions"):
+        raise HTTPException(status_code=400, detail="sort_by: cost, clicks, impressions, conversions")
+    
+    token = await get_profile_token(user_email, request.alias)
+    client = client_registry.get(token)
+    
+    date_to = request.date_to or datetime.now().strftime("%Y-%m-%d")
+    if request.date_from:
+        date_from = request.date_from
+    else:
+        date_from = (datetime.now() - timedelta(days=request.days)).strftime("%Y-%m-%d")
+    
+    try:
+        aggregator = await cancel_on_disconnect(http_request, mine_queries(
+            client, date_from, date_to,
+            campaign_ids=request.campaign_ids,
+            mode=request.mode,
+            wait=request.wait,
+            owner={"user_email": user_email, "alias": request.alias}
+        ))
+    except ClientDisconnected:
+        # Отвечать некому; задания отчётов остаются в фоне
+        return Response(status_code=499)
+    except ReportPendingError as e:
+        # Шарды готовятся в фоне - повторный запрос с теми же параметрами
+        # заберёт их; job_id - составной id всех шардов
+        return JSONResponse(status_code=202, content={
+            "status": "pending",
+            "job_id": e.job_id,
+            "reissue": e.reissue,
+            "detail": "Отчёт ещё готовится, повтори запрос позже"
+        })
+    except DirectAPIError as e:
+        raise HTTPException(status_code=502, detail=f"Ошибка API: {e.message}")
+    
+    items = aggregator.items(sort_by=request.sort_by, min_impressions=request.min_impressions)
+    filename = f"queries_{date_from}_{date_to}.{request.format}"
+    return StreamingResponse(
+        iter_export(items, request.format),
+        media_type=EXPORT_MEDIA_TYPES[request.format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Report-Rows": str(aggregator.rows),
+            "X-Report-Queries": str(len(items)),
+        }
+    )
+
+
+@router.post("/stats/job")
+async def get_report_job(
+    request: GetReportJobRequest,
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
+):
+    """
+    Забрать отчёт по job_id (поставленный ранее через /ai/stats)
+    """
+    async def generate():
+        yield sse_start()
+        
+        try:
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
+            
+            owner = {"user_email": user_email, "alias": request.alias}
+            # Составной job_id - шарды одного отчёта (app/report_shards.py)
+            jobs = await report_engine.load_many(request.job_id, client, owner)
+            if jobs is None:
+                raise HTTPException(status_code=404, detail=f"Report job '{request.job_id}' not found")
+            job = jobs[0]
+            
+            header, rows = await read_jobs(jobs, request.wait, job.params.get("FieldNames", []))
+            frame = StatsFrame.from_rows(header, rows)
+            # Шарды и задания из кэша отчётов - по дням/месяцам: сворачиваем
+            # период в итог, как синхронный путь (DirectAPIClient._report_frame)
+            frame = frame.group_by([d for d in frame.dimensions if d != "Date"])
+            if job.params.get("Goals"):
+                stats = goal_rows(frame.header, frame.to_rows())
+            else:
+                stats = frame.to_dicts()
+            
+            periods = [j.params.get("SelectionCriteria", {}) for j in jobs]
+            yield sse_output(format_stats(
+                f"📈 Отчёт {job.params.get('ReportName')}",
+                min(c.get("DateFrom", "") for c in periods),
+                max(c.get("DateTo", "") for c in periods),
+                stats
+            ))
             yield sse_status(0)
             
+        except ReportPendingError as e:
+            yield sse_output(format_report_pending(e))
+            yield sse_status(0)
         except DirectAPIError as e:
             yield sse_error(f"Ошибка API: {e.message}")
             yield sse_status(1)
@@ -262,14 +766,13 @@ async def get_stats(
         
         yield sse_end()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return sse_response(http_request, generate())
 
 
 @router.post("/campaigns/create")
 async def create_campaign(
     request: CreateCampaignRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Создать новую кампанию
@@ -278,8 +781,8 @@ async def create_campaign(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             start_date = request.start_date or datetime.now().strftime("%Y-%m-%d")
             
@@ -317,8 +820,7 @@ ID: {campaign_id}
 @router.post("/campaigns/budget")
 async def update_budget(
     request: UpdateBudgetRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Обновить бюджет кампании
@@ -327,8 +829,8 @@ async def update_budget(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             await client.update_campaign_budget(
                 campaign_id=request.campaign_id,
@@ -364,8 +866,7 @@ async def update_budget(
 @router.post("/campaigns/rsya")
 async def toggle_rsya(
     request: ToggleRsyaRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Включить/выключить РСЯ (Рекламную сеть Яндекса)
@@ -374,8 +875,8 @@ async def toggle_rsya(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             await client.toggle_rsya(request.campaign_id, request.enable)
             
@@ -401,8 +902,8 @@ async def toggle_rsya(
 @router.post("/adgroups")
 async def get_ad_groups(
     request: GetAdGroupsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Получить группы объявлений кампании
@@ -411,17 +912,21 @@ async def get_ad_groups(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
-            groups = await client.get_ad_groups(request.campaign_id)
+            mirror = AccountMirror(user_email, request.alias)
+            if request.from_mirror and await mirror.is_synced():
+                groups = await mirror.get_ad_groups(request.campaign_id)
+            else:
+                groups = await client.get_ad_groups(request.campaign_id, typed=True)
             
             output_lines = [f"📁 Группы объявлений кампании {request.campaign_id}\n"]
             output_lines.append(f"Найдено: {len(groups)}\n")
             
             for g in groups:
-                output_lines.append(f"[{g['Id']}] {g['Name']}")
-                output_lines.append(f"  Статус: {g['Status']}")
+                output_lines.append(f"[{g.id}] {g.name}")
+                output_lines.append(f"  Статус: {g.status}")
             
             yield sse_output("\n".join(output_lines))
             yield sse_status(0)
@@ -436,14 +941,13 @@ async def get_ad_groups(
         
         yield sse_end()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return sse_response(http_request, generate())
 
 
 @router.post("/adgroups/create")
 async def create_ad_group(
     request: CreateAdGroupRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Создать группу объявлений
@@ -452,8 +956,8 @@ async def create_ad_group(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             group_id = await client.create_ad_group(
                 campaign_id=request.campaign_id,
@@ -487,8 +991,7 @@ ID: {group_id}
 @router.post("/keywords/add")
 async def add_keywords(
     request: AddKeywordsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Добавить ключевые слова в группу
@@ -497,8 +1000,8 @@ async def add_keywords(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             keyword_ids = await client.add_keywords(
                 ad_group_id=request.ad_group_id,
@@ -531,8 +1034,8 @@ IDs: {keyword_ids}"""
 @router.post("/ads")
 async def get_ads(
     request: GetAdsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    http_request: Request,
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Получить объявления группы
@@ -541,26 +1044,36 @@ async def get_ads(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
-            ads = await client.get_ads(request.ad_group_id)
+            yield sse_output(f"📝 Объявления группы {request.ad_group_id}\n")
             
-            output_lines = [f"📝 Объявления группы {request.ad_group_id}\n"]
-            output_lines.append(f"Найдено: {len(ads)}\n")
+            mirror = AccountMirror(user_email, request.alias)
+            if request.from_mirror and await mirror.is_synced():
+                pages = mirror.iter_ads(request.ad_group_id)
+            else:
+                pages = client.iter_ads(request.ad_group_id, prefetch=True, typed=True)
             
-            for ad in ads:
-                output_lines.append(f"[{ad['Id']}] {ad['Type']}")
-                output_lines.append(f"  Статус: {ad['Status']} | Состояние: {ad['State']}")
+            total = 0
+            async for ads in pages:
+                total += len(ads)
+                output_lines = []
+                
+                for ad in ads:
+                    output_lines.append(f"[{ad.id}] {ad.type}")
+                    output_lines.append(f"  Статус: {ad.status} | Состояние: {ad.state}")
+                    
+                    if ad.title is not None or ad.text is not None:
+                        output_lines.append(f"  Заголовок: {ad.title or ''}")
+                        if ad.title2:
+                            output_lines.append(f"  Заголовок 2: {ad.title2}")
+                        output_lines.append(f"  Текст: {ad.text or ''}")
                 
-                text_ad = ad.get("TextAd", {})
-                if text_ad:
-                    output_lines.append(f"  Заголовок: {text_ad.get('Title', '')}")
-                    if text_ad.get('Title2'):
-                        output_lines.append(f"  Заголовок 2: {text_ad.get('Title2')}")
-                    output_lines.append(f"  Текст: {text_ad.get('Text', '')}")
+                if output_lines:
+                    yield sse_output("\n".join(output_lines))
             
-            yield sse_output("\n".join(output_lines))
+            yield sse_output(f"\nНайдено: {total}")
             yield sse_status(0)
             
         except DirectAPIError as e:
@@ -573,14 +1086,13 @@ async def get_ads(
         
         yield sse_end()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return sse_response(http_request, generate())
 
 
 @router.post("/ads/create")
 async def create_ad(
     request: CreateAdRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Создать текстовое объявление
@@ -589,8 +1101,8 @@ async def create_ad(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             ad_id = await client.create_text_ad(
                 ad_group_id=request.ad_group_id,
@@ -629,8 +1141,7 @@ ID: {ad_id}
 @router.post("/ads/moderate")
 async def moderate_ads(
     request: ModerateAdsRequest,
-    user_email: str = Depends(get_user_email_from_token),
-    db: AsyncSession = Depends(get_db)
+    user_email: str = Depends(get_user_email_from_token)
 ):
     """
     Отправить объявления на модерацию
@@ -639,8 +1150,8 @@ async def moderate_ads(
         yield sse_start()
         
         try:
-            token = await get_profile_token(user_email, request.alias, db)
-            client = DirectAPIClient(token)
+            token = await get_profile_token(user_email, request.alias)
+            client = client_registry.get(token)
             
             await client.moderate_ads(request.ad_ids)
             
@@ -666,3 +1177,45 @@ IDs: {request.ad_ids}
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
+
+@router.post("/mirror/sync")
+async def sync_mirror(
+    request: SyncMirrorRequest,
+    user_email: str = Depends(get_user_email_from_token)
+):
+    """
+    Синхронизировать локальное зеркало аккаунта (кампании, группы, объявления,
+    фразы, корректировки). Без full - только изменения с прошлой синхронизации.
+    """
+    async def generate():
+        yield sse_start()
+        
+        try:
+            token = await get_profile_token(user_email, request.alias)
+            # Зеркало собираем из свежих данных, мимо кэша
+            client = client_registry.get(token, cache=False)
+            
+            mirror = AccountMirror(user_email, request.alias)
+            counts = await mirror.sync(client, full=request.full)
+            
+            output_lines = ["✅ Зеркало синхронизировано!\n"]
+            for name, count in counts.items():
+                output_lines.append(f"{name}: {count}")
+            
+            yield sse_output("\n".join(output_lines))
+            yield sse_status(0)
+            
+        except MirrorSyncBusy as e:
+            yield sse_error(str(e))
+            yield sse_status(1)
+        except DirectAPIError as e:
+            yield sse_error(f"Ошибка API: {e.message}")
+            yield sse_status(1)
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+            yield sse_error(f"Ошибка: {str(e)}")
+            yield sse_status(1)
+        
+        yield sse_end()
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
@@ -2,6 +2,7 @@
 API для управления профилями Яндекс.Директ
 (Аналог manage_user_cred в ssh-vbai)
 """
+import asyncio
 import logging
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException
@@ -9,9 +10,11 @@ from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app import deadline as request_deadline
+from app.database import get_db, AsyncSessionLocal
 from app.auth import get_user_email_from_token
 from app.encryption import encrypt_data, decrypt_data
+from app.token_cache import token_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/profiles", tags=["profiles"])
@@ -75,6 +78,7 @@ async def add_profile(
             "token": encrypted_token,
             "description": profile.description
         })
+        await token_cache.notify(db, user_email, profile.alias)
         await db.commit()
         
         logger.info(f"Profile '{profile.alias}' saved for user {user_email}")
@@ -142,6 +146,7 @@ async def delete_profile(
             "user_email": user_email,
             "alias": profile.alias
         })
+        await token_cache.notify(db, user_email, profile.alias)
         await db.commit()
         
         if result.rowcount > 0:
@@ -164,11 +169,38 @@ async def delete_profile(
 async def get_profile_token(
     user_email: str,
     alias: str,
-    db: AsyncSession
+    db: Optional[AsyncSession] = None
 ) -> str:
     """
     Получить расшифрованный токен профиля (для внутреннего использования)
+    
+    Без db открывается короткая сессия, которая закрывается до возврата:
+    соединение из пула держится миллисекунды, а не всё время запроса к Директу.
+    Повторные вызовы обслуживает кэш процесса (app/token_cache.py).
+    Поиск в БД ограничен сроком запроса (app/deadline.py).
     """
+    token = token_cache.get(user_email, alias)
+    if token is not None:
+        return token
+    generation = token_cache.generation
+    
+    if db is None:
+        try:
+            async with request_deadline.bound():
+                async with AsyncSessionLocal() as session:
+                    encrypted = await _select_token(session, user_email, alias)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Время запроса истекло")
+    else:
+        encrypted = await _select_token(db, user_email, alias)
+    
+    token_cache.put(user_email, alias, encrypted, generation)
+    # Расшифровываем токен
+    return decrypt_data(encrypted)
+
+
+async def _select_token(db: AsyncSession, user_email: str, alias: str) -> str:
+    """Зашифрованный токен профиля из БД"""
     query = text("""
         SELECT token FROM ydirect_profiles
         WHERE user_email = :user_email AND alias = :alias
@@ -185,7 +217,4 @@ async def get_profile_token(
             status_code=404,
             detail=f"Profile '{alias}' not found"
         )
-    
-    # Расшифровываем токен
-    return decrypt_data(row[0])
-
+    return row[0]
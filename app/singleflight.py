@@ -0,0 +1,91 @@
+"""
+Singleflight: один запрос в полёте на одинаковые read-вызовы
+
+Если aihandler параллельно вызывает несколько инструментов с одинаковым
+campaigns.get / adgroups.get под одним токеном, в Директ уходит один
+запрос, остальные ждут его результат (и не тратят баллы).
+
+Общий вызов не принадлежит ни одному из запросов: он идёт без их срока
+(deadline.detached), а каждый ожидающий ждёт его не дольше своего срока.
+Когда ждать больше некому, вызов отменяется.
+"""
+import json
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app import deadline as request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Методы Direct API без побочных эффектов
+READ_METHODS = frozenset({"get", "check", "checkCampaigns", "checkDictionaries"})
+
+
+def make_key(account_key: str, service: str, method: str, params: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """Ключ запроса: аккаунт + service.method + канонический JSON параметров"""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return account_key, service, method, canonical
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Дедупликация одновременных одинаковых вызовов
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить fn() или присоединиться к уже идущему вызову с тем же ключом.
+        Результат общий для всех ожидающих - его нельзя изменять.
+        asyncio.TimeoutError - срок этого запроса истёк раньше, чем пришёл ответ.
+        """
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            flight = _Flight(request_deadline.detached(fn()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _: self._drop(key, flight))
+
+        flight.waiters += 1
+        try:
+            # asyncio.wait не отменяет вызов при отмене или сроке одного ожидающего
+            done, _ = await asyncio.wait((flight.task,), timeout=request_deadline.clamp(None))
+            if not done:
+                raise asyncio.TimeoutError()
+            return flight.task.result()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Результат больше никому не нужен
+                self._drop(key, flight)
+                flight.task.cancel()
+
+    def _drop(self, key: Tuple, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+        }
+
+
+# Один экземпляр на процесс
+singleflight = SingleFlight()
@@ -0,0 +1,376 @@
+"""
+Колоночный фрейм статистики отчётов
+
+Строки отчёта хранятся не списком dict, а колонками:
+- метрики - компактные array ('q' для складываемых целых: показы, клики,
+  деньги в микроединицах; 'd' для дробных складываемых - конверсий при
+  атрибуции - и для производных, где NaN = нет данных);
+- измерения (запрос, дата, устройство, ...) - словарное кодирование:
+  array кодов + список уникальных значений.
+
+Группировка, top-N, сравнение периодов и производные метрики (CTR, CPC,
+CPA, ROAS, конверсия) считаются проходами по колонкам без промежуточных
+dict на строку - это важно для отчётов по поисковым запросам на миллионы
+строк. Замер: poc/bench_stats_frame.py
+"""
+import math
+import heapq
+from array import array
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.report_parser import base_field, FLOAT_FIELDS, TsvReader
+from app.report_aggregate import ADDITIVE_FIELDS, DERIVED_FIELDS, DIMENSION_FIELDS, MONEY_DERIVED
+
+# Производные, которых нет в Reports API, но которые нужны в анализе
+FRAME_DERIVED: Dict[str, Tuple[str, str, float]] = {
+    **DERIVED_FIELDS,
+    "Roas": ("Revenue", "Cost", 1.0),
+}
+
+# Набор производных по умолчанию: CTR, CPC, CPA, ROAS, конверсия
+DEFAULT_DERIVED = ("Ctr", "AvgCpc", "CostPerConversion", "Roas", "ConversionRate")
+
+NAN = float("nan")
+
+
+def _kind(column: str) -> str:
+    """
+    additive / derived / dimension.
+    ValueError - метрика, которую нельзя свернуть (средние позиции и т.п.)
+    """
+    field = base_field(column)
+    if field in ADDITIVE_FIELDS:
+        return "additive"
+    if field in FRAME_DERIVED:
+        return "derived"
+    if field in DIMENSION_FIELDS:
+        return "dimension"
+    raise ValueError(f"Non-additive metric can't be held in StatsFrame: {column}")
+
+
+def _suffix(column: str) -> str:
+    return column[len(base_field(column)):]
+
+
+class _Dimension:
+    """Колонка измерения со словарным кодированием"""
+    __slots__ = ("codes", "values", "index")
+
+    def __init__(self):
+        self.codes = array("l")
+        self.values: List[Any] = []
+        self.index: Dict[Any, int] = {}
+
+    def append(self, value: Any):
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i: int) -> Any:
+        return self.values[self.codes[i]]
+
+
+class StatsFrame:
+    """
+    Колоночная статистика
+
+        frame = await StatsFrame.from_reader(reader)
+        by_query = frame.group_by(["Query"]).with_derived()
+        for row in by_query.top(20, "Cost").to_dicts():
+            ...
+    """
+
+    def __init__(self, header: Sequence[str]):
+        self.header: List[str] = list(header)
+        self._columns: Dict[str, Any] = {}
+        for column in self.header:
+            kind = _kind(column)
+            if kind == "additive":
+                # Конверсии при атрибуции дробные
+                self._columns[column] = array("d" if base_field(column) in FLOAT_FIELDS else "q")
+            elif kind == "derived":
+                self._columns[column] = array("d")
+            else:
+                self._columns[column] = _Dimension()
+        self._length = 0
+        self._fill: Optional[List[Any]] = None
+
+    # =========== BUILD ===========
+
+    def _appenders(self) -> List[Any]:
+        """По функции добавления значения на колонку (в порядке header)"""
+        appenders = []
+        for name in self.header:
+            target = self._columns[name]
+            if isinstance(target, _Dimension):
+                appenders.append(target.append)
+            elif _kind(name) == "additive":
+                appenders.append(lambda value, append=target.append: append(value or 0))
+            else:
+                appenders.append(lambda value, append=target.append: append(NAN if value is None else value))
+        return appenders
+
+    def append(self, row: Sequence[Any]):
+        """Добавить типизированную строку в порядке header"""
+        if self._fill is None:
+            self._fill = self._appenders()
+        for append, value in zip(self._fill, row):
+            append(value)
+        self._length += 1
+
+    @classmethod
+    def from_rows(cls, header: Sequence[str], rows: Iterable[Sequence[Any]]) -> "StatsFrame":
+        """
+        Собрать фрейм из типизированных строк (TsvReader: int/float или None).
+        Строки раскладываются по колонкам по одной, без транспонирования
+        всего отчёта в кортежи колонок.
+        """
+        frame = cls(header)
+        appenders = frame._appenders()
+        length = 0
+        for row in rows:
+            for append, value in zip(appenders, row):
+                append(value)
+            length += 1
+        frame._length = length
+        return frame
+
+    @classmethod
+    async def from_reader(cls, reader: TsvReader, limit: Optional[int] = None) -> "StatsFrame":
+        """Потоково собрать фрейм из TsvReader (строки не накапливаются)"""
+        frame = cls(await reader.read_header())
+        async for row in reader:
+            frame.append(row)
+            if limit is not None and len(frame) >= limit:
+                break
+        return frame
+
+    # =========== ACCESS ===========
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def dimensions(self) -> List[str]:
+        return [c for c in self.header if isinstance(self._columns[c], _Dimension)]
+
+    @property
+    def metrics(self) -> List[str]:
+        return [c for c in self.header if not isinstance(self._columns[c], _Dimension)]
+
+    def column(self, name: str) -> List[Any]:
+        """Значения колонки (измерения раскодированы, NaN -> None)"""
+        target = self._columns[name]
+        if isinstance(target, _Dimension):
+            values = target.values
+            return [values[code] for code in target.codes]
+        return [self._out(name, value) for value in target]
+
+    @staticmethod
+    def _out(column: str, value: Any) -> Any:
+        if isinstance(value, float):
+            if math.isnan(value):
+                return None
+            if base_field(column) in MONEY_DERIVED:
+                return int(round(value))
+            return round(value, 2)
+        return value
+
+    def to_rows(self, limit: Optional[int] = None) -> List[List[Any]]:
+        n = self._length if limit is None else min(limit, self._length)
+        columns = [self._columns[c] for c in self.header]
+        result = []
+        for i in range(n):
+            result.append([
+                self._out(name, column[i])
+                for name, column in zip(self.header, columns)
+            ])
+        return result
+
+    def to_dicts(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [dict(zip(self.header, row)) for row in self.to_rows(limit)]
+
+    # =========== TRANSFORM ===========
+
+    def take(self, indices: Sequence[int]) -> "StatsFrame":
+        """Новый фрейм из строк indices (в этом порядке)"""
+        frame = StatsFrame(self.header)
+        for column in self.header:
+            source = self._columns[column]
+            target = frame._columns[column]
+            if isinstance(source, _Dimension):
+                # Словарь переиспользуем - коды остаются валидными
+                target.values = source.values
+                target.index = source.index
+                codes = source.codes
+                target.codes = array("l", (codes[i] for i in indices))
+            else:
+                target.extend(source[i] for i in indices)
+        frame._length = len(indices)
+        return frame
+
+    def _sort_key(self, by: str):
+        target = self._columns[by]
+        if isinstance(target, _Dimension):
+            values, codes = target.values, target.codes
+            return lambda i: values[codes[i]]
+        if target.typecode == "d":
+            # NaN (нет данных) - ниже любого значения
+            return lambda i: -math.inf if math.isnan(target[i]) else target[i]
+        return target.__getitem__
+
+    def sort(self, by: str, descending: bool = False) -> "StatsFrame":
+        indices = sorted(range(self._length), key=self._sort_key(by), reverse=descending)
+        return self.take(indices)
+
+    def top(self, n: int, by: str, descending: bool = True) -> "StatsFrame":
+        """Первые n строк по колонке by (без полной сортировки)"""
+        select = heapq.nlargest if descending else heapq.nsmallest
+        return self.take(select(n, range(self._length), key=self._sort_key(by)))
+
+    def group_by(self, dimensions: Sequence[str]) -> "StatsFrame":
+        """
+        Свернуть по измерениям: складываемые метрики суммируются,
+        производные пересчитываются из сумм (с учётом суффикса цели).
+        """
+        dimensions = list(dimensions)
+        additive = [c for c in self.header if _kind(c) == "additive"]
+        derived = [c for c in self.header if _kind(c) == "derived"]
+        out_header = dimensions + additive + derived
+
+        # Номер группы для каждой строки - один проход по колонкам измерений
+        key_columns = [self._columns[d].codes for d in dimensions]
+        groups: Dict[Tuple, int] = {}
+        first_row: List[int] = []
+        if key_columns:
+            keys = zip(*key_columns)
+        else:
+            keys = (() for _ in range(self._length))
+        group_ids = array("l")
+        for i, key in enumerate(keys):
+            g = groups.get(key)
+            if g is None:
+                g = len(first_row)
+                groups[key] = g
+                first_row.append(i)
+            group_ids.append(g)
+
+        # Суммы - по одному проходу на колонку метрики
+        sums: List[List[int]] = []
+        for column in additive:
+            column_sums = [0] * len(first_row)
+            for g, value in zip(group_ids, self._columns[column]):
+                column_sums[g] += value
+            sums.append(column_sums)
+
+        frame = StatsFrame(out_header)
+        for d in dimensions:
+            source = self._columns[d]
+            target = frame._columns[d]
+            target.values = source.values
+            target.index = source.index
+            codes = source.codes
+            target.codes = array("l", (codes[i] for i in first_row))
+        for column, column_sums in zip(additive, sums):
+            frame._columns[column] = array(self._columns[column].typecode, column_sums)
+        frame._length = len(first_row)
+        for column in derived:
+            frame._columns[column] = frame._derive(column)
+        return frame
+
+    def _source(self, name: str, suffix: str) -> Optional[array]:
+        """Складываемая колонка: сначала с суффиксом цели, потом общая"""
+        for candidate in (name + suffix, name):
+            target = self._columns.get(candidate)
+            if isinstance(target, array) and _kind(candidate) == "additive":
+                return target
+        return None
+
+    def _derive(self, column: str) -> array:
+        """Производная колонка из складываемых (NaN, если знаменатель 0)"""
+        numerator, denominator, multiplier = FRAME_DERIVED[base_field(column)]
+        suffix = _suffix(column)
+        num, den = self._source(numerator, suffix), self._source(denominator, suffix)
+        if num is None or den is None:
+            return array("d", [NAN]) * self._length
+        return array("d", (
+            n / d * multiplier if d else NAN
+            for n, d in zip(num, den)
+        ))
+
+    def with_derived(self, names: Sequence[str] = DEFAULT_DERIVED) -> "StatsFrame":
+        """
+        Добавить/пересчитать производные метрики, для которых есть база.
+        Для колонок целей - с тем же суффиксом: Revenue_<goal>_<model>
+        даёт Roas_<goal>_<model>, Conversions_<goal>_<model> - CPA и CR цели.
+        """
+        frame = self._copy()
+        for name in names:
+            numerator, denominator, _ = FRAME_DERIVED[name]
+            suffixes = [""] + [
+                _suffix(c) for c in self.header
+                if _suffix(c) and base_field(c) in (numerator, denominator)
+            ]
+            for suffix in dict.fromkeys(suffixes):
+                if self._source(numerator, suffix) is None or self._source(denominator, suffix) is None:
+                    continue
+                column = name + suffix
+                if column not in frame._columns:
+                    frame.header.append(column)
+                frame._columns[column] = frame._derive(column)
+        return frame
+
+    def _copy(self) -> "StatsFrame":
+        frame = StatsFrame.__new__(StatsFrame)
+        frame.header = list(self.header)
+        frame._columns = dict(self._columns)
+        frame._length = self._length
+        frame._fill = None
+        return frame
+
+    def compare(self, previous: "StatsFrame", on: Sequence[str] = ()) -> "StatsFrame":
+        """
+        Сравнение периодов: обе стороны сворачиваются по on, затем для каждой
+        метрики - колонки <m>, <m>_prev, <m>_delta (производные пересчитаны
+        в каждом периоде отдельно). Ключи, которых нет в одном из периодов,
+        считаются нулями. Результат - для вывода, повторно не сворачивается.
+        """
+        on = list(on)
+        current = self.group_by(on).with_derived(self._derived_names())
+        before = previous.group_by(on).with_derived(self._derived_names())
+        metrics = [c for c in current.header if c not in on]
+
+        def keyed(frame: "StatsFrame") -> Dict[Tuple, int]:
+            dims = [frame._columns[d] for d in on]
+            return {tuple(d[i] for d in dims): i for i in range(len(frame))}
+
+        cur_index = keyed(current)
+        prev_index = keyed(before)
+        keys = list(cur_index) + [k for k in prev_index if k not in cur_index]
+
+        header = list(on)
+        for m in metrics:
+            header += [m, f"{m}_prev", f"{m}_delta"]
+        result = StatsFrame(header)
+        for key in keys:
+            row: List[Any] = list(key)
+            ci, pi = cur_index.get(key), prev_index.get(key)
+            for m in metrics:
+                cur = current._columns[m][ci] if ci is not None else None
+                prev = before._columns[m][pi] if pi is not None and m in before._columns else None
+                if _kind(m) == "additive":
+                    cur, prev = cur or 0, prev or 0
+                else:
+                    cur = NAN if cur is None else cur
+                    prev = NAN if prev is None else prev
+                row += [cur, prev, cur - prev]
+            result.append(row)
+        return result
+
+    def _derived_names(self) -> List[str]:
+        """Производные фрейма (без суффиксов) + набор по умолчанию"""
+        names = [base_field(c) for c in self.header if _kind(c) == "derived"]
+        return list(dict.fromkeys(names + list(DEFAULT_DERIVED)))
@@ -0,0 +1,188 @@
+"""
+Кэш токенов профилей в памяти процесса
+
+get_profile_token на каждый вызов AI-инструмента делал SELECT в БД.
+Теперь токен живёт в кэше процесса:
+- ключ (user_email, alias), TTL и ограничение размера (LRU);
+- в памяти токен хранится так же, как в БД - зашифрованным Fernet
+  (app/encryption.py), и расшифровывается при каждом get (микросекунды
+  против запроса к БД);
+- /profiles/add и /profiles/delete сбрасывают запись сразу в своём процессе
+  и пишут событие в ydirect_profile_events в той же транзакции; остальные
+  воркеры опрашивают таблицу событий раз в DIRECT_TOKEN_CACHE_POLL секунд.
+  Пока опрос не работает (нет БД), кэш не отдаёт токены.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.encryption import decrypt_data
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_TTL = float(os.getenv("DIRECT_TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("DIRECT_TOKEN_CACHE_MAX_ENTRIES", "1000"))
+# Интервал опроса событий профилей других воркеров (сек), 0 - кэш выключен
+TOKEN_CACHE_POLL = float(os.getenv("DIRECT_TOKEN_CACHE_POLL", "2"))
+# Сколько хранить события в таблице (сек)
+TOKEN_EVENTS_KEEP = 86400
+
+Key = Tuple[str, str]
+
+
+class TokenCache:
+    """
+    LRU+TTL кэш токенов с межпроцессной инвалидацией
+    """
+
+    def __init__(
+        self,
+        ttl: float = TOKEN_CACHE_TTL,
+        max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        poll_interval: float = TOKEN_CACHE_POLL
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[Key, Tuple[float, str]]" = OrderedDict()
+        # Растёт при каждой инвалидации: загрузка, начатая до неё, не попадёт в кэш
+        self.generation = 0
+        self._last_event_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        # Без работающего опроса событий другие воркеры могут держать старый токен
+        return self.poll_interval > 0 and self.ttl > 0 and self._last_event_id is not None
+
+    # =========== ENTRIES ===========
+
+    def get(self, user_email: str, alias: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = (user_email, alias)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return decrypt_data(entry[1])
+
+    def put(self, user_email: str, alias: str, encrypted_token: str, generation: int):
+        """
+        Сохранить токен (зашифрованным, как в ydirect_profiles),
+        если с начала загрузки не было инвалидаций
+        """
+        if not self.enabled or generation != self.generation:
+            return
+        self._entries[(user_email, alias)] = (time.monotonic() + self.ttl, encrypted_token)
+        self._entries.move_to_end((user_email, alias))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_email: str, alias: str):
+        self.generation += 1
+        self._entries.pop((user_email, alias), None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    # =========== CROSS-WORKER ===========
+
+    async def notify(self, session: AsyncSession, user_email: str, alias: str):
+        """
+        Сбросить запись локально и записать событие для других воркеров.
+        Вызывать в транзакции изменения профиля (до commit).
+        """
+        self.invalidate(user_email, alias)
+        await session.execute(text("""
+            INSERT INTO ydirect_profile_events (user_email, alias)
+            VALUES (:user_email, :alias)
+        """), {"user_email": user_email, "alias": alias})
+
+    def start(self):
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Token cache started (ttl={self.ttl}s, poll={self.poll_interval}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        polls = 0
+        while True:
+            try:
+                await self.poll()
+                if polls % 1000 == 0:
+                    await self._cleanup()
+                polls += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Не знаем, что поменялось в других воркерах - кэш не используем
+                if self._last_event_id is not None:
+                    logger.warning(f"Token cache disabled, profile events poll failed: {e}")
+                self._last_event_id = None
+                self.clear()
+            await asyncio.sleep(self.poll_interval)
+
+    async def poll(self):
+        """Применить новые события профилей"""
+        async with AsyncSessionLocal() as session:
+            if self._last_event_id is None:
+                result = await session.execute(text(
+                    "SELECT COALESCE(MAX(id), 0) FROM ydirect_profile_events"
+                ))
+                # Пропущенные события неизвестны - начинаем с пустого кэша
+                self.clear()
+                self._last_event_id = int(result.scalar() or 0)
+                return
+
+            result = await session.execute(text("""
+                SELECT id, user_email, alias FROM ydirect_profile_events
+                WHERE id > :last_id ORDER BY id
+            """), {"last_id": self._last_event_id})
+            rows = result.fetchall()
+
+        for event_id, user_email, alias in rows:
+            self.invalidate(user_email, alias)
+            self._last_event_id = event_id
+
+    async def _cleanup(self):
+        async with AsyncSessionLocal() as session:
+            await session.execute(text("""
+                DELETE FROM ydirect_profile_events
+                WHERE created_at < NOW() - INTERVAL :keep SECOND
+            """), {"keep": TOKEN_EVENTS_KEEP})
+            await session.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enabled": int(self.enabled),
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Один экземпляр на процесс
+token_cache = TokenCache()
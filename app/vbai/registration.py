@@ -24,15 +24,21 @@ ENDPOINTS = [
     {"path": "/ai/campaigns/budget", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/campaigns/rsya", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/stats", "method": "POST", "accessType": "Internal"},
+    {"path": "/ai/stats/campaigns", "method": "POST", "accessType": "Internal"},
+    {"path": "/ai/stats/sections", "method": "POST", "accessType": "Internal"},
+    {"path": "/ai/stats/queries", "method": "POST", "accessType": "Internal"},
+    {"path": "/ai/stats/job", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/adgroups", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/adgroups/create", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/keywords/add", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/ads", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/ads/create", "method": "POST", "accessType": "Internal"},
     {"path": "/ai/ads/moderate", "method": "POST", "accessType": "Internal"},
+    {"path": "/ai/mirror/sync", "method": "POST", "accessType": "Internal"},
     
     # Health checks
     {"path": "/health", "method": "GET", "accessType": "Public"},
+    {"path": "/metrics", "method": "GET", "accessType": "Internal"},
     {"path": "/live", "method": "GET", "accessType": "Public"},
     {"path": "/ready", "method": "GET", "accessType": "Public"},
 ]
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+⏱ Память и скорость моделей app/domain.py против dict из API
+
+Использование:
+    python bench_domain.py --ads 10000 --keywords 50000
+
+Что меряет на синтетическом аккаунте (ответы как в bench_json.py):
+    1. Память (tracemalloc) списка dict из json.loads против списка моделей -
+       столько get-страница занимает в кэше памяти процесса (app/cache.py)
+    2. Время from_api() и to_api() на объект
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.domain import TextAd, Keyword  # noqa: E402
+from bench_json import make_ads, make_keywords  # noqa: E402
+
+
+def measure(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    objects = build()
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objects, size, elapsed
+
+
+def bench(name: str, key: str, body: bytes, model):
+    raw, raw_size, _ = measure(lambda: json.loads(body)["result"][key])
+    # Память моделей - после того как dict ответа освобождены (строки остаются в моделях)
+    models, model_size, _ = measure(lambda: model.decode(json.loads(body)["result"][key]))
+
+    started = time.perf_counter()
+    model.decode(raw)
+    decode_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    payloads = [obj.to_api() for obj in models]
+    encode_time = time.perf_counter() - started
+    # to_api отдаёт только поля add - повторная сборка должна их сохранить
+    assert [obj.to_api() for obj in model.decode(payloads)] == payloads
+    # Кэш сжимает страницу, только если модели сохраняют все поля
+    assert model.decode_exact(raw) is not None
+
+    count = len(models)
+    print(f"\n{name}: {count} объектов")
+    print(f"  dict:    {raw_size / 1024 / 1024:7.1f} МБ  ({raw_size // count} байт на объект)")
+    print(f"  {model.__name__:<8} {model_size / 1024 / 1024:7.1f} МБ  ({model_size // count} байт на объект), "
+          f"в {raw_size / model_size:.1f} раза меньше")
+    print(f"  from_api: {decode_time / count * 1e6:.2f} мкс, to_api: {encode_time / count * 1e6:.2f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер моделей app/domain.py")
+    parser.add_argument("--ads", type=int, default=10000)
+    parser.add_argument("--keywords", type=int, default=50000)
+    args = parser.parse_args()
+
+    bench("ads.get", "Ads", make_ads(args.ads), TextAd)
+    bench("keywords.get", "Keywords", make_keywords(args.keywords), Keyword)
+
+
+if __name__ == "__main__":
+    main()
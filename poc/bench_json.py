@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+⏱ Замер JSON-кодека клиента Direct API (app/json_codec.py)
+
+Использование:
+    python bench_json.py --ads 10000 --keywords 50000 --repeat 5
+
+Что меряет на синтетических ответах ads.get / keywords.get:
+    1. loads / dumps: stdlib json против codec (orjson / msgspec)
+    2. Пиковую память (tracemalloc): разбор тела целиком против
+       ArrayItemStream кусками по 64 КБ (как aiter_bytes у httpx)
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.json_codec import codec, StdlibCodec, ArrayItemStream  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def make_ads(count: int) -> bytes:
+    ads = [
+        {
+            "Id": 10_000_000 + i,
+            "CampaignId": 70_000_000 + i // 1000,
+            "AdGroupId": 5_000_000_000 + i // 10,
+            "Status": "ACCEPTED",
+            "State": "ON",
+            "Type": "TEXT_AD",
+            "TextAd": {
+                "Title": f"Купить товар {i} недорого",
+                "Title2": "Доставка по всей России",
+                "Text": "Большой выбор, гарантия качества, скидки до 30% на первый заказ",
+                "Href": f"https://example.ru/catalog/{i}?utm_source=yandex",
+                "Mobile": "NO",
+                "AdImageHash": None,
+            },
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"result": {"Ads": ads, "LimitedBy": count}}, ensure_ascii=False).encode("utf-8")
+
+
+def make_keywords(count: int) -> bytes:
+    keywords = [
+        {
+            "Id": 30_000_000_000 + i,
+            "CampaignId": 70_000_000 + i // 5000,
+            "AdGroupId": 5_000_000_000 + i // 50,
+            "Keyword": f"купить товар {i} -бесплатно -скачать",
+            "Bid": 12_500_000 + i,
+            "ContextBid": 3_000_000,
+            "Status": "ACCEPTED",
+            "State": "ON",
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"result": {"Keywords": keywords}}, ensure_ascii=False).encode("utf-8")
+
+
+def timeit(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def stream_items(body: bytes, key: str) -> int:
+    stream = ArrayItemStream(key)
+    count = 0
+    for offset in range(0, len(body), CHUNK):
+        count += len(stream.feed(body[offset:offset + CHUNK]))
+    count += len(stream.close())
+    return count
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench(name: str, key: str, body: bytes, repeat: int):
+    stdlib = StdlibCodec()
+    tree = stdlib.loads(body)
+
+    print(f"\n{name}: {len(body) / 1024 / 1024:.1f} МБ, {len(tree['result'][key])} элементов")
+    print(f"  {'':<24}{'json':>10}{codec.name:>10}{'x':>8}")
+
+    base = timeit(lambda: stdlib.loads(body), repeat)
+    fast = timeit(lambda: codec.loads(body), repeat)
+    print(f"  {'loads, мс':<24}{base * 1000:>10.1f}{fast * 1000:>10.1f}{base / fast:>8.1f}")
+
+    base = timeit(lambda: stdlib.dumps(tree), repeat)
+    fast = timeit(lambda: codec.dumps(tree), repeat)
+    print(f"  {'dumps, мс':<24}{base * 1000:>10.1f}{fast * 1000:>10.1f}{base / fast:>8.1f}")
+
+    streamed = timeit(lambda: stream_items(body, key), repeat)
+    print(f"  {'stream, мс':<24}{streamed * 1000:>10.1f}")
+
+    # Поток: элементы отбрасываются сразу (как при записи в БД пачками)
+    full = peak_memory(lambda: stdlib.loads(body))
+    chunked = peak_memory(lambda: stream_items(body, key))
+    print(f"  {'пик памяти, МБ':<24}{full / 1024 / 1024:>10.1f}{'':>10}  целиком")
+    print(f"  {'':<24}{chunked / 1024 / 1024:>10.1f}{'':>10}  ArrayItemStream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер JSON-кодека")
+    parser.add_argument("--ads", type=int, default=10000)
+    parser.add_argument("--keywords", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"codec: {codec.name}")
+    bench("ads.get", "Ads", make_ads(args.ads), args.repeat)
+    bench("keywords.get", "Keywords", make_keywords(args.keywords), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
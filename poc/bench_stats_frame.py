@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+⏱ Замер колоночного StatsFrame (app/stats_frame.py) против строк-dict
+
+Использование:
+    python bench_stats_frame.py --rows 1000000 --queries 50000
+
+Что меряет на синтетическом отчёте по поисковым запросам
+(Date, Query, Impressions, Clicks, Cost, Conversions, Ctr):
+    1. Память (tracemalloc): список dict против StatsFrame.from_rows
+    2. Время загрузки строк во фрейм
+    3. Время group_by(["Query"]) с пересчётом Ctr и top(20, "Cost")
+"""
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.stats_frame import StatsFrame  # noqa: E402
+
+HEADER = ["Date", "Query", "Impressions", "Clicks", "Cost", "Conversions", "Ctr"]
+
+
+def make_rows(count: int, queries: int, days: int = 30):
+    """Типизированные строки, как их отдаёт TsvReader"""
+    rng = random.Random(42)
+    dates = [f"2024-01-{d + 1:02d}" for d in range(days)]
+    texts = [f"купить товар {i} недорого" for i in range(queries)]
+    for i in range(count):
+        impressions = rng.randint(1, 500)
+        clicks = rng.randint(0, impressions // 10)
+        yield [
+            dates[i % days],
+            texts[rng.randrange(queries)],
+            impressions,
+            clicks,
+            clicks * rng.randint(5_000_000, 40_000_000),
+            1.0 if clicks and rng.random() < 0.05 else None,
+            round(clicks / impressions * 100, 2),
+        ]
+
+
+def measure(build):
+    """Память (под tracemalloc) и время (отдельным прогоном - tracemalloc замедляет)"""
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    started = time.perf_counter()
+    result = build()
+    return result, size, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер StatsFrame")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=50_000)
+    args = parser.parse_args()
+
+    rows = list(make_rows(args.rows, args.queries))
+    print(f"{len(rows)} строк, {args.queries} запросов")
+
+    dicts, dict_size, dict_time = measure(lambda: [dict(zip(HEADER, row)) for row in rows])
+    del dicts
+    frame, frame_size, load_time = measure(lambda: StatsFrame.from_rows(HEADER, rows))
+    print(f"  dict:       {dict_size / 1024 / 1024:7.1f} МБ, {dict_time:.2f} с")
+    print(f"  StatsFrame: {frame_size / 1024 / 1024:7.1f} МБ, {load_time:.2f} с, "
+          f"в {dict_size / frame_size:.1f} раза меньше")
+
+    started = time.perf_counter()
+    by_query = frame.group_by(["Query"])
+    group_time = time.perf_counter() - started
+    started = time.perf_counter()
+    top = by_query.top(20, "Cost").to_dicts()
+    top_time = time.perf_counter() - started
+    print(f"  group_by:   {group_time:.2f} с -> {len(by_query)} групп")
+    print(f"  top(20):    {top_time * 1000:.1f} мс, первая: {top[0]['Query']!r}")
+
+
+if __name__ == "__main__":
+    main()